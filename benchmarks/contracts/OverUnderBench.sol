@@ -0,0 +1,80 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.19;
+
+// Stand-in for a deployed over/under event, with the functions EventContractInterface and the
+// settlement pipeline call. Balances are fixed at deploy time, no betting happens in benchmarks.
+contract OverUnderBench {
+    string private contractName;
+    string private assetSymbol;
+    uint256 private eventClose;
+    uint256 private payoutClose;
+    uint256 private priceAtClose;
+    uint256 private overBettersBalance;
+    uint256 private underBettersBalance;
+    bool private eventOver;
+    bool private destroyed;
+    address[] private winningBetters;
+
+    event PriceAtCloseSet(uint256 priceAtClose);
+    event WinnersSet(uint256 numWinners);
+    event ContractDestroyed();
+
+    constructor(string memory _contractName, string memory _assetSymbol, uint256 _eventClose, uint256 _payoutClose,
+                bool _eventOver, uint256 _overBettersBalance, uint256 _underBettersBalance) {
+        contractName = _contractName;
+        assetSymbol = _assetSymbol;
+        eventClose = _eventClose;
+        payoutClose = _payoutClose;
+        eventOver = _eventOver;
+        overBettersBalance = _overBettersBalance;
+        underBettersBalance = _underBettersBalance;
+    }
+
+    function getContractName() external view returns (string memory) { return contractName; }
+
+    function getAssetSymbol() external view returns (string memory) { return assetSymbol; }
+
+    function isEventOver() external view returns (bool) { return eventOver; }
+
+    function isPayoutPeriodOver() external view returns (bool) { return block.timestamp >= payoutClose; }
+
+    function getWinningBettersAddresses() external view returns (address[] memory) { return winningBetters; }
+
+    function getContractBalance() external view returns (uint256) {
+        return destroyed ? 0 : overBettersBalance + underBettersBalance;
+    }
+
+    function getOverBettersBalance() external view returns (uint256) { return overBettersBalance; }
+
+    function getUnderBettersBalance() external view returns (uint256) { return underBettersBalance; }
+
+    function getOverBettingPayoutModifier() external view returns (uint256) {
+        return overBettersBalance == 0 ? 0 : (overBettersBalance + underBettersBalance) * 1e18 / overBettersBalance;
+    }
+
+    function getUnderBettingPayoutModifier() external view returns (uint256) {
+        return underBettersBalance == 0 ? 0 : (overBettersBalance + underBettersBalance) * 1e18 / underBettersBalance;
+    }
+
+    function getBettingFee() external pure returns (uint256) { return 0; }
+
+    function setPriceAtClose(uint256 _priceAtClose) external {
+        require(!eventOver, "Event already settled");
+        priceAtClose = _priceAtClose;
+        emit PriceAtCloseSet(_priceAtClose);
+    }
+
+    function setWinners() external {
+        require(!eventOver, "Event already settled");
+        require(priceAtClose > 0, "Price at close not set");
+        winningBetters.push(msg.sender);
+        eventOver = true;
+        emit WinnersSet(winningBetters.length);
+    }
+
+    function destroyContract() external {
+        require(eventOver && block.timestamp >= payoutClose, "Payout period not over");
+        destroyed = true;
+        emit ContractDestroyed();
+    }
+}
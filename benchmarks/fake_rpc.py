@@ -0,0 +1,113 @@
+import itertools
+import json
+import random
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+SEPOLIA_CHAIN_ID = "0xaa36a7"
+
+
+class FakeRPCEndpoint:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, results: Optional[Dict] = None, connect_latency: float = 0.0):
+        """
+        Local JSON-RPC endpoint with injectable latency and failures, for driving providers in benchmarks
+        :param latency: seconds added to every response
+        :param jitter: extra random seconds, uniform in [0, jitter]
+        :param failure_rate: share of requests answered with HTTP 503
+        :param rate_limit_rate: share of requests answered with a -32005 rate limit error
+        :param results: method -> fixed result, on top of the built-in chain id/block number answers
+        :param connect_latency: seconds added to every new connection, like a TLS handshake with a remote node
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.results = results or {}
+        self.connect_latency = connect_latency
+        self.requests = 0
+        self.connections = 0
+
+        self.__block_number = itertools.count(1)
+        self.__lock = threading.Lock()
+        self.__server = ThreadingHTTPServer(("127.0.0.1", 0), self.__build_handler())
+        self.__server.daemon_threads = True
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.__server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeRPCEndpoint":
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def __result(self, method):
+        if method in self.results:
+            return self.results[method]
+        if method == "eth_chainId":
+            return SEPOLIA_CHAIN_ID
+        if method == "net_version":
+            return str(int(SEPOLIA_CHAIN_ID, 16))
+        if method == "eth_blockNumber":
+            return hex(next(self.__block_number))
+        if method == "eth_call":
+            return "0x" + "00" * 32
+        if method == "eth_getTransactionCount":
+            return "0x0"
+        return None
+
+    def __answer(self, request: Dict) -> Dict:
+        if random.random() < self.rate_limit_rate:
+            return {"jsonrpc": "2.0", "id": request.get("id"),
+                    "error": {"code": -32005, "message": "limit exceeded"}}
+        return {"jsonrpc": "2.0", "id": request.get("id"), "result": self.__result(request.get("method"))}
+
+    def open_connection(self):
+        with self.__lock:
+            self.connections += 1
+        time.sleep(self.connect_latency)
+
+    def handle_request(self, body: bytes):
+        with self.__lock:
+            self.requests += 1
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+
+        if random.random() < self.failure_rate:
+            return 503, b"unavailable"
+
+        request = json.loads(body)
+        if isinstance(request, list):
+            return 200, json.dumps([self.__answer(item) for item in request]).encode()
+        return 200, json.dumps(self.__answer(request)).encode()
+
+    def __build_handler(self):
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                endpoint.open_connection()
+
+            def do_POST(self):
+                status, payload = endpoint.handle_request(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
@@ -0,0 +1,262 @@
+"""
+End-to-end load test of EventUpdaterJobs against a local anvil chain and a local Mongo.
+
+For each event count a fresh anvil node gets one over/under stand-in contract per event, Mongo is seeded with
+matching records, and one full sweep (settle, refresh, finalize) runs through the real providers, multicall
+reader, settlement pipeline and bulk writer. Wall time, RPC requests, DB operations and txns per second are
+appended to benchmarks/results/load_test.jsonl under the current commit, so runs on two commits can be
+compared. Needs anvil (foundry) and py-solc-x, plus mongomock unless --mongo-url points at a mongod.
+Run from the repo root:
+
+    python -m benchmarks.load_test --events 10 100 1000 10000
+    python -m benchmarks.load_test --compare <commit>
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import time
+
+from collections import Counter
+from typing import Dict, List, Optional
+
+from benchmarks.local_chain import AnvilChain, compile_contracts, ANVIL_ACCOUNT_ADDRESS, ANVIL_ACCOUNT_PRIVATE_KEY
+from db.indexes import bootstrap_indexes
+from db.mongo_interface import MongoInterface
+from db.price_feed import LatestPriceFeed, DEFAULT_PRICE_COLLECTIONS
+from eth.multicall import MulticallReader
+from eth.provider.async_provider import AsyncProvider
+from eth.provider.provider import Provider
+from eth.receipt_tracker import ReceiptTracker
+from eth.settlement import AsyncSettlementPipeline
+from jobs import EventUpdaterJobs, SETTLE_COMPLETED_PHASE, REFRESH_ONGOING_PHASE, FINALIZE_PAYOUTS_PHASE
+from utils.metrics import RPC_REQUEST_SECONDS
+
+EVENT_COUNTS = [10, 100, 1000, 10000]
+ASSETS = ["BTC", "ETH"]
+ASSET_PRICES = {"BTC": 65000.0, "ETH": 3200.0}
+COLLECTION_NAME = "event_contracts_bench"
+DB_NAME = "over_under_load_test"
+SWEEP_PHASES = [SETTLE_COMPLETED_PHASE, REFRESH_ONGOING_PHASE, FINALIZE_PAYOUTS_PHASE]
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "load_test.jsonl")
+SEED = 1234
+RECEIPT_POLL_INTERVAL = 0.05
+SEND_METHOD = "eth_sendRawTransaction"
+
+
+class CountingMongoInterface:
+    def __init__(self, mongo_handler: MongoInterface):
+        """
+        Counts every MongoInterface call by method name, for mongomock and mongod alike
+        :param mongo_handler:
+        """
+        self.mongo_handler = mongo_handler
+        self.calls = Counter()
+
+    def __getattr__(self, name):
+        attribute = getattr(self.mongo_handler, name)
+        if not callable(attribute):
+            return attribute
+
+        def counted(*args, **kwargs):
+            self.calls[name] += 1
+            return attribute(*args, **kwargs)
+
+        return counted
+
+
+def get_commit() -> str:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+        dirty = subprocess.call(["git", "diff", "--quiet", "HEAD"]) != 0
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+def build_events(num_events: int, now: float) -> List[Dict]:
+    # Same mix as benchmarks.sweep_call_counts: a quarter waiting to be settled, an eighth settled and past
+    # payout_close, the rest ongoing. Balances come from a seeded generator, so every run deploys the same chain
+    generator = random.Random(SEED)
+    events = []
+    for index in range(num_events):
+        event = {
+            "contract_name": f"bench-{index}",
+            "asset_symbol": ASSETS[index % len(ASSETS)],
+            "event_close": int(now - 60 if index % 4 == 0 else now + 3600),
+            "payout_close": int(now + 7200),
+            "is_event_over": False,
+            "over_betters_balance": generator.randint(1, 10 ** 4) * 10 ** 14,
+            "under_betters_balance": generator.randint(1, 10 ** 4) * 10 ** 14,
+        }
+        if index % 8 == 1:
+            event.update({"event_close": int(now - 7200), "payout_close": int(now - 60), "is_event_over": True})
+        events.append(event)
+    return events
+
+
+def seed_database(mongo_handler: MongoInterface, events: List[Dict], contract_addresses: List[str],
+                  contract_abi: List, now: float):
+    mongo_handler.drop(collection=COLLECTION_NAME)
+    records = []
+    for event, contract_address in zip(events, contract_addresses):
+        records.append({
+            "contract_name": event["contract_name"],
+            "contract_address": contract_address,
+            "contract_abi": contract_abi,
+            "price_mark": ASSET_PRICES[event["asset_symbol"]],
+            "asset_symbol": event["asset_symbol"],
+            "betting_close": event["event_close"] - 1800,
+            "event_close": event["event_close"],
+            "payout_close": event["payout_close"],
+            "contract_balance": 0,
+            "over_betters_balance": 0,
+            "under_betters_balance": 0,
+            "over_betting_payout_modifier": 0,
+            "under_betting_payout_modifier": 0,
+            "over_betters_addresses": [],
+            "under_betters_addresses": [],
+            "is_event_over": event["is_event_over"],
+            "is_payout_period_over": False,
+        })
+    if records:
+        mongo_handler.insert_many(collection=COLLECTION_NAME, documents=records)
+
+    for asset, collection_name in DEFAULT_PRICE_COLLECTIONS.items():
+        mongo_handler.drop(collection=collection_name)
+        mongo_handler.insert(collection=collection_name, document={"price": ASSET_PRICES[asset], "timestamp": now})
+
+    bootstrap_indexes(mongo_handler=mongo_handler, event_collections=[COLLECTION_NAME],
+                      price_collections=list(DEFAULT_PRICE_COLLECTIONS.values()))
+
+
+def build_mongo_handler(mongo_url: Optional[str]) -> MongoInterface:
+    if mongo_url:
+        return MongoInterface(db_name=DB_NAME, connection_url=mongo_url)
+
+    import mongomock
+    return MongoInterface(db_name=DB_NAME, client=mongomock.MongoClient())
+
+
+def rpc_counts() -> Counter:
+    counts = Counter()
+    for (method, _), count in RPC_REQUEST_SECONDS.counts().items():
+        counts[method] += count
+    return counts
+
+
+def run_sweep(num_events: int, artifacts: Dict, mongo_url: Optional[str] = None) -> Dict:
+    chain = AnvilChain(artifacts=artifacts).start()
+    try:
+        now = time.time()
+        events = build_events(num_events, now)
+        deploy_started_at = time.perf_counter()
+        contract_addresses = chain.deploy_events(events)
+        deploy_seconds = time.perf_counter() - deploy_started_at
+
+        mongo_handler = CountingMongoInterface(build_mongo_handler(mongo_url))
+        seed_database(mongo_handler.mongo_handler, events, contract_addresses, chain.get_event_abi(), now)
+
+        provider = Provider(provider_url=chain.url, wallet_address=ANVIL_ACCOUNT_ADDRESS,
+                            wallet_private_key=ANVIL_ACCOUNT_PRIVATE_KEY)
+        async_provider = AsyncProvider(provider_url=chain.url, wallet_address=ANVIL_ACCOUNT_ADDRESS,
+                                       wallet_private_key=ANVIL_ACCOUNT_PRIVATE_KEY,
+                                       nonce_manager=provider.nonce_manager)
+        receipt_tracker = ReceiptTracker(endpoint_uri=chain.url, session=provider.session,
+                                         poll_interval=RECEIPT_POLL_INTERVAL)
+        job_config = {"job_type": "betting_event_bench",
+                      "params": {asset: {"collection_name": COLLECTION_NAME} for asset in ASSETS}}
+        updater = EventUpdaterJobs(job_configs=[job_config],
+                                   provider_handler=provider,
+                                   mongo_handler=mongo_handler,
+                                   settlement_pipeline=AsyncSettlementPipeline(provider=async_provider,
+                                                                               receipt_tracker=receipt_tracker),
+                                   multicall_reader=MulticallReader(provider=provider),
+                                   price_feed=LatestPriceFeed(mongo_handler=mongo_handler))
+
+        phases = {}
+        for phase in SWEEP_PHASES:
+            mongo_handler.calls.clear()
+            rpc_before = rpc_counts()
+            started_at = time.perf_counter()
+            updater.run_phase(phase=phase, job_config=job_config)
+            wall_seconds = time.perf_counter() - started_at
+            rpc_calls = rpc_counts() - rpc_before
+            phases[phase] = {"wall_seconds": round(wall_seconds, 4),
+                             "rpc": sum(rpc_calls.values()),
+                             "db": sum(mongo_handler.calls.values()),
+                             "txns": rpc_calls[SEND_METHOD],
+                             "rpc_methods": dict(rpc_calls)}
+        receipt_tracker.stop()
+    finally:
+        chain.stop()
+
+    wall_seconds = sum(phase["wall_seconds"] for phase in phases.values())
+    txns = sum(phase["txns"] for phase in phases.values())
+    return {"events": num_events,
+            "deploy_seconds": round(deploy_seconds, 4),
+            "wall_seconds": round(wall_seconds, 4),
+            "rpc": sum(phase["rpc"] for phase in phases.values()),
+            "db": sum(phase["db"] for phase in phases.values()),
+            "txns": txns,
+            "txns_per_second": round(txns / wall_seconds, 2) if wall_seconds else 0,
+            "phases": phases}
+
+
+def save_results(results: List[Dict], commit: str, backend: str, path: str = RESULTS_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as results_file:
+        for result in results:
+            results_file.write(json.dumps({"commit": commit, "timestamp": time.time(), "backend": backend,
+                                           **result}) + "\n")
+
+
+def load_results(commit: str, path: str = RESULTS_PATH) -> Dict[int, Dict]:
+    # Latest run of each event count on the commit
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path) as results_file:
+        for line in results_file:
+            result = json.loads(line)
+            if result["commit"] == commit:
+                results[result["events"]] = result
+    return results
+
+
+def print_results(results: List[Dict], baseline: Optional[Dict[int, Dict]] = None):
+    print(f"{'events':>8} | {'wall s':>9} {'rpc':>7} {'db':>7} {'txns':>7} {'txn/s':>8} | "
+          f"{'settle s':>9} {'refresh s':>10} {'finalize s':>11}")
+    for result in results:
+        phases = result["phases"]
+        print(f"{result['events']:>8} | {result['wall_seconds']:>9} {result['rpc']:>7} {result['db']:>7} "
+              f"{result['txns']:>7} {result['txns_per_second']:>8} | "
+              f"{phases[SETTLE_COMPLETED_PHASE]['wall_seconds']:>9} "
+              f"{phases[REFRESH_ONGOING_PHASE]['wall_seconds']:>10} "
+              f"{phases[FINALIZE_PAYOUTS_PHASE]['wall_seconds']:>11}")
+        baseline_result = (baseline or {}).get(result["events"])
+        if baseline_result is not None:
+            print(f"{'':>8} | vs {baseline_result['commit']}: "
+                  f"wall x{result['wall_seconds'] / max(baseline_result['wall_seconds'], 1e-9):.2f}, "
+                  f"rpc {result['rpc'] - baseline_result['rpc']:+d}, db {result['db'] - baseline_result['db']:+d}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test EventUpdaterJobs against a local chain and Mongo")
+    parser.add_argument("--events", type=int, nargs="+", default=EVENT_COUNTS)
+    parser.add_argument("--mongo-url", default=None, help="local mongod, mongomock when not given")
+    parser.add_argument("--compare", default=None, help="commit whose saved results the run is compared to")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    # Per-event logs would dominate the timings
+    logging.getLogger().setLevel(logging.WARNING)
+
+    contract_artifacts = compile_contracts()
+    sweep_results = [run_sweep(num_events, contract_artifacts, mongo_url=args.mongo_url)
+                     for num_events in args.events]
+    if not args.no_save:
+        save_results(sweep_results, commit=get_commit(), backend="mongod" if args.mongo_url else "mongomock")
+    print_results(sweep_results, baseline=load_results(args.compare) if args.compare else None)
@@ -0,0 +1,138 @@
+import os
+import shutil
+import socket
+import subprocess
+import time
+
+from typing import Dict, List, Optional
+
+from web3 import Web3
+
+from eth.multicall import MULTICALL3_ADDRESS
+
+CONTRACTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "contracts")
+DEFAULT_SOLC_VERSION = "0.8.19"
+
+# anvil's first dev account under its default mnemonic, funded and unlocked on every start
+ANVIL_ACCOUNT_ADDRESS = "0xf39Fd6e51aad88F6F4ce6aB8827279cffFb92266"
+ANVIL_ACCOUNT_PRIVATE_KEY = "0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80"
+ANVIL_STARTUP_TIMEOUT = 30
+DEPLOY_GAS = 2000000
+# deploy txns in flight before waiting on receipts
+DEPLOY_BATCH_SIZE = 500
+
+
+def compile_contracts(solc_version: str = DEFAULT_SOLC_VERSION) -> Dict[str, Dict]:
+    """
+    Compile the benchmark contracts with py-solc-x, installing solc on first use
+    :param solc_version:
+    :return: {contract name: {'abi', 'bin'}}
+    """
+    import solcx
+
+    if solc_version not in [str(version) for version in solcx.get_installed_solc_versions()]:
+        solcx.install_solc(solc_version)
+
+    source_files = [os.path.join(CONTRACTS_DIR, file_name) for file_name in sorted(os.listdir(CONTRACTS_DIR))
+                    if file_name.endswith(".sol")]
+    compiled = solcx.compile_files(source_files, output_values=["abi", "bin"], solc_version=solc_version)
+
+    return {contract_id.split(":")[-1]: output for contract_id, output in compiled.items()}
+
+
+class AnvilChain:
+    def __init__(self, port: Optional[int] = None, anvil_path: Optional[str] = None,
+                 artifacts: Optional[Dict[str, Dict]] = None):
+        """
+        Local anvil node with the over/under stand-in contracts and Multicall3 at its canonical address
+        :param port: free port when None
+        :param anvil_path: anvil binary, found on PATH when None
+        :param artifacts: compiled contracts from compile_contracts(), compiled on start when None
+        """
+        self.anvil_path = anvil_path or shutil.which("anvil")
+        if self.anvil_path is None:
+            raise Exception("anvil not found, install foundry or pass anvil_path")
+        self.port = port or self.__free_port()
+        self.artifacts = artifacts
+
+        self.w3: Optional[Web3] = None
+        self.__process: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @classmethod
+    def __free_port(cls) -> int:
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            return probe.getsockname()[1]
+
+    def start(self) -> "AnvilChain":
+        if self.artifacts is None:
+            self.artifacts = compile_contracts()
+
+        # automine, a fresh chain from the default mnemonic on every start so addresses repeat across runs
+        self.__process = subprocess.Popen([self.anvil_path, "--port", str(self.port), "--silent",
+                                           "--gas-limit", "300000000"],
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.w3 = Web3(Web3.HTTPProvider(self.url))
+        started_at = time.monotonic()
+        while not self.w3.is_connected():
+            if time.monotonic() - started_at > ANVIL_STARTUP_TIMEOUT:
+                self.stop()
+                raise Exception(f"anvil did not start within {ANVIL_STARTUP_TIMEOUT} s")
+            time.sleep(0.1)
+
+        self.__install_multicall()
+
+        return self
+
+    def stop(self):
+        if self.__process is not None:
+            self.__process.terminate()
+            self.__process.wait()
+            self.__process = None
+
+    def __install_multicall(self):
+        multicall_address = self.__deploy("Multicall3Bench", [()])[0]
+        runtime_code = self.w3.eth.get_code(multicall_address)
+        self.w3.provider.make_request("anvil_setCode", [MULTICALL3_ADDRESS, Web3.to_hex(runtime_code)])
+
+    def __deploy(self, contract_name: str, constructor_args: List[tuple]) -> List[str]:
+        artifact = self.artifacts[contract_name]
+        w3_contract_factory = self.w3.eth.contract(abi=artifact["abi"], bytecode=artifact["bin"])
+        nonce = self.w3.eth.get_transaction_count(ANVIL_ACCOUNT_ADDRESS, "pending")
+
+        contract_addresses = []
+        for batch_start in range(0, len(constructor_args), DEPLOY_BATCH_SIZE):
+            batch_args = constructor_args[batch_start:batch_start + DEPLOY_BATCH_SIZE]
+            txn_hashes = []
+            for args in batch_args:
+                txn_hashes.append(w3_contract_factory.constructor(*args).transact({
+                    "from": ANVIL_ACCOUNT_ADDRESS, "nonce": nonce, "gas": DEPLOY_GAS
+                }))
+                nonce += 1
+            for txn_hash in txn_hashes:
+                receipt = self.w3.eth.wait_for_transaction_receipt(txn_hash)
+                if receipt["status"] != 1:
+                    raise Exception(f"{contract_name} deploy {Web3.to_hex(txn_hash)} reverted")
+                contract_addresses.append(receipt["contractAddress"])
+
+        return contract_addresses
+
+    def deploy_events(self, events: List[Dict]) -> List[str]:
+        """
+        Deploy one OverUnderBench per event
+        :param events: list of {'contract_name', 'asset_symbol', 'event_close', 'payout_close', 'is_event_over',
+        'over_betters_balance', 'under_betters_balance'}, balances in wei
+        :return: contract addresses in event order
+        """
+        return self.__deploy("OverUnderBench", [(event["contract_name"], event["asset_symbol"],
+                                                 int(event["event_close"]), int(event["payout_close"]),
+                                                 event["is_event_over"], event["over_betters_balance"],
+                                                 event["under_betters_balance"])
+                                                for event in events])
+
+    def get_event_abi(self) -> List:
+        return self.artifacts["OverUnderBench"]["abi"]
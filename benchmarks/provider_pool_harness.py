@@ -0,0 +1,64 @@
+"""
+Drives PooledHTTPProvider against local fake endpoints with injected latency and failures.
+
+Scenarios run eth_blockNumber reads through a single slow endpoint and through the pool, then break the
+fastest endpoint mid-run to show circuit breaking and failover. Run from the repo root:
+
+    python -m benchmarks.provider_pool_harness
+"""
+import statistics
+import time
+
+from web3 import Web3, HTTPProvider
+
+from benchmarks.fake_rpc import FakeRPCEndpoint
+from eth.provider.pool import PooledHTTPProvider
+
+NUM_READS = 200
+
+
+def run_reads(w3, num_reads=NUM_READS):
+    latencies = []
+    errors = 0
+    for _ in range(num_reads):
+        started_at = time.monotonic()
+        try:
+            w3.eth.block_number
+        except Exception:
+            errors += 1
+            continue
+        latencies.append(time.monotonic() - started_at)
+
+    latencies.sort()
+    return {
+        "ok": len(latencies),
+        "errors": errors,
+        "p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1) if latencies else None,
+    }
+
+
+def main():
+    fast = FakeRPCEndpoint(latency=0.01, jitter=0.01).start()
+    slow = FakeRPCEndpoint(latency=0.05, jitter=0.4).start()
+    flaky = FakeRPCEndpoint(latency=0.01, failure_rate=0.3, rate_limit_rate=0.1).start()
+
+    try:
+        print(f"single slow endpoint: {run_reads(Web3(HTTPProvider(slow.url)))}")
+
+        pool = PooledHTTPProvider(endpoint_uris=[slow.url, flaky.url, fast.url], hedge_delay=0.05,
+                                  failure_threshold=3, circuit_cooldown=5)
+        w3 = Web3(pool)
+        print(f"pool, all endpoints up: {run_reads(w3)}")
+
+        fast.failure_rate = 1.0
+        print(f"pool, fast endpoint failing: {run_reads(w3)}")
+        for endpoint_stats in pool.stats():
+            print(f"  {endpoint_stats}")
+    finally:
+        for endpoint in [fast, slow, flaky]:
+            endpoint.stop()
+
+
+if __name__ == '__main__':
+    main()
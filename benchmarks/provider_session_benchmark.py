@@ -0,0 +1,79 @@
+"""
+Measures RPC calls/sec and connections opened through a Provider shared by more threads than urllib3's default
+pool of 10 connections, with a plain requests session against the tuned keep-alive session.
+
+Each round fires eth_blockNumber reads from a fresh set of threads, as the pool's executor and the sweep do, at a
+local fake endpoint that charges CONNECT_LATENCY for each new connection, like a TLS handshake with a remote node.
+A pool smaller than the thread count drops the extra connections after each request ("Connection pool is full"),
+the tuned session is sized to cover every thread and keeps them open across rounds. Run from the repo root:
+
+    python -m benchmarks.provider_session_benchmark
+"""
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.fake_rpc import FakeRPCEndpoint
+from eth.provider.provider import Provider
+from eth.provider.session import build_http_session, DEFAULT_POOL_SIZE
+
+NUM_THREADS = 24
+NUM_ROUNDS = 10
+CALLS_PER_THREAD = 20
+REQUEST_LATENCY = 0.02
+CONNECT_LATENCY = 0.05
+
+
+def run_calls(provider: Provider, num_threads=NUM_THREADS, num_rounds=NUM_ROUNDS, calls_per_thread=CALLS_PER_THREAD):
+    w3 = provider.get_w3()
+
+    def worker():
+        for _ in range(calls_per_thread):
+            w3.eth.block_number
+
+    started_at = time.monotonic()
+    for _ in range(num_rounds):
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            for future in [executor.submit(worker) for _ in range(num_threads)]:
+                future.result()
+    elapsed = time.monotonic() - started_at
+
+    return round(num_threads * num_rounds * calls_per_thread / elapsed, 1)
+
+
+def measure_startup(endpoint: FakeRPCEndpoint, eager: bool = False, **provider_kwargs):
+    requests_before = endpoint.requests
+    provider = Provider(provider_url=endpoint.url, wallet_address=None, wallet_private_key=None, **provider_kwargs)
+    if eager:
+        # What the constructor used to do before chain id and connectivity became lazy
+        provider.get_chain_id()
+        provider.get_is_connected()
+    return provider, endpoint.requests - requests_before
+
+
+def run_scenario(endpoint: FakeRPCEndpoint, name: str, eager: bool = False, **provider_kwargs):
+    provider, startup_requests = measure_startup(endpoint, eager=eager, **provider_kwargs)
+    connections_before = endpoint.connections
+    calls_per_second = run_calls(provider)
+    print(f"{name}: {calls_per_second} calls/s, {endpoint.connections - connections_before} connections opened, "
+          f"{startup_requests} requests at construction")
+    return provider
+
+
+def main():
+    endpoint = FakeRPCEndpoint(latency=REQUEST_LATENCY, connect_latency=CONNECT_LATENCY).start()
+
+    try:
+        # Untuned: a plain requests session, urllib3's default pool of 10 connections drops the extra ones
+        run_scenario(endpoint, "default session", eager=True, session=requests.Session())
+
+        provider = run_scenario(endpoint, "tuned session", session=build_http_session(pool_size=DEFAULT_POOL_SIZE))
+        print(f"chain id on first use: {provider.get_chain_id()}, requests so far: {endpoint.requests}")
+    finally:
+        endpoint.stop()
+
+
+if __name__ == '__main__':
+    main()
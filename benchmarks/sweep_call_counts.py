@@ -0,0 +1,171 @@
+"""
+Counts RPC and Mongo calls made by one updater sweep as the number of events grows.
+
+Chain and DB access are replaced by counting stand-ins, so the numbers describe the shape of the
+sweep (calls per phase) rather than network latency. Run from the repo root:
+
+    python -m benchmarks.sweep_call_counts
+"""
+import contextlib
+import io
+import logging
+import time
+
+from collections import Counter
+from types import SimpleNamespace
+
+from eth.multicall import DEFAULT_BATCH_SIZE
+from jobs import EventUpdaterJobs, SETTLE_COMPLETED_PHASE, REFRESH_ONGOING_PHASE, FINALIZE_PAYOUTS_PHASE
+
+EVENT_COUNTS = [10, 100, 1000, 10000]
+ASSETS = ["BTC", "ETH"]
+COLLECTION_NAME = "event_contracts_bench"
+
+VIEW_RETURN_VALUES = {
+    "isEventOver": True,
+    "isPayoutPeriodOver": True,
+    "getWinningBettersAddresses": [],
+    "getContractBalance": 0,
+    "getOverBettersBalance": 0,
+    "getUnderBettersBalance": 0,
+    "getOverBettingPayoutModifier": 0,
+    "getUnderBettingPayoutModifier": 0,
+}
+
+
+class CountingMongo:
+    def __init__(self, records):
+        self.records = records
+        self.calls = Counter()
+
+    @classmethod
+    def __matches(cls, record, query):
+        for key, condition in query.items():
+            value = record.get(key)
+            if isinstance(condition, dict):
+                if "$lt" in condition and not value < condition["$lt"]:
+                    return False
+                if "$gt" in condition and not value > condition["$gt"]:
+                    return False
+                if "$ne" in condition and value == condition["$ne"]:
+                    return False
+            elif value != condition:
+                return False
+        return True
+
+    def find(self, collection, query, **kwargs):
+        self.calls["find"] += 1
+        return [record for record in self.records if self.__matches(record, query)]
+
+    def find_one_sorted(self, collection, query):
+        self.calls["find_one_sorted"] += 1
+        return {"price": 1.0, "timestamp": time.time()}
+
+    def update(self, collection, query, document):
+        self.calls["update"] += 1
+        return SimpleNamespace(acknowledged=True)
+
+    def bulk_update(self, collection, operations, ordered=False):
+        self.calls["bulk_update"] += 1
+        return SimpleNamespace(acknowledged=True, matched_count=len(operations), modified_count=len(operations))
+
+
+class CountingMulticallReader:
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.calls = Counter()
+
+    def aggregate(self, calls):
+        self.calls["eth_call"] += -(-len(calls) // self.batch_size)
+        return [VIEW_RETURN_VALUES[fn_name] for _, fn_name, _ in calls]
+
+
+class CountingSettlementPipeline:
+    def __init__(self):
+        self.calls = Counter()
+
+    def settle_sync(self, events):
+        # setPriceAtClose + setWinners, each a send and a receipt
+        self.calls["eth_sendRawTransaction"] += 2 * len(events)
+        self.calls["receipt"] += 2 * len(events)
+        return [{"contract_address": event["contract_address"], "error": None} for event in events]
+
+    def finalize_sync(self, events):
+        # destroyContract, a send and a receipt
+        self.calls["eth_sendRawTransaction"] += len(events)
+        self.calls["receipt"] += len(events)
+        return [{"contract_address": event["contract_address"], "error": None} for event in events]
+
+
+class StubContractCache:
+    def get_interfaces(self, records, abi_loader=None):
+        return [SimpleNamespace(w3_contract_handle=SimpleNamespace(address=record["contract_address"], abi=[]))
+                for record in records]
+
+    def stats(self):
+        return {}
+
+
+def build_records(num_events):
+    now = time.time()
+    records = []
+    for index in range(num_events):
+        # a quarter of the events are past event_close and waiting to be settled, an eighth are settled
+        # and past payout_close, the rest are ongoing
+        record = {
+            "contract_address": f"0x{index:040x}",
+            "contract_abi": [],
+            "asset_symbol": ASSETS[index % len(ASSETS)],
+            "event_close": now - 60 if index % 4 == 0 else now + 3600,
+            "payout_close": now + 7200,
+            "is_event_over": False,
+        }
+        if index % 8 == 1:
+            record.update({"event_close": now - 7200, "payout_close": now - 60, "is_event_over": True})
+        records.append(record)
+    return records
+
+
+def run_sweep(num_events):
+    mongo_handler = CountingMongo(build_records(num_events))
+    multicall_reader = CountingMulticallReader()
+    settlement_pipeline = CountingSettlementPipeline()
+    job_config = {"job_type": "betting_event_bench",
+                  "params": {asset: {"collection_name": COLLECTION_NAME} for asset in ASSETS}}
+
+    updater = EventUpdaterJobs(job_configs=[job_config],
+                               provider_handler=None,
+                               mongo_handler=mongo_handler,
+                               settlement_pipeline=settlement_pipeline,
+                               multicall_reader=multicall_reader,
+                               contract_cache=StubContractCache())
+
+    counts = {}
+    for phase in [SETTLE_COMPLETED_PHASE, REFRESH_ONGOING_PHASE, FINALIZE_PAYOUTS_PHASE]:
+        mongo_handler.calls.clear()
+        multicall_reader.calls.clear()
+        settlement_pipeline.calls.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            updater.run_phase(phase=phase, job_config=job_config)
+        counts[phase] = {"db": sum(mongo_handler.calls.values()),
+                         "rpc": sum(multicall_reader.calls.values()) + sum(settlement_pipeline.calls.values())}
+
+    return counts
+
+
+if __name__ == '__main__':
+    # Logs go to stdout through their own handler, which redirect_stdout does not reach
+    logging.getLogger().setLevel(logging.WARNING)
+
+    rows = []
+    for num_events in EVENT_COUNTS:
+        rows.append((num_events, run_sweep(num_events)))
+
+    print(f"{'events':>8} | {'settle db':>10} {'settle rpc':>11} | {'refresh db':>11} {'refresh rpc':>12} | "
+          f"{'finalize db':>12} {'finalize rpc':>13}")
+    for num_events, counts in rows:
+        settle = counts[SETTLE_COMPLETED_PHASE]
+        refresh = counts[REFRESH_ONGOING_PHASE]
+        finalize = counts[FINALIZE_PAYOUTS_PHASE]
+        print(f"{num_events:>8} | {settle['db']:>10} {settle['rpc']:>11} | {refresh['db']:>11} {refresh['rpc']:>12} | "
+              f"{finalize['db']:>12} {finalize['rpc']:>13}")
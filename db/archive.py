@@ -0,0 +1,132 @@
+import glob
+import json
+import os
+import time
+
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from eth.contract_cache import get_abi_hash
+from utils.logger import get_logger
+from .mongo_interface import MongoInterface
+
+ARCHIVE_COLLECTION_SUFFIX = "_archive"
+DEFAULT_ABI_COLLECTION = "contract_abis"
+DEFAULT_ARCHIVE_BATCH_SIZE = 500
+DUPLICATE_KEY_ERROR_CODE = 11000
+
+# Settled and past payout, nothing on chain changes for these records any more
+FINISHED_EVENT_QUERY = {"is_event_over": True, "is_payout_period_over": True}
+
+logger = get_logger(__name__)
+
+
+def read_segment_records(segment_dir: str, collection_name: str) -> Iterator[Dict]:
+    for segment_path in sorted(glob.glob(os.path.join(segment_dir, collection_name, "*.jsonl"))):
+        with open(segment_path) as segment_file:
+            for line in segment_file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class EventArchiver:
+    def __init__(self, mongo_handler: MongoInterface,
+                 abi_collection: str = DEFAULT_ABI_COLLECTION,
+                 segment_dir: Optional[str] = None,
+                 batch_size: int = DEFAULT_ARCHIVE_BATCH_SIZE):
+        # Each distinct ABI is stored once
+        if batch_size < 1:
+            raise Exception("Archive batch size must be at least 1")
+
+        self.mongo_handler = mongo_handler
+        self.abi_collection = abi_collection
+        self.segment_dir = segment_dir
+        self.batch_size = batch_size
+
+    @classmethod
+    def get_archive_collection(cls, collection_name) -> str:
+        return f"{collection_name}{ARCHIVE_COLLECTION_SUFFIX}"
+
+    def __store_abis(self, records: List[Dict]) -> Set[str]:
+        abis = {}
+        for record in records:
+            contract_abi = record.pop("contract_abi", None)
+            if contract_abi is not None:
+                record["abi_hash"] = get_abi_hash(contract_abi)
+                abis[record["abi_hash"]] = contract_abi
+        if not abis:
+            return set()
+
+        self.mongo_handler.bulk_update(collection=self.abi_collection, operations=[
+            UpdateOne({"_id": abi_hash}, {"$setOnInsert": {"contract_abi": contract_abi}}, upsert=True)
+            for abi_hash, contract_abi in abis.items()
+        ])
+
+        return set(abis)
+
+    def __write_archive_collection(self, collection_name, records: List[Dict]):
+        try:
+            self.mongo_handler.insert_many(collection=self.get_archive_collection(collection_name),
+                                           documents=records)
+        except BulkWriteError as e:
+            # Records archived by an earlier run that stopped before its delete are already there
+            write_errors = [write_error for write_error in e.details.get("writeErrors", [])
+                            if write_error.get("code") != DUPLICATE_KEY_ERROR_CODE]
+            if write_errors:
+                raise Exception(f"Archiving {collection_name} failed: {write_errors[0].get('errmsg')}")
+
+    def __write_segment(self, collection_name, records: List[Dict]):
+        segment_dir = os.path.join(self.segment_dir, collection_name)
+        os.makedirs(segment_dir, exist_ok=True)
+        segment_path = os.path.join(segment_dir, f"{datetime.now().strftime('%Y%m%d')}.jsonl")
+        with open(segment_path, "a") as segment_file:
+            for record in records:
+                segment_file.write(json.dumps(record, default=str) + "\n")
+            segment_file.flush()
+            os.fsync(segment_file.fileno())
+
+    def archive(self, collection_name, query: Optional[Dict] = None) -> Dict:
+        # Returns {'archived', 'abis'}
+        archived = 0
+        abi_hashes = set()
+        archived_at = int(time.time())
+
+        records = []
+        for record in self.mongo_handler.find(collection=collection_name,
+                                              query={**FINISHED_EVENT_QUERY, **(query or {})},
+                                              batch_size=self.batch_size):
+            records.append(record)
+            if len(records) >= self.batch_size:
+                abi_hashes |= self.__move(collection_name, records, archived_at)
+                archived += len(records)
+                records = []
+        if records:
+            abi_hashes |= self.__move(collection_name, records, archived_at)
+            archived += len(records)
+
+        if archived:
+            logger.info(f"Archived {archived} {collection_name} records, {len(abi_hashes)} distinct ABIs")
+
+        return {"archived": archived, "abis": len(abi_hashes)}
+
+    def __move(self, collection_name, records: List[Dict], archived_at: int) -> Set[str]:
+        record_ids = [record["_id"] for record in records]
+        stored_abis = self.__store_abis(records)
+        for record in records:
+            record["archived_at"] = archived_at
+
+        # Written before the delete, a crash in between leaves a record in both places, never in neither
+        if self.segment_dir is not None:
+            self.__write_segment(collection_name, records)
+        else:
+            self.__write_archive_collection(collection_name, records)
+        self.mongo_handler.delete_many(collection=collection_name, query={"_id": {"$in": record_ids}})
+
+        return stored_abis
+
+    def get_abi(self, abi_hash) -> Optional[List]:
+        abi_record = self.mongo_handler.find_one(collection=self.abi_collection, query={"_id": abi_hash})
+        return None if abi_record is None else abi_record["contract_abi"]
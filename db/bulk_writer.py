@@ -0,0 +1,73 @@
+import time
+
+from typing import Dict, List, Optional
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from utils.logger import get_logger
+from .mongo_interface import MongoInterface
+
+DEFAULT_FLUSH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 5
+
+logger = get_logger(__name__)
+
+
+class BulkUpdateBuffer:
+    def __init__(self, mongo_handler: MongoInterface,
+                 collection: str,
+                 flush_size: int = DEFAULT_FLUSH_SIZE,
+                 flush_interval: Optional[float] = DEFAULT_FLUSH_INTERVAL):
+        self.mongo_handler = mongo_handler
+        self.collection = collection
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+
+        self.__operations: List[UpdateOne] = []
+        self.__queries: List[Dict] = []
+        self.__first_pending_at: Optional[float] = None
+
+    def __len__(self):
+        return len(self.__operations)
+
+    def add(self, query: Dict, document: Dict) -> Optional[Dict]:
+        if not self.__operations:
+            self.__first_pending_at = time.monotonic()
+        self.__operations.append(UpdateOne(query, document))
+        self.__queries.append(query)
+
+        interval_elapsed = self.flush_interval is not None and \
+            time.monotonic() - self.__first_pending_at >= self.flush_interval
+        if len(self.__operations) >= self.flush_size or interval_elapsed:
+            return self.flush()
+
+        return None
+
+    def flush(self) -> Dict:
+        # Failed documents are reported, they do not abort the flush
+        operations = self.__operations
+        queries = self.__queries
+        self.__operations = []
+        self.__queries = []
+        self.__first_pending_at = None
+
+        if not operations:
+            return {"matched": 0, "modified": 0, "errors": []}
+
+        try:
+            result = self.mongo_handler.bulk_update(collection=self.collection, operations=operations)
+            if not result.acknowledged:
+                return {"matched": 0, "modified": 0,
+                        "errors": [{"query": query, "error": "Write not acknowledged"} for query in queries]}
+            flush_result = {"matched": result.matched_count, "modified": result.modified_count, "errors": []}
+        except BulkWriteError as e:
+            flush_result = {
+                "matched": e.details.get("nMatched", 0),
+                "modified": e.details.get("nModified", 0),
+                "errors": [{"query": queries[write_error["index"]], "error": write_error.get("errmsg")}
+                           for write_error in e.details.get("writeErrors", [])]
+            }
+
+        logger.info(f"Flushed {len(operations)} {self.collection} updates, {len(flush_result['errors'])} failed")
+
+        return flush_result
@@ -0,0 +1,149 @@
+import threading
+
+from typing import Callable, Dict, Optional
+
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+
+from utils.logger import get_logger
+from .mongo_interface import MongoInterface
+
+DEFAULT_RESUME_COLLECTION = "change_stream_tokens"
+DEFAULT_POLL_INTERVAL = 5
+DEFAULT_MAX_AWAIT_MS = 1000
+CHANGE_STREAM_MODE = "change_stream"
+POLL_MODE = "poll"
+# $changeStream needs a replica set or sharded cluster (40573 on a standalone mongod) and MongoDB 3.6+ (40324)
+CHANGE_STREAM_UNSUPPORTED_CODES = {40573, 40324}
+# the oplog no longer holds the stored resume token
+CHANGE_STREAM_HISTORY_LOST_CODES = {136, 280, 286}
+
+# inserted fields the updater never needs from the stream, the ABI is loaded on demand
+EXCLUDED_INSERT_FIELDS = ("contract_abi", "over_betters_addresses", "under_betters_addresses")
+
+logger = get_logger(__name__)
+
+
+class ChangeStreamWatcher:
+    def __init__(self, mongo_handler: MongoInterface,
+                 collection_name: str,
+                 on_insert: Callable[[Dict], None],
+                 resume_key: Optional[str] = None,
+                 resume_collection: str = DEFAULT_RESUME_COLLECTION,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 change_stream: bool = True):
+        # Polls on _id instead when the server lacks change streams
+        self.mongo_handler = mongo_handler
+        self.collection_name = collection_name
+        self.on_insert = on_insert
+        self.resume_key = resume_key or collection_name
+        self.resume_collection = resume_collection
+        self.poll_interval = poll_interval
+        self.change_stream = change_stream
+        self.mode: Optional[str] = None
+
+        self.__stopped = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+    def __get_resume_state(self) -> Dict:
+        return self.mongo_handler.find_one(collection=self.resume_collection, query={"_id": self.resume_key}) or {}
+
+    def __save_resume_state(self, fields: Dict):
+        self.mongo_handler.upsert(collection=self.resume_collection,
+                                  query={"_id": self.resume_key},
+                                  document={"$set": fields})
+
+    def __dispatch(self, document: Dict):
+        try:
+            self.on_insert(document)
+        except Exception as e:
+            logger.warning(f"Handling {self.collection_name} insert {document.get('_id')} failed: {e}")
+
+    def __watch(self):
+        resume_token = self.__get_resume_state().get("resume_token")
+        pipeline = [{"$match": {"operationType": "insert"}},
+                    {"$project": {f"fullDocument.{field}": 0 for field in EXCLUDED_INSERT_FIELDS}}]
+        change_stream = self.mongo_handler.watch(collection=self.collection_name,
+                                                 pipeline=pipeline,
+                                                 resume_after=resume_token,
+                                                 max_await_time_ms=DEFAULT_MAX_AWAIT_MS)
+
+        self.mode = CHANGE_STREAM_MODE
+        logger.info(f"Watching {self.collection_name} inserts with a change stream")
+        with change_stream:
+            while not self.__stopped.is_set() and change_stream.alive:
+                change = change_stream.try_next()
+                if change is None:
+                    continue
+                self.__dispatch(change["fullDocument"])
+                # Saved after the callback, a crash replays the insert rather than dropping it
+                resume_token = change_stream.resume_token
+                self.__save_resume_state({"resume_token": resume_token})
+
+    def __poll(self):
+        self.mode = POLL_MODE
+        logger.info(f"Polling {self.collection_name} inserts every {self.poll_interval} s")
+
+        last_id = self.__get_resume_state().get("last_id")
+        if last_id is None:
+            # Start from the newest document, existing ones are loaded by the updater's resync
+            newest = self.mongo_handler.find_one_sorted(collection=self.collection_name, query=[("_id", -1)])
+            last_id = None if newest is None else newest["_id"]
+            self.__save_resume_state({"last_id": last_id})
+
+        # ObjectIds only roughly follow insert order across clients, a late straggler is left to the resync
+        projection = {field: 0 for field in EXCLUDED_INSERT_FIELDS}
+        while not self.__stopped.is_set():
+            query = {} if last_id is None else {"_id": {"$gt": last_id}}
+            polled_id = last_id
+            for document in self.mongo_handler.find(collection=self.collection_name,
+                                                    query=query,
+                                                    projection=projection).sort("_id", ASCENDING):
+                self.__dispatch(document)
+                polled_id = document["_id"]
+            if polled_id != last_id:
+                last_id = polled_id
+                self.__save_resume_state({"last_id": last_id})
+
+            self.__stopped.wait(timeout=self.poll_interval)
+
+    def __run(self):
+        while not self.__stopped.is_set():
+            try:
+                if self.change_stream:
+                    self.__watch()
+                else:
+                    self.__poll()
+            except OperationFailure as e:
+                if self.change_stream and e.code in CHANGE_STREAM_UNSUPPORTED_CODES:
+                    logger.warning(f"Change streams unsupported, falling back to polling {self.collection_name}: {e}")
+                    self.change_stream = False
+                elif self.change_stream and e.code in CHANGE_STREAM_HISTORY_LOST_CODES:
+                    # Inserts in the gap are picked up by the updater's periodic resync
+                    logger.warning(f"Resume token for {self.collection_name} expired, watching from now: {e}")
+                    self.__save_resume_state({"resume_token": None})
+                else:
+                    self.__retry_later(e)
+            except Exception as e:
+                # No error ends the watcher, whatever it misses meanwhile is left to the resync
+                self.__retry_later(e)
+
+    def __retry_later(self, error: Exception):
+        logger.warning(f"Watching {self.collection_name} failed, retrying in {self.poll_interval} s: {error}")
+        self.__stopped.wait(timeout=self.poll_interval)
+
+    def start(self) -> "ChangeStreamWatcher":
+        if self.__thread is None or not self.__thread.is_alive():
+            self.__stopped.clear()
+            self.__thread = threading.Thread(target=self.__run, name=f"watch-{self.collection_name}", daemon=True)
+            self.__thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        # A None timeout returns at once
+        self.__stopped.set()
+        if timeout is not None and self.__thread is not None:
+            self.__thread.join(timeout=timeout)
+
+    def is_alive(self) -> bool:
+        return self.__thread is not None and self.__thread.is_alive()
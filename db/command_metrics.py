@@ -0,0 +1,34 @@
+from pymongo import monitoring
+
+from utils.metrics import MONGO_COMMAND_SECONDS, MONGO_COMMAND_ERRORS
+
+# Driver chatter that is not one of our operations
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue", "endSessions"}
+
+
+# Times every command the client sends, cursor getMores included, with the driver's own measured duration
+class MongoCommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        # request id -> collection name, the succeeded and failed events do not carry the command body
+        self.__collections = {}
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        self.__collections[event.request_id] = collection if isinstance(collection, str) else ""
+
+    def succeeded(self, event):
+        collection = self.__collections.pop(event.request_id, None)
+        if collection is None:
+            return
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name, collection=collection)
+
+    def failed(self, event):
+        collection = self.__collections.pop(event.request_id, None)
+        if collection is None:
+            return
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name, collection=collection)
+        MONGO_COMMAND_ERRORS.inc(command=event.command_name, collection=collection)
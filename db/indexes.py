@@ -0,0 +1,26 @@
+from typing import List
+
+from utils.logger import get_logger
+from .mongo_interface import MongoInterface
+
+# Serves the settle/refresh queries: equality on asset_symbol and is_event_over, range on event_close
+EVENT_QUERY_INDEX = [("asset_symbol", 1), ("is_event_over", 1), ("event_close", 1)]
+# Serves the payout queries, finalized records fall outside the is_payout_period_over bounds
+PAYOUT_QUERY_INDEX = [("asset_symbol", 1), ("is_payout_period_over", 1), ("payout_close", 1)]
+CONTRACT_ADDRESS_INDEX = [("contract_address", 1)]
+LIVE_PRICE_INDEX = [("timestamp", -1)]
+
+logger = get_logger(__name__)
+
+
+def bootstrap_indexes(mongo_handler: MongoInterface, event_collections: List[str], price_collections: List[str]):
+    # create_index is a no-op for existing indexes
+    for collection in set(event_collections):
+        mongo_handler.create_index(collection=collection, keys=EVENT_QUERY_INDEX)
+        mongo_handler.create_index(collection=collection, keys=PAYOUT_QUERY_INDEX)
+        mongo_handler.create_index(collection=collection, keys=CONTRACT_ADDRESS_INDEX)
+        logger.info(f"Indexes ready on {collection}")
+
+    for collection in set(price_collections):
+        mongo_handler.create_index(collection=collection, keys=LIVE_PRICE_INDEX)
+        logger.info(f"Indexes ready on {collection}")
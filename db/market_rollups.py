@@ -0,0 +1,215 @@
+import math
+
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Set
+
+from pymongo import UpdateOne
+
+from .archive import ARCHIVE_COLLECTION_SUFFIX, read_segment_records
+from .mongo_interface import MongoInterface
+
+DEFAULT_ROLLUP_COLLECTION = "market_rollups"
+# seconds per settled-volume bucket, by event_close
+DEFAULT_BUCKET_SECONDS = 3600
+# set on an event record once its state is counted in the rollups
+ROLLED_UP_FIELD = "rolled_up"
+
+# Event record fields the rollups are computed from
+ROLLUP_RECORD_FIELDS = ("is_event_over", "is_payout_period_over", "event_close", "contract_balance",
+                        "over_betters_balance", "under_betters_balance", "over_betting_payout_modifier",
+                        "under_betting_payout_modifier", ROLLED_UP_FIELD)
+ROLLUP_RECORD_PROJECTION = {"_id": 0, "contract_address": 1, **{field: 1 for field in ROLLUP_RECORD_FIELDS}}
+
+OPEN_ROLLUP = "open"
+BUCKET_ROLLUP = "bucket"
+ROLLUP_QUERY_INDEX = [("job_type", 1), ("asset", 1), ("kind", 1), ("bucket_start", 1)]
+# fields naming a rollup document, every other field is a counter
+ROLLUP_KEY_FIELDS = {"_id", "job_type", "asset", "kind", "bucket_start", "bucket_seconds"}
+
+# rebuilt and incremental sums of float balances drift apart by rounding only
+RELATIVE_TOLERANCE = 1e-9
+ABSOLUTE_TOLERANCE = 1e-6
+
+
+class MarketRollups:
+    def __init__(self, mongo_handler: MongoInterface,
+                 collection: str = DEFAULT_ROLLUP_COLLECTION,
+                 bucket_seconds: int = DEFAULT_BUCKET_SECONDS,
+                 segment_dir: Optional[str] = None):
+        # One 'open' document per job type and asset, and one 'bucket' document per bucket_seconds of event_close
+        self.mongo_handler = mongo_handler
+        self.collection = collection
+        self.bucket_seconds = bucket_seconds
+        self.segment_dir = segment_dir
+
+        # contract address -> (job type, asset, record before, record after), applied once the record write lands
+        self.__pending: Dict[str, tuple] = {}
+
+    def ensure_indexes(self):
+        self.mongo_handler.create_index(collection=self.collection, keys=ROLLUP_QUERY_INDEX)
+
+    def __get_rollup_id(self, job_type, asset, kind, bucket_start=None) -> str:
+        if kind == OPEN_ROLLUP:
+            return f"{job_type}:{asset}:{OPEN_ROLLUP}"
+        return f"{job_type}:{asset}:{BUCKET_ROLLUP}:{bucket_start}"
+
+    def contributions(self, job_type: str, asset: str, record: Optional[Dict]) -> Dict[str, Dict]:
+        # {rollup id: {field: amount}}, shared by the incremental and the rebuild paths
+        if record is None:
+            return {}
+
+        contract_balance = record.get("contract_balance") or 0
+        over_betters_balance = record.get("over_betters_balance") or 0
+        under_betters_balance = record.get("under_betters_balance") or 0
+        if not record.get("is_event_over"):
+            return {self.__get_rollup_id(job_type, asset, OPEN_ROLLUP): {
+                "open_events": 1,
+                "open_interest": contract_balance,
+                "over_betters_balance": over_betters_balance,
+                "under_betters_balance": under_betters_balance,
+            }}
+
+        bucket_start = int(record.get("event_close") or 0) // self.bucket_seconds * self.bucket_seconds
+        is_finalized = bool(record.get("is_payout_period_over"))
+        return {self.__get_rollup_id(job_type, asset, BUCKET_ROLLUP, bucket_start): {
+            "settled_events": 1,
+            "settled_volume": contract_balance,
+            "over_volume": over_betters_balance,
+            "under_volume": under_betters_balance,
+            "over_payout_modifier_sum": record.get("over_betting_payout_modifier") or 0,
+            "under_payout_modifier_sum": record.get("under_betting_payout_modifier") or 0,
+            "finalized_events": 1 if is_finalized else 0,
+            "finalized_payouts": contract_balance if is_finalized else 0,
+        }}
+
+    def __get_rollup_fields(self, rollup_id: str) -> Dict:
+        job_type, asset, kind = rollup_id.split(":")[:3]
+        fields = {"job_type": job_type, "asset": asset, "kind": kind}
+        if kind == BUCKET_ROLLUP:
+            fields.update({"bucket_start": int(rollup_id.split(":")[3]), "bucket_seconds": self.bucket_seconds})
+        return fields
+
+    def track(self, job_type: str, asset: str, record: Dict, fields: Dict) -> Dict:
+        # Applied after the record write, returns fields plus the rolled-up marker for an uncounted record
+        # A record never counted contributes its whole new state
+        record_before = record if record.get(ROLLED_UP_FIELD) else None
+        record_after = {**record, **fields, ROLLED_UP_FIELD: True}
+        pending = self.__pending.get(record["contract_address"])
+        if pending is not None:
+            # Several updates of one record before an apply chain from the first state
+            record_before = pending[2]
+            record_after = {**pending[3], **fields}
+        self.__pending[record["contract_address"]] = (job_type, asset, record_before, record_after)
+
+        if record.get(ROLLED_UP_FIELD):
+            return fields
+        return {**fields, ROLLED_UP_FIELD: True}
+
+    def apply(self, failed_addresses: Optional[Set[str]] = None) -> int:
+        # Deltas of contracts whose record write failed are dropped
+        pending = self.__pending
+        self.__pending = {}
+
+        deltas: Dict[str, Dict] = defaultdict(lambda: defaultdict(int))
+        for contract_address, (job_type, asset, record_before, record_after) in pending.items():
+            if failed_addresses and contract_address in failed_addresses:
+                continue
+            for rollup_id, amounts in self.contributions(job_type, asset, record_after).items():
+                for field, amount in amounts.items():
+                    deltas[rollup_id][field] += amount
+            for rollup_id, amounts in self.contributions(job_type, asset, record_before).items():
+                for field, amount in amounts.items():
+                    deltas[rollup_id][field] -= amount
+
+        operations = []
+        for rollup_id, amounts in deltas.items():
+            amounts = {field: amount for field, amount in amounts.items() if amount != 0}
+            if not amounts:
+                continue
+            operations.append(UpdateOne({"_id": rollup_id},
+                                        {"$inc": amounts, "$setOnInsert": self.__get_rollup_fields(rollup_id)},
+                                        upsert=True))
+        if operations:
+            self.mongo_handler.bulk_update(collection=self.collection, operations=operations)
+
+        return len(operations)
+
+    def get_open(self, job_type: str, asset: str) -> Optional[Dict]:
+        return self.mongo_handler.find_one(collection=self.collection,
+                                           query={"_id": self.__get_rollup_id(job_type, asset, OPEN_ROLLUP)})
+
+    def get_buckets(self, job_type: str, asset: str, start: float, end: float) -> List[Dict]:
+        return list(self.mongo_handler.find(collection=self.collection,
+                                            query={"job_type": job_type, "asset": asset, "kind": BUCKET_ROLLUP,
+                                                   "bucket_start": {"$gte": start, "$lt": end}}))
+
+    def compute(self, job_configs: List[Dict]) -> Dict[str, Dict]:
+        # From every event record: hot, Mongo-archived and in archive segments
+        rollups: Dict[str, Dict] = {}
+        for job_config in job_configs:
+            for asset, params in job_config["params"].items():
+                # An archive interrupted before its delete leaves a record in two places, the hot one counts
+                records = {}
+                for record in self.__get_archived_records(params["collection_name"], asset):
+                    records[record["contract_address"]] = record
+                for record in self.mongo_handler.find(collection=params["collection_name"],
+                                                      query={"asset_symbol": asset},
+                                                      projection=ROLLUP_RECORD_PROJECTION):
+                    records[record["contract_address"]] = record
+
+                for record in records.values():
+                    for rollup_id, amounts in self.contributions(job_config["job_type"], asset, record).items():
+                        rollup = rollups.setdefault(rollup_id, {"_id": rollup_id,
+                                                                **self.__get_rollup_fields(rollup_id)})
+                        for field, amount in amounts.items():
+                            rollup[field] = rollup.get(field, 0) + amount
+
+        return rollups
+
+    def __get_archived_records(self, collection_name, asset) -> Iterator[Dict]:
+        yield from self.mongo_handler.find(collection=collection_name + ARCHIVE_COLLECTION_SUFFIX,
+                                           query={"asset_symbol": asset}, projection=ROLLUP_RECORD_PROJECTION)
+        if self.segment_dir is not None:
+            for record in read_segment_records(self.segment_dir, collection_name):
+                if record.get("asset_symbol") == asset:
+                    yield record
+
+    @classmethod
+    def diff(cls, expected: Dict[str, Dict], actual: Dict[str, Dict]) -> List[Dict]:
+        # A document missing on one side counts as all zero, emptied documents are left in place
+        mismatches = []
+        for rollup_id in sorted(set(expected) | set(actual)):
+            expected_rollup = expected.get(rollup_id, {})
+            actual_rollup = actual.get(rollup_id, {})
+            for field in sorted((set(expected_rollup) | set(actual_rollup)) - ROLLUP_KEY_FIELDS):
+                expected_value = expected_rollup.get(field, 0)
+                actual_value = actual_rollup.get(field, 0)
+                if math.isclose(expected_value, actual_value, rel_tol=RELATIVE_TOLERANCE, abs_tol=ABSOLUTE_TOLERANCE):
+                    continue
+                mismatches.append({"_id": rollup_id, "field": field,
+                                   "expected": expected_value, "actual": actual_value})
+
+        return mismatches
+
+    def rebuild(self, job_configs: List[Dict], check_only: bool = False) -> List[Dict]:
+        # Writing needs the updaters stopped, a sweep between the read and the write would be counted twice
+        rebuilt = self.compute(job_configs)
+        job_types = [job_config["job_type"] for job_config in job_configs]
+        stored = {rollup["_id"]: rollup
+                  for rollup in self.mongo_handler.find(collection=self.collection,
+                                                        query={"job_type": {"$in": job_types}})}
+        mismatches = self.diff(expected=rebuilt, actual=stored)
+        if check_only:
+            return mismatches
+
+        self.mongo_handler.delete_many(collection=self.collection, query={"job_type": {"$in": job_types}})
+        if rebuilt:
+            self.mongo_handler.insert_many(collection=self.collection, documents=list(rebuilt.values()))
+        # Every record is counted now, the incremental path must not add any of them again
+        for job_config in job_configs:
+            for asset, params in job_config["params"].items():
+                self.mongo_handler.update_many(collection=params["collection_name"],
+                                               query={"asset_symbol": asset, ROLLED_UP_FIELD: {"$ne": True}},
+                                               document={"$set": {ROLLED_UP_FIELD: True}})
+
+        return mismatches
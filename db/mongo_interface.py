@@ -1,20 +1,44 @@
 from pymongo import MongoClient
 
+from .command_metrics import MongoCommandMetrics
+
 
 class MongoInterface:
-    def __init__(self, db_name, host=None, port=None, connection_url=None):
+    def __init__(self, db_name, host=None, port=None, connection_url=None, record_metrics=True, client=None):
+        # Every command through this client is timed by collection, cursor batches included
+        event_listeners = [MongoCommandMetrics()] if record_metrics else []
+        # A ready client, e.g. mongomock in benchmarks, is used as is
+        if client is not None:
+            self.client = client
         if connection_url:
-            self.client = MongoClient(connection_url)
+            self.client = MongoClient(connection_url, event_listeners=event_listeners)
         if host and port:
-            self.client = MongoClient(host, port)
+            self.client = MongoClient(host, port, event_listeners=event_listeners)
 
         self.db = self.client[db_name]
 
     def insert(self, collection, document):
         return self.db[collection].insert_one(document)
 
-    def find(self, collection, query):
-        return self.db[collection].find(query)
+    def insert_many(self, collection, documents, ordered=False):
+        return self.db[collection].insert_many(documents, ordered=ordered)
+
+    def find(self, collection, query, projection=None, batch_size=None, hint=None):
+        cursor = self.db[collection].find(query, projection=projection)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        if hint:
+            cursor = cursor.hint(hint)
+        return cursor
+
+    def aggregate(self, collection, pipeline):
+        return self.db[collection].aggregate(pipeline)
+
+    def create_index(self, collection, keys, **kwargs):
+        return self.db[collection].create_index(keys, **kwargs)
+
+    def watch(self, collection, pipeline=None, resume_after=None, **kwargs):
+        return self.db[collection].watch(pipeline=pipeline, resume_after=resume_after, **kwargs)
 
     def find_one(self, collection, query):
         return self.db[collection].find_one(query)
@@ -25,6 +49,19 @@ class MongoInterface:
     def update(self, collection, query, document):
         return self.db[collection].update_one(query, document)
 
+    def upsert(self, collection, query, document):
+        return self.db[collection].update_one(query, document, upsert=True)
+
+    def update_many(self, collection, query, document):
+        return self.db[collection].update_many(query, document)
+
+    def find_one_and_update(self, collection, query, document, upsert=False, return_document=False):
+        return self.db[collection].find_one_and_update(query, document, upsert=upsert,
+                                                       return_document=return_document)
+
+    def bulk_update(self, collection, operations, ordered=False):
+        return self.db[collection].bulk_write(operations, ordered=ordered)
+
     def delete(self, collection, query):
         return self.db[collection].delete_one(query)
 
@@ -0,0 +1,79 @@
+import time
+
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from utils.cache import LRUCache
+from .mongo_interface import MongoInterface
+
+DEFAULT_PRICE_COLLECTIONS = {
+    "BTC": "btc_live_price",
+    "ETH": "eth_live_price",
+}
+
+# seconds a cached tick is served before the live price collection is read again
+DEFAULT_PRICE_TTL = 5
+# ticks older than this are never used to settle an event
+DEFAULT_MAX_PRICE_STALENESS = 300
+
+
+class LatestPriceFeed:
+    def __init__(self, mongo_handler: MongoInterface,
+                 price_collections: Optional[Dict[str, str]] = None,
+                 ttl: float = DEFAULT_PRICE_TTL,
+                 max_staleness: Optional[float] = DEFAULT_MAX_PRICE_STALENESS):
+        self.mongo_handler = mongo_handler
+        self.price_collections = dict(price_collections or DEFAULT_PRICE_COLLECTIONS)
+        self.max_staleness = max_staleness
+
+        self.__ticks = LRUCache(max_size=max(1, len(self.price_collections)), ttl=ttl)
+
+    @classmethod
+    def __get_tick_timestamp(cls, tick: Dict) -> float:
+        timestamp = tick.get("timestamp")
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
+        if isinstance(timestamp, datetime):
+            # pymongo hands back BSON dates as naive UTC
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=timezone.utc)
+            return timestamp.timestamp()
+        return float(timestamp)
+
+    def get_tick(self, asset_symbol: str) -> Dict:
+        # {'price', 'timestamp'}, timestamp in unix seconds
+        if asset_symbol not in self.price_collections:
+            raise Exception(f"No live price collection for asset {asset_symbol}")
+
+        tick = self.__ticks.get(asset_symbol)
+        if tick is None:
+            mongo_response = self.mongo_handler.find_one_sorted(collection=self.price_collections[asset_symbol],
+                                                                query=[("timestamp", -1)])
+            if mongo_response is None:
+                raise Exception(f"No live price for asset {asset_symbol}")
+
+            tick = {"price": mongo_response["price"], "timestamp": self.__get_tick_timestamp(mongo_response)}
+            self.__ticks.set(asset_symbol, tick)
+
+        return tick
+
+    def get_price(self, asset_symbol: str):
+        tick = self.get_tick(asset_symbol)
+        if self.max_staleness is not None:
+            age = time.time() - tick["timestamp"]
+            if age > self.max_staleness:
+                # The writer may have caught up since the tick was cached
+                self.__ticks.delete(asset_symbol)
+                raise Exception(f"Live price for asset {asset_symbol} is {int(age)} s old, "
+                                f"over the {self.max_staleness} s staleness bound")
+
+        return tick["price"]
+
+    def invalidate(self, asset_symbol: Optional[str] = None):
+        if asset_symbol is None:
+            self.__ticks.clear()
+        else:
+            self.__ticks.delete(asset_symbol)
+
+    def stats(self) -> Dict:
+        return self.__ticks.stats()
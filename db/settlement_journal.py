@@ -0,0 +1,124 @@
+import time
+
+from typing import Dict, List, Optional, Set
+
+from pymongo import ReturnDocument
+
+from .mongo_interface import MongoInterface
+
+DEFAULT_JOURNAL_COLLECTION = "settlement_journal"
+# settlement failures of one contract before it is left out of settlement until released
+DEFAULT_MAX_ATTEMPTS = 3
+# seconds a finished entry is kept before the TTL index removes it
+DEFAULT_FINISHED_TTL = 7 * 86400
+
+# Settlement steps of one contract, in order
+PRICE_SET_SENT = "price_set_sent"
+PRICE_SET_MINED = "price_set_mined"
+WINNERS_SENT = "winners_sent"
+WINNERS_MINED = "winners_mined"
+RECORD_WRITTEN = "record_written"
+SETTLEMENT_STEPS = (PRICE_SET_SENT, PRICE_SET_MINED, WINNERS_SENT, WINNERS_MINED, RECORD_WRITTEN)
+
+
+class SettlementJournal:
+    def __init__(self, mongo_handler: MongoInterface,
+                 collection: str = DEFAULT_JOURNAL_COLLECTION,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 finished_ttl: Optional[int] = DEFAULT_FINISHED_TTL):
+        # One entry per contract address, steps are journaled as they happen so a restart resumes
+        self.mongo_handler = mongo_handler
+        self.collection = collection
+        self.max_attempts = max_attempts
+        self.finished_ttl = finished_ttl
+
+    def ensure_indexes(self):
+        self.mongo_handler.create_index(collection=self.collection, keys=[("quarantined", 1)])
+        if self.finished_ttl is not None:
+            # Only finished entries carry finished_at, the rest never expire
+            self.mongo_handler.create_index(collection=self.collection, keys=[("finished_at", 1)],
+                                            expireAfterSeconds=self.finished_ttl)
+
+    def get_entries(self, contract_addresses: List[str]) -> Dict[str, Dict]:
+        if not contract_addresses:
+            return {}
+        entries = self.mongo_handler.find(collection=self.collection, query={"_id": {"$in": contract_addresses}})
+        return {entry["_id"]: entry for entry in entries}
+
+    def record_step(self, contract_address: str, step: str, txn_hash: Optional[str] = None,
+                    collection_name: Optional[str] = None):
+        if step not in SETTLEMENT_STEPS:
+            raise Exception(f"Invalid settlement step {step}")
+
+        fields = {f"steps.{step}": time.time()}
+        document = {"$set": fields}
+        if step in (PRICE_SET_MINED, WINNERS_MINED):
+            # A mined step is progress, earlier failures no longer count toward quarantine
+            document["$unset"] = {"attempts": ""}
+        if txn_hash is not None:
+            fields[f"txn_hashes.{step}"] = txn_hash
+            document["$addToSet"] = {f"sent_txn_hashes.{step}": txn_hash}
+        if collection_name is not None:
+            fields["collection_name"] = collection_name
+        self.mongo_handler.upsert(collection=self.collection, query={"_id": contract_address}, document=document)
+
+    def record_replacement(self, contract_address: str, step: str, txn_hash: str):
+        # Every version is kept, any of them may be the one mined
+        self.mongo_handler.update(collection=self.collection, query={"_id": contract_address},
+                                  document={"$set": {f"txn_hashes.{step}": txn_hash},
+                                            "$addToSet": {f"sent_txn_hashes.{step}": txn_hash}})
+
+    @classmethod
+    def get_sent_txn_hashes(cls, entry: Dict, step: str) -> List[str]:
+        # Oldest first, older entries only have txn_hashes
+        sent_txn_hashes = entry.get("sent_txn_hashes", {}).get(step)
+        if sent_txn_hashes:
+            return sent_txn_hashes
+        return [entry["txn_hashes"][step]]
+
+    def unset_step(self, contract_address: str, step: str):
+        # A sent txn that was dropped or reverted is sent again on the next attempt
+        self.mongo_handler.update(collection=self.collection, query={"_id": contract_address},
+                                  document={"$unset": {f"steps.{step}": "", f"txn_hashes.{step}": "",
+                                                       f"sent_txn_hashes.{step}": ""}})
+
+    def record_failure(self, contract_address: str, error: str, collection_name: Optional[str] = None) -> bool:
+        # True once the contract is quarantined
+        fields = {"last_error": error, "updated_at": time.time()}
+        if collection_name is not None:
+            fields["collection_name"] = collection_name
+        entry = self.mongo_handler.find_one_and_update(collection=self.collection,
+                                                       query={"_id": contract_address},
+                                                       document={"$set": fields, "$inc": {"attempts": 1}},
+                                                       upsert=True,
+                                                       return_document=ReturnDocument.AFTER)
+        if entry["attempts"] < self.max_attempts or entry.get("quarantined"):
+            return bool(entry.get("quarantined"))
+
+        self.mongo_handler.update(collection=self.collection, query={"_id": contract_address},
+                                  document={"$set": {"quarantined": True}})
+        return True
+
+    def get_quarantined(self, contract_addresses: Optional[List[str]] = None) -> Set[str]:
+        query = {"quarantined": True}
+        if contract_addresses is not None:
+            query["_id"] = {"$in": contract_addresses}
+        return {entry["_id"] for entry in self.mongo_handler.find(collection=self.collection, query=query,
+                                                                   projection={"_id": 1})}
+
+    def get_quarantined_entries(self) -> List[Dict]:
+        return list(self.mongo_handler.find(collection=self.collection, query={"quarantined": True}))
+
+    def release(self, contract_address: str) -> bool:
+        # Journaled steps are kept, the next attempt resumes from them
+        result = self.mongo_handler.update(collection=self.collection, query={"_id": contract_address},
+                                           document={"$set": {"quarantined": False, "attempts": 0}})
+        return result.matched_count > 0
+
+    def mark_written(self, contract_addresses: List[str]):
+        if not contract_addresses:
+            return
+        now = time.time()
+        self.mongo_handler.update_many(collection=self.collection,
+                                       query={"_id": {"$in": contract_addresses}},
+                                       document={"$set": {f"steps.{RECORD_WRITTEN}": now, "finished_at": now}})
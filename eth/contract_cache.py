@@ -0,0 +1,88 @@
+import hashlib
+import json
+
+from typing import Callable, Dict, List, Optional
+
+from utils.cache import LRUCache
+from .errors import ContractError
+from .event_interfaces import EventContractInterface
+from .multicall import MulticallReader
+from .provider.provider import Provider
+
+DEFAULT_MAX_CONTRACTS = 4096
+DEFAULT_MAX_ABIS = 64
+
+
+def get_abi_hash(contract_abi: List) -> str:
+    # Stable across key order
+    return hashlib.sha256(json.dumps(contract_abi, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+class ContractInterfaceCache:
+    def __init__(self, provider: Provider,
+                 multicall_reader: MulticallReader,
+                 max_contracts: int = DEFAULT_MAX_CONTRACTS,
+                 max_abis: int = DEFAULT_MAX_ABIS,
+                 ttl: Optional[float] = None):
+        self.provider = provider
+        self.multicall_reader = multicall_reader
+        # contract address -> EventContractInterface, with name and symbol already read
+        self.contract_cache = LRUCache(max_size=max_contracts, ttl=ttl)
+        # abi hash -> web3 contract factory, so each distinct ABI is parsed once
+        self.abi_cache = LRUCache(max_size=max_abis)
+
+    def get_contract_factory(self, contract_abi: List):
+        abi_hash = get_abi_hash(contract_abi)
+        w3_contract_factory = self.abi_cache.get(abi_hash)
+        if w3_contract_factory is None:
+            w3_contract_factory = self.provider.w3.eth.contract(abi=contract_abi)
+            self.abi_cache.set(abi_hash, w3_contract_factory)
+
+        return w3_contract_factory
+
+    def get_interfaces(self, records: List[Dict],
+                       abi_loader: Optional[Callable[[List[str]], Dict[str, List]]] = None
+                       ) -> List[EventContractInterface]:
+        # Interfaces in record order, abi_loader gets the uncached addresses lacking an ABI
+        interfaces = {}
+        missing_records = []
+        for record in records:
+            interface = self.contract_cache.get(record["contract_address"])
+            if interface is None:
+                missing_records.append(record)
+            else:
+                interfaces[record["contract_address"]] = interface
+
+        addresses_without_abi = [record["contract_address"] for record in missing_records
+                                 if record.get("contract_abi") is None]
+        if addresses_without_abi:
+            if abi_loader is None:
+                raise Exception(f"No ABI available for {len(addresses_without_abi)} uncached contracts")
+            contract_abis = abi_loader(addresses_without_abi)
+            addresses_not_found = [address for address in addresses_without_abi if address not in contract_abis]
+            if addresses_not_found:
+                raise ContractError(f"No ABI stored for {addresses_not_found}", contract_addresses=addresses_not_found)
+            missing_records = [record if record.get("contract_abi") is not None
+                               else {**record, "contract_abi": contract_abis[record["contract_address"]]}
+                               for record in missing_records]
+
+        if missing_records:
+            w3_contract_factories = [self.get_contract_factory(record["contract_abi"]) for record in missing_records]
+            new_interfaces = EventContractInterface.from_records(provider=self.provider,
+                                                                 records=missing_records,
+                                                                 multicall_reader=self.multicall_reader,
+                                                                 w3_contract_factories=w3_contract_factories)
+            for record, interface in zip(missing_records, new_interfaces):
+                self.contract_cache.set(record["contract_address"], interface)
+                interfaces[record["contract_address"]] = interface
+
+        return [interfaces[record["contract_address"]] for record in records]
+
+    def get_interface(self, contract_address: str, contract_abi: List) -> EventContractInterface:
+        return self.get_interfaces([{"contract_address": contract_address, "contract_abi": contract_abi}])[0]
+
+    def evict(self, contract_address: str):
+        self.contract_cache.delete(contract_address)
+
+    def stats(self) -> Dict:
+        return {"contracts": self.contract_cache.stats(), "abis": self.abi_cache.stats()}
@@ -0,0 +1,25 @@
+from typing import List, Optional
+
+from eth_abi.exceptions import DecodingError
+from web3.exceptions import ContractLogicError, BadFunctionCallOutput, MismatchedABI, InvalidAddress, \
+    NoABIFunctionsFound
+
+# web3 errors that point at the contract or its ABI rather than at the endpoint or the sender
+WEB3_CONTRACT_ERRORS = (ContractLogicError, BadFunctionCallOutput, MismatchedABI, InvalidAddress, NoABIFunctionsFound,
+                        DecodingError)
+
+
+class ContractError(Exception):
+    def __init__(self, message: str, contract_addresses: Optional[List[str]] = None):
+        # Raised for the contracts at fault, which a batch can drop and carry on without
+        super().__init__(message)
+        self.contract_addresses = contract_addresses or []
+
+
+class LearnedGasLimitError(Exception):
+    # Out of gas under a limit learned from smaller calls, the contract is not at fault
+    pass
+
+
+def is_contract_error(error: Exception) -> bool:
+    return isinstance(error, (ContractError,) + WEB3_CONTRACT_ERRORS)
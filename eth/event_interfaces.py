@@ -1,32 +1,81 @@
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from web3 import Web3
 
+from utils.logger import get_logger
+from utils.metrics import RECEIPT_WAIT_SECONDS
+from .errors import ContractError
+from .multicall import MulticallReader
+from .provider.nonce_manager import NonceManager
 from .provider.provider import Provider
 
+logger = get_logger(__name__)
+
 
 class EventContractInterface:
-    def __init__(self, provider: Provider, contract_address: str, contract_abi):
+    # record field -> contract view function, used for multicall batched reads
+    CONTRACT_INFO_FUNCTIONS = {
+        "contract_name": "getContractName",
+        "asset_symbol": "getAssetSymbol",
+    }
+    CONTRACT_STATUS_FUNCTIONS = {
+        "is_event_over": "isEventOver",
+        "is_payout_period_over": "isPayoutPeriodOver",
+    }
+    EVENT_STATS_FUNCTIONS = {
+        "winning_betters_addresses": "getWinningBettersAddresses",
+        "contract_balance": "getContractBalance",
+        "over_betters_balance": "getOverBettersBalance",
+        "under_betters_balance": "getUnderBettersBalance",
+        "over_betting_payout_modifier": "getOverBettingPayoutModifier",
+        "under_betting_payout_modifier": "getUnderBettingPayoutModifier",
+    }
+
+    def __init__(self, provider: Provider, contract_address: str, contract_abi,
+                 contract_name: Optional[str] = None,
+                 asset_symbol: Optional[str] = None,
+                 w3_contract_factory=None):
         self.provider = provider
-        self.w3_contract_handle = self.provider.w3.eth.contract(address=contract_address, abi=contract_abi)
+        if w3_contract_factory is not None:
+            self.w3_contract_handle = w3_contract_factory(address=contract_address)
+        else:
+            self.w3_contract_handle = self.provider.w3.eth.contract(address=contract_address, abi=contract_abi)
         if self.w3_contract_handle is None:
             raise Exception("Contract not found")
-        self.contract_name = self.__get_contract_name(self.w3_contract_handle)
-        self.asset_symbol = self.__get_contract_asset_symbol(self.w3_contract_handle)
+        if contract_name is None:
+            contract_name = self.__get_contract_name(self.w3_contract_handle)
+        if asset_symbol is None:
+            asset_symbol = self.__get_contract_asset_symbol(self.w3_contract_handle)
+        self.contract_name = contract_name
+        self.asset_symbol = asset_symbol
 
     @classmethod
-    def __send_txn(cls, provider, contract_function_handle):
-        txn = {
-            "from": provider.get_wallet_address(),
-            "nonce": provider.get_nonce()
-        }
-
-        function_call = contract_function_handle.build_transaction(txn)
-        signed_txn = provider.w3.eth.account.sign_transaction(function_call,
-                                                              private_key=provider.get_wallet_private_key())
-        send_txn = provider.w3.eth.send_raw_transaction(signed_txn.rawTransaction)
-        txn_receipt = provider.w3.eth.wait_for_transaction_receipt(send_txn)
-
-        return txn_receipt
+    def __send_txn(cls, provider, contract_function_handle, attempts=2):
+        for attempt in range(attempts):
+            nonce = provider.get_nonce()
+            txn = {
+                "from": provider.get_wallet_address(),
+                "nonce": nonce
+            }
+
+            try:
+                function_call = contract_function_handle.build_transaction(txn)
+                signed_txn = provider.w3.eth.account.sign_transaction(function_call,
+                                                                      private_key=provider.get_wallet_private_key())
+                send_txn = provider.w3.eth.send_raw_transaction(signed_txn.rawTransaction)
+            except Exception as e:
+                provider.release_nonce(nonce)
+                if NonceManager.is_nonce_error(e) and attempt < attempts - 1:
+                    logger.warning(f"Nonce {nonce} rejected, resyncing: {e}")
+                    provider.resync_nonce()
+                    continue
+                raise e
+
+            provider.mark_nonce_sent(nonce, send_txn)
+            with RECEIPT_WAIT_SECONDS.time(outcome="sync_wait"):
+                txn_receipt = provider.w3.eth.wait_for_transaction_receipt(send_txn)
+            provider.confirm_nonce(nonce)
+
+            return txn_receipt
 
     @classmethod
     def __set_price_at_close(cls, price_at_close, w3_contract_handle, provider):
@@ -122,9 +171,9 @@ class EventContractInterface:
             is_payout_period_over = self.__check_is_payout_over(self.w3_contract_handle)
 
             if is_event_over is not None and is_payout_period_over is not None:
-                print(f"Checked event {self.contract_name} {self.asset_symbol} status")
+                logger.debug(f"Checked event {self.contract_name} {self.asset_symbol} status")
             else:
-                print(f"Unable to check event {self.contract_name} {self.asset_symbol} status")
+                logger.warning(f"Unable to check event {self.contract_name} {self.asset_symbol} status")
                 raise Exception("Event status check failed")
         except Exception as e:
             raise Exception(f"Event status check failed: {e}")
@@ -143,7 +192,7 @@ class EventContractInterface:
         except Exception as e:
             raise Exception(f"Event totals check failed: {e}")
 
-        print(f"Checked event {self.contract_name} {self.asset_symbol} stats")
+        logger.debug(f"Checked event {self.contract_name} {self.asset_symbol} stats")
 
         return {
             "winning_betters_addresses": winning_betters_addresses,
@@ -154,3 +203,86 @@ class EventContractInterface:
             "under_betting_payout_modifier": under_betting_payout_modifier,
         }
 
+    @classmethod
+    def __read_many(cls, interfaces, functions: Dict, multicall_reader: MulticallReader) -> Dict[str, Dict]:
+        calls = []
+        for interface in interfaces:
+            for fn_name in functions.values():
+                calls.append((interface.w3_contract_handle, fn_name, ()))
+
+        results = multicall_reader.aggregate(calls)
+
+        reads = {}
+        num_functions = len(functions)
+        for index, interface in enumerate(interfaces):
+            values = results[index * num_functions:(index + 1) * num_functions]
+            reads[interface.w3_contract_handle.address] = dict(zip(functions.keys(), values))
+
+        return reads
+
+    @classmethod
+    def from_records(cls, provider: Provider, records: List[Dict],
+                     multicall_reader: MulticallReader,
+                     w3_contract_factories: Optional[List] = None) -> List["EventContractInterface"]:
+        if w3_contract_factories is None:
+            w3_contract_factories = [None] * len(records)
+
+        handles = []
+        for record, w3_contract_factory in zip(records, w3_contract_factories):
+            if w3_contract_factory is not None:
+                handles.append(w3_contract_factory(address=record["contract_address"]))
+            else:
+                handles.append(provider.w3.eth.contract(address=record["contract_address"],
+                                                        abi=record["contract_abi"]))
+
+        calls = []
+        for w3_contract_handle in handles:
+            for fn_name in cls.CONTRACT_INFO_FUNCTIONS.values():
+                calls.append((w3_contract_handle, fn_name, ()))
+        results = multicall_reader.aggregate(calls)
+
+        unreadable_addresses = [record["contract_address"] for index, record in enumerate(records)
+                                if None in results[index * 2:index * 2 + 2]]
+        if unreadable_addresses:
+            raise ContractError(f"Unable to read contract info for {unreadable_addresses}",
+                                contract_addresses=unreadable_addresses)
+
+        interfaces = []
+        for index, record in enumerate(records):
+            contract_name, asset_symbol = results[index * 2:index * 2 + 2]
+            interfaces.append(cls(provider=provider,
+                                  contract_address=record["contract_address"],
+                                  contract_abi=record["contract_abi"],
+                                  contract_name=contract_name,
+                                  asset_symbol=asset_symbol,
+                                  w3_contract_factory=w3_contract_factories[index]))
+
+        return interfaces
+
+    @classmethod
+    def check_contract_status_many(cls, interfaces: List["EventContractInterface"],
+                                   multicall_reader: MulticallReader) -> Dict[str, Dict]:
+        statuses = cls.__read_many(interfaces, cls.CONTRACT_STATUS_FUNCTIONS, multicall_reader)
+        failed_addresses = [contract_address for contract_address, status in statuses.items()
+                            if status["is_event_over"] is None or status["is_payout_period_over"] is None]
+        if failed_addresses:
+            raise ContractError(f"Event status check failed for {failed_addresses}",
+                                contract_addresses=failed_addresses)
+
+        logger.info(f"Checked {len(statuses)} event statuses")
+
+        return statuses
+
+    @classmethod
+    def check_event_stats_many(cls, interfaces: List["EventContractInterface"],
+                               multicall_reader: MulticallReader) -> Dict[str, Dict]:
+        stats = cls.__read_many(interfaces, cls.EVENT_STATS_FUNCTIONS, multicall_reader)
+        failed_addresses = [contract_address for contract_address, event_stats in stats.items()
+                            if any(value is None for value in event_stats.values())]
+        if failed_addresses:
+            raise ContractError(f"Event totals check failed for {failed_addresses}",
+                                contract_addresses=failed_addresses)
+
+        logger.info(f"Checked {len(stats)} event stats")
+
+        return stats
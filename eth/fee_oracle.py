@@ -0,0 +1,80 @@
+import asyncio
+import math
+import time
+
+from typing import Dict, Hashable, Optional
+
+from utils.cache import LRUCache
+from .contract_cache import get_abi_hash
+from .provider.async_provider import AsyncProvider
+
+# roughly one block, fees are re-read at most once per block
+DEFAULT_FEE_TTL = 12
+# headroom over the base fee for it to rise before the txn is mined, doubles cover six full blocks
+BASE_FEE_MULTIPLIER = 2
+DEFAULT_GAS_MARGIN = 1.25
+DEFAULT_MAX_GAS_ENTRIES = 256
+
+
+class FeeOracle:
+    def __init__(self, provider: AsyncProvider, ttl: float = DEFAULT_FEE_TTL):
+        # EIP-1559 fees shared by every txn built within a block
+        self.provider = provider
+        self.ttl = ttl
+        self.refreshes = 0
+
+        self.__fees: Optional[Dict] = None
+        self.__expires_at = 0.0
+        # (event loop, lock)
+        self.__refresh_lock = None
+
+    def __get_refresh_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self.__refresh_lock is None or self.__refresh_lock[0] is not loop:
+            self.__refresh_lock = (loop, asyncio.Lock())
+        return self.__refresh_lock[1]
+
+    async def get_fees(self) -> Dict:
+        # Concurrent callers share one refresh
+        if self.__fees is not None and time.monotonic() < self.__expires_at:
+            return self.__fees
+
+        async with self.__get_refresh_lock():
+            if self.__fees is None or time.monotonic() >= self.__expires_at:
+                latest_block = await self.provider.w3.eth.get_block("latest")
+                max_priority_fee = await self.provider.w3.eth.max_priority_fee
+                self.__fees = {
+                    "maxFeePerGas": BASE_FEE_MULTIPLIER * latest_block["baseFeePerGas"] + max_priority_fee,
+                    "maxPriorityFeePerGas": max_priority_fee,
+                }
+                self.__expires_at = time.monotonic() + self.ttl
+                self.refreshes += 1
+
+        return self.__fees
+
+    def invalidate(self):
+        self.__fees = None
+
+
+class GasLimitCache:
+    def __init__(self, margin: float = DEFAULT_GAS_MARGIN, max_entries: int = DEFAULT_MAX_GAS_ENTRIES):
+        self.margin = margin
+        # (function name, function abi hash) -> largest gas used
+        self.__gas_used = LRUCache(max_size=max_entries)
+
+    @classmethod
+    def get_key(cls, contract_function_handle) -> Hashable:
+        return contract_function_handle.fn_name, get_abi_hash([contract_function_handle.abi])
+
+    def get(self, key: Hashable) -> Optional[int]:
+        gas_used = self.__gas_used.get(key)
+        return None if gas_used is None else math.ceil(gas_used * self.margin)
+
+    def record(self, key: Hashable, gas_used: int):
+        self.__gas_used.set(key, max(gas_used, self.__gas_used.get(key) or 0))
+
+    def invalidate(self, key: Hashable):
+        self.__gas_used.delete(key)
+
+    def stats(self) -> Dict:
+        return self.__gas_used.stats()
@@ -0,0 +1,112 @@
+from typing import Dict, Iterable, List, Optional, Set
+
+from web3 import Web3
+
+from db.mongo_interface import MongoInterface
+from .provider.provider import Provider
+
+DEFAULT_CURSOR_COLLECTION = "event_log_cursors"
+# blocks behind the head a log must be before the cursor moves past it, a reorg shallower than this is re-scanned
+DEFAULT_CONFIRMATIONS = 5
+# blocks per eth_getLogs request, kept under the range limits of hosted endpoints
+DEFAULT_BLOCK_CHUNK_SIZE = 2000
+DEFAULT_ADDRESS_CHUNK_SIZE = 500
+# a cursor further behind than this is dropped, one full refresh is cheaper than scanning the gap
+DEFAULT_MAX_CURSOR_LAG = 50000
+# every n-th scan of a key reads every contract, catching state changes that emit no logs
+DEFAULT_FULL_SCAN_EVERY = 12
+
+
+class EventLogSync:
+    def __init__(self, provider: Provider,
+                 mongo_handler: MongoInterface,
+                 cursor_collection: str = DEFAULT_CURSOR_COLLECTION,
+                 confirmations: int = DEFAULT_CONFIRMATIONS,
+                 block_chunk_size: int = DEFAULT_BLOCK_CHUNK_SIZE,
+                 address_chunk_size: int = DEFAULT_ADDRESS_CHUNK_SIZE,
+                 max_cursor_lag: int = DEFAULT_MAX_CURSOR_LAG,
+                 full_scan_every: Optional[int] = DEFAULT_FULL_SCAN_EVERY):
+        if block_chunk_size < 1 or address_chunk_size < 1:
+            raise Exception("Log sync chunk sizes must be at least 1")
+
+        self.provider = provider
+        self.mongo_handler = mongo_handler
+        self.cursor_collection = cursor_collection
+        self.confirmations = confirmations
+        self.block_chunk_size = block_chunk_size
+        self.address_chunk_size = address_chunk_size
+        self.max_cursor_lag = max_cursor_lag
+        self.full_scan_every = full_scan_every
+
+        # sync key -> lowercase addresses whose stats were read at or after the stored cursor
+        self.__synced_addresses: Dict[str, Set[str]] = {}
+        # sync key -> scans since the last full refresh
+        self.__scan_counts: Dict[str, int] = {}
+
+    def get_cursor(self, sync_key: str) -> Optional[int]:
+        cursor = self.mongo_handler.find_one(collection=self.cursor_collection, query={"_id": sync_key})
+        return None if cursor is None else cursor["block"]
+
+    def __get_logs(self, contract_addresses: List[str], from_block: int, to_block: int) -> List[Dict]:
+        logs = []
+        for block_start in range(from_block, to_block + 1, self.block_chunk_size):
+            block_end = min(block_start + self.block_chunk_size - 1, to_block)
+            for address_start in range(0, len(contract_addresses), self.address_chunk_size):
+                logs.extend(self.provider.w3.eth.get_logs({
+                    "fromBlock": block_start,
+                    "toBlock": block_end,
+                    "address": contract_addresses[address_start:address_start + self.address_chunk_size],
+                }))
+
+        return logs
+
+    def scan(self, sync_key: str, contract_addresses: List[str]) -> Dict:
+        # active_addresses is None when every contract has to be read
+        safe_block = self.provider.w3.eth.block_number - self.confirmations
+        cursor = self.get_cursor(sync_key)
+        synced_addresses = self.__synced_addresses.get(sync_key)
+        log_scan = {"sync_key": sync_key,
+                    "to_block": safe_block,
+                    "contract_addresses": contract_addresses,
+                    "active_addresses": None}
+
+        scan_count = self.__scan_counts.get(sync_key, 0) + 1
+        if self.full_scan_every is not None and scan_count >= self.full_scan_every:
+            scan_count = 0
+        self.__scan_counts[sync_key] = scan_count
+
+        if cursor is None or synced_addresses is None or safe_block - cursor > self.max_cursor_lag \
+                or scan_count == 0:
+            return log_scan
+        if safe_block <= cursor:
+            log_scan["to_block"] = cursor
+            log_scan["active_addresses"] = {address for address in contract_addresses
+                                            if address.lower() not in synced_addresses}
+            return log_scan
+
+        checksum_addresses = [Web3.to_checksum_address(address) for address in contract_addresses]
+        logs = self.__get_logs(checksum_addresses, from_block=cursor + 1, to_block=safe_block)
+        logged_addresses = {log["address"].lower() for log in logs}
+
+        log_scan["active_addresses"] = {address for address in contract_addresses
+                                        if address.lower() in logged_addresses
+                                        or address.lower() not in synced_addresses}
+        return log_scan
+
+    def commit(self, log_scan: Dict, unsynced_addresses: Iterable[str] = ()):
+        # Unsynced addresses are scanned as active again
+        sync_key = log_scan["sync_key"]
+        self.mongo_handler.upsert(collection=self.cursor_collection,
+                                  query={"_id": sync_key},
+                                  document={"$set": {"block": log_scan["to_block"]}})
+        unsynced_addresses = {address.lower() for address in unsynced_addresses}
+        self.__synced_addresses[sync_key] = {address.lower() for address in log_scan["contract_addresses"]
+                                             if address.lower() not in unsynced_addresses}
+
+    def reset(self, sync_key: Optional[str] = None):
+        if sync_key is None:
+            self.__synced_addresses.clear()
+            self.__scan_counts.clear()
+        else:
+            self.__synced_addresses.pop(sync_key, None)
+            self.__scan_counts.pop(sync_key, None)
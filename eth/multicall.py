@@ -0,0 +1,129 @@
+import requests
+
+from typing import Any, List, Optional, Tuple
+
+from eth_abi import decode
+from eth_utils.abi import collapse_if_tuple
+from web3 import Web3
+
+from utils.metrics import MULTICALL_CALLS
+from .errors import ContractError, WEB3_CONTRACT_ERRORS
+from .provider.provider import Provider
+
+# Multicall3 is deployed at the same address on mainnet, Sepolia and most other EVM chains
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+MULTICALL3_ABI = [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"internalType": "address", "name": "target", "type": "address"},
+                    {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+                    {"internalType": "bytes", "name": "callData", "type": "bytes"}
+                ],
+                "internalType": "struct Multicall3.Call3[]",
+                "name": "calls",
+                "type": "tuple[]"
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"internalType": "bool", "name": "success", "type": "bool"},
+                    {"internalType": "bytes", "name": "returnData", "type": "bytes"}
+                ],
+                "internalType": "struct Multicall3.Result[]",
+                "name": "returnData",
+                "type": "tuple[]"
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function"
+    }
+]
+
+DEFAULT_BATCH_SIZE = 500
+
+
+class MulticallReader:
+    def __init__(self, provider: Provider,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 multicall_address: str = MULTICALL3_ADDRESS):
+        if batch_size < 1:
+            raise Exception("Multicall batch size must be at least 1")
+
+        self.provider = provider
+        self.batch_size = batch_size
+        self.w3_multicall_handle = self.provider.w3.eth.contract(address=Web3.to_checksum_address(multicall_address),
+                                                                 abi=MULTICALL3_ABI)
+
+    @classmethod
+    def __get_output_types(cls, w3_contract_handle, fn_name) -> List[str]:
+        for fn_abi in w3_contract_handle.abi:
+            if fn_abi.get("type") == "function" and fn_abi.get("name") == fn_name:
+                return [collapse_if_tuple(output) for output in fn_abi.get("outputs", [])]
+
+        raise ContractError(f"Function {fn_name} not found in the ABI of {w3_contract_handle.address}",
+                            contract_addresses=[w3_contract_handle.address])
+
+    @classmethod
+    def __normalize_value(cls, output_type, value):
+        if output_type == "address":
+            return Web3.to_checksum_address(value)
+        if output_type == "address[]":
+            return [Web3.to_checksum_address(address) for address in value]
+
+        return value
+
+    @classmethod
+    def __decode_result(cls, output_types, return_data):
+        decoded = decode(output_types, return_data)
+        normalized = [cls.__normalize_value(output_type, value) for output_type, value in zip(output_types, decoded)]
+        if len(normalized) == 1:
+            return normalized[0]
+
+        return tuple(normalized)
+
+    def __aggregate3(self, encoded_calls: List[Tuple[str, bool, bytes]]) -> List[Tuple[bool, bytes]]:
+        try:
+            return self.w3_multicall_handle.functions.aggregate3(encoded_calls).call()
+        except requests.exceptions.RequestException as e:
+            # The endpoint is down, smaller batches would only send more requests
+            raise e
+        except (ValueError,) + WEB3_CONTRACT_ERRORS as e:
+            if len(encoded_calls) == 1:
+                contract_address = encoded_calls[0][0]
+                raise ContractError(f"Multicall aggregate failed for {contract_address}: {e}",
+                                    contract_addresses=[contract_address])
+            # One call over the node's gas or response limit fails the whole batch, each half is tried on its own
+            middle = len(encoded_calls) // 2
+            return self.__aggregate3(encoded_calls[:middle]) + self.__aggregate3(encoded_calls[middle:])
+
+    def aggregate(self, calls: List[Tuple[Any, str, Tuple]]) -> List[Optional[Any]]:
+        # Decoded values in call order, None where a call reverted or returned undecodable data
+        results = []
+        for batch_start in range(0, len(calls), self.batch_size):
+            batch = calls[batch_start:batch_start + self.batch_size]
+
+            encoded_calls = []
+            output_types = []
+            for w3_contract_handle, fn_name, args in batch:
+                call_data = w3_contract_handle.encodeABI(fn_name=fn_name, args=list(args))
+                encoded_calls.append((w3_contract_handle.address, True, call_data))
+                output_types.append(self.__get_output_types(w3_contract_handle, fn_name))
+
+            batch_results = self.__aggregate3(encoded_calls)
+            for (success, return_data), types, (_, fn_name, _) in zip(batch_results, output_types, batch):
+                MULTICALL_CALLS.inc(function=fn_name, outcome="ok" if success else "reverted")
+                if not success or (types and len(return_data) == 0):
+                    results.append(None)
+                    continue
+                try:
+                    results.append(self.__decode_result(types, return_data))
+                except WEB3_CONTRACT_ERRORS:
+                    # One contract answering garbage must not fail the whole batch
+                    results.append(None)
+
+        return results
@@ -0,0 +1,114 @@
+import aiohttp
+
+from typing import Callable, Optional
+from web3 import AsyncWeb3, AsyncHTTPProvider
+from web3.middleware.exception_retry_request import async_exception_retry_middleware
+
+from utils.logger import get_logger
+from ..rpc_metrics import async_rpc_metrics_middleware
+from .nonce_manager import NonceManager
+from .session import DEFAULT_REQUEST_TIMEOUT, DEFAULT_POOL_SIZE, DEFAULT_MAX_RETRIES, DEFAULT_BACKOFF_FACTOR, \
+    READ_METHODS
+
+logger = get_logger(__name__)
+
+
+async def async_read_retry_middleware(make_request, async_w3):
+    # web3's default retry middleware also resends eth_sendRawTransaction
+    return await async_exception_retry_middleware(make_request, async_w3, (TimeoutError, aiohttp.ClientError),
+                                                  retries=DEFAULT_MAX_RETRIES + 1,
+                                                  backoff_factor=DEFAULT_BACKOFF_FACTOR,
+                                                  allow_list=list(READ_METHODS))
+
+
+class AsyncProvider:
+    def __init__(self, provider_url, wallet_address, wallet_private_key,
+                 nonce_manager: Optional[NonceManager] = None,
+                 request_timeout: float = DEFAULT_REQUEST_TIMEOUT,
+                 record_metrics: bool = True,
+                 endpoint_selector: Optional[Callable[[str], str]] = None,
+                 pool_size: int = DEFAULT_POOL_SIZE):
+        self.request_timeout = request_timeout
+        self.pool_size = pool_size
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.provider = self.__build_provider(provider_url)
+        self.w3 = AsyncWeb3(self.provider)
+        if record_metrics:
+            self.w3.middleware_onion.add(async_rpc_metrics_middleware, "rpc_metrics")
+        self.chain_id = None
+        # Called with the pinned endpoint between settlement batches, returns the endpoint to send from next
+        self.endpoint_selector = endpoint_selector
+
+        self.__wallet_address = wallet_address
+        self.__wallet_private_key = wallet_private_key
+
+        # Share the sync Provider's manager when both send from the same wallet
+        if nonce_manager is None:
+            nonce_manager = NonceManager()
+        self.nonce_manager = nonce_manager
+
+    def repin_endpoint(self) -> str:
+        endpoint_uri = self.provider.endpoint_uri
+        if self.endpoint_selector is None:
+            return endpoint_uri
+
+        selected_endpoint_uri = self.endpoint_selector(endpoint_uri)
+        if selected_endpoint_uri != endpoint_uri:
+            logger.warning(f"Settlement endpoint {endpoint_uri} unavailable, sending from {selected_endpoint_uri}")
+            self.provider = self.__build_provider(selected_endpoint_uri)
+            # Swapping the provider keeps the middleware stack
+            self.w3.provider = self.provider
+
+        return selected_endpoint_uri
+
+    def __build_provider(self, endpoint_uri: str) -> AsyncHTTPProvider:
+        provider = AsyncHTTPProvider(endpoint_uri=endpoint_uri, request_kwargs={"timeout": self.request_timeout})
+        provider.middlewares = [async_read_retry_middleware]
+        return provider
+
+    async def open_session(self):
+        # One keep-alive session for every batch run on the same loop, web3 would open one per loop and endpoint
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size),
+                                                 raise_for_status=True)
+        await self.provider.cache_async_session(self.session)
+
+    async def get_chain_id(self):
+        if self.chain_id is None:
+            self.chain_id = await self.w3.eth.chain_id
+        return self.chain_id
+
+    async def get_pending_nonce(self):
+        return await self.w3.eth.get_transaction_count(self.__wallet_address, "pending")
+
+    async def get_nonce(self):
+        if self.nonce_manager.needs_seed():
+            self.nonce_manager.seed(await self.get_pending_nonce())
+        return self.nonce_manager.allocate()
+
+    def mark_nonce_sent(self, nonce, txn_hash):
+        self.nonce_manager.mark_sent(nonce, txn_hash)
+
+    def confirm_nonce(self, nonce):
+        self.nonce_manager.confirm(nonce)
+
+    def release_nonce(self, nonce):
+        self.nonce_manager.release(nonce)
+
+    async def resync_nonce(self):
+        self.nonce_manager.resync(await self.get_pending_nonce())
+
+    async def get_is_connected(self):
+        return await self.w3.is_connected()
+
+    def get_w3(self):
+        return self.w3
+
+    def get_provider(self):
+        return self.provider
+
+    def get_wallet_address(self):
+        return self.__wallet_address
+
+    def get_wallet_private_key(self):
+        return self.__wallet_private_key
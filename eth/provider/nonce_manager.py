@@ -0,0 +1,82 @@
+import heapq
+import threading
+
+from typing import Dict, Optional
+
+NONCE_ERROR_MESSAGES = (
+    "nonce too low",
+    "nonce too high",
+    "replacement transaction underpriced",
+    "already known",
+    "known transaction",
+    "invalid nonce",
+)
+
+
+class NonceManager:
+    def __init__(self):
+        # Shared by threads and coroutines, the lock is never held across I/O
+        self.__lock = threading.Lock()
+        self.__next_nonce: Optional[int] = None
+        self.__released = []
+        # nonce -> txn hash, None until the txn has been sent
+        self.__in_flight: Dict[int, Optional[str]] = {}
+
+    @staticmethod
+    def is_nonce_error(error: Exception) -> bool:
+        message = str(error).lower()
+        return any(nonce_message in message for nonce_message in NONCE_ERROR_MESSAGES)
+
+    def needs_seed(self) -> bool:
+        with self.__lock:
+            return self.__next_nonce is None
+
+    def seed(self, pending_count: int):
+        with self.__lock:
+            if self.__next_nonce is None:
+                self.__next_nonce = pending_count
+
+    def allocate(self) -> int:
+        with self.__lock:
+            if self.__next_nonce is None:
+                raise Exception("Nonce manager has not been seeded")
+
+            if self.__released:
+                nonce = heapq.heappop(self.__released)
+            else:
+                nonce = self.__next_nonce
+                self.__next_nonce += 1
+            self.__in_flight[nonce] = None
+
+        return nonce
+
+    def mark_sent(self, nonce: int, txn_hash):
+        with self.__lock:
+            self.__in_flight[nonce] = txn_hash
+
+    def confirm(self, nonce: int):
+        with self.__lock:
+            self.__in_flight.pop(nonce, None)
+
+    def release(self, nonce: int):
+        # A nonce that was allocated but never made it to the node, refilled by the next allocate()
+        with self.__lock:
+            self.__in_flight.pop(nonce, None)
+            if self.__next_nonce is not None and nonce < self.__next_nonce and nonce not in self.__released:
+                heapq.heappush(self.__released, nonce)
+
+    def resync(self, pending_count: int):
+        # Sent nonces at or above the pending count were dropped by the node, they are handed out again
+        with self.__lock:
+            unsent = {nonce for nonce, txn_hash in self.__in_flight.items()
+                      if txn_hash is None and nonce >= pending_count}
+            next_nonce = max([pending_count] + [nonce + 1 for nonce in unsent])
+
+            self.__in_flight = {nonce: None for nonce in unsent}
+            self.__released = [nonce for nonce in range(pending_count, next_nonce) if nonce not in unsent]
+            heapq.heapify(self.__released)
+            self.__next_nonce = next_nonce
+
+    def get_in_flight(self) -> Dict[int, Optional[str]]:
+        with self.__lock:
+            return dict(self.__in_flight)
@@ -0,0 +1,250 @@
+import random
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Dict, List, Optional
+
+from web3 import Web3
+from web3.providers.base import BaseProvider
+
+from utils.logger import get_logger
+from .session import SessionHTTPProvider, READ_METHODS
+
+# Sent to a second endpoint too when the first one is slow
+HEDGEABLE_METHODS = READ_METHODS
+SEND_METHODS = {"eth_sendRawTransaction"}
+# Lookups of a sent txn go to the endpoint that accepted it, other nodes may not have seen it yet
+PINNED_LOOKUP_METHODS = {"eth_getTransactionReceipt", "eth_getTransactionByHash"}
+
+# JSON-RPC error codes that mean the endpoint is throttling, not that the request was bad
+RATE_LIMIT_ERROR_CODES = {-32005, 429}
+
+# cheap read every endpoint answers, sent to each endpoint by is_connected so startup health is measured
+PROBE_METHOD = "eth_chainId"
+
+DEFAULT_HEDGE_DELAY = 0.5
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_CIRCUIT_COOLDOWN = 30
+DEFAULT_LATENCY = 0.2
+LATENCY_EWMA_WEIGHT = 0.2
+MAX_PINNED_TXNS = 10000
+
+logger = get_logger(__name__)
+
+
+def get_max_workers(endpoint_count: int) -> int:
+    # hedged and probe requests run on the pool's executor, one connection each
+    return max(4, 2 * endpoint_count)
+
+
+class EndpointState:
+    def __init__(self, endpoint_uri: str, provider: BaseProvider):
+        self.endpoint_uri = endpoint_uri
+        self.provider = provider
+        self.latency = DEFAULT_LATENCY
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+    def is_available(self, now: float) -> bool:
+        # An open circuit lets requests through again once the cooldown has passed (half-open)
+        return self.open_until <= now
+
+    def stats(self) -> Dict:
+        return {"endpoint_uri": self.endpoint_uri,
+                "latency": round(self.latency, 4),
+                "requests": self.requests,
+                "errors": self.errors,
+                "circuit_open": self.open_until > time.time()}
+
+
+class PooledHTTPProvider(BaseProvider):
+    def __init__(self, endpoint_uris: List[str],
+                 request_kwargs: Optional[Dict] = None,
+                 session=None,
+                 hedge_delay: Optional[float] = DEFAULT_HEDGE_DELAY,
+                 failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 circuit_cooldown: float = DEFAULT_CIRCUIT_COOLDOWN,
+                 endpoint_providers: Optional[List[BaseProvider]] = None):
+        # Latency-weighted routing over several endpoints, with circuit breaking and hedged reads
+        if not endpoint_uris:
+            raise Exception("Provider pool needs at least one endpoint")
+
+        if endpoint_providers is None:
+            endpoint_providers = [SessionHTTPProvider(endpoint_uri=endpoint_uri, request_kwargs=request_kwargs,
+                                                      session=session)
+                                  for endpoint_uri in endpoint_uris]
+        self.endpoints = [EndpointState(endpoint_uri, provider)
+                          for endpoint_uri, provider in zip(endpoint_uris, endpoint_providers)]
+        self.hedge_delay = hedge_delay
+        self.failure_threshold = failure_threshold
+        self.circuit_cooldown = circuit_cooldown
+
+        self.__lock = threading.Lock()
+        self.__executor = ThreadPoolExecutor(max_workers=get_max_workers(len(self.endpoints)),
+                                             thread_name_prefix="rpc-pool")
+        # txn hash -> endpoint that accepted it
+        self.__pinned_txns: OrderedDict = OrderedDict()
+
+    def __choose_endpoints(self, count: int, exclude: Optional[EndpointState] = None) -> List[EndpointState]:
+        now = time.time()
+        with self.__lock:
+            candidates = [endpoint for endpoint in self.endpoints
+                          if endpoint.is_available(now) and endpoint is not exclude]
+            if not candidates:
+                # Every circuit is open, fall back to the endpoint that reopens first
+                candidates = sorted([endpoint for endpoint in self.endpoints if endpoint is not exclude],
+                                    key=lambda endpoint: endpoint.open_until)[:1]
+            weights = [1 / max(endpoint.latency, 0.001) for endpoint in candidates]
+
+            chosen = []
+            while candidates and len(chosen) < count:
+                index = random.choices(range(len(candidates)), weights=weights)[0]
+                endpoint = candidates.pop(index)
+                weights.pop(index)
+                if endpoint.consecutive_failures >= self.failure_threshold:
+                    # Half-open: this request is the single probe, the circuit stays shut for everyone else
+                    endpoint.open_until = now + self.circuit_cooldown
+                chosen.append(endpoint)
+
+        return chosen
+
+    @classmethod
+    def __is_rate_limited(cls, response: Dict) -> bool:
+        error = response.get("error") if isinstance(response, dict) else None
+        return isinstance(error, dict) and error.get("code") in RATE_LIMIT_ERROR_CODES
+
+    def __record(self, endpoint: EndpointState, latency: Optional[float], failed: bool):
+        with self.__lock:
+            endpoint.requests += 1
+            if failed:
+                endpoint.errors += 1
+                endpoint.consecutive_failures += 1
+                if endpoint.consecutive_failures == self.failure_threshold:
+                    logger.warning(f"RPC endpoint {endpoint.endpoint_uri} circuit open for {self.circuit_cooldown} s")
+                if endpoint.consecutive_failures >= self.failure_threshold:
+                    endpoint.open_until = time.time() + self.circuit_cooldown
+            else:
+                endpoint.consecutive_failures = 0
+                endpoint.open_until = 0.0
+                endpoint.latency = (1 - LATENCY_EWMA_WEIGHT) * endpoint.latency + LATENCY_EWMA_WEIGHT * latency
+
+    def __send(self, endpoint: EndpointState, method, params):
+        started_at = time.monotonic()
+        try:
+            response = endpoint.provider.make_request(method, params)
+        except Exception:
+            self.__record(endpoint, None, failed=True)
+            raise
+
+        if self.__is_rate_limited(response):
+            self.__record(endpoint, None, failed=True)
+            raise Exception(f"RPC endpoint {endpoint.endpoint_uri} rate limited: {response['error']}")
+        self.__record(endpoint, time.monotonic() - started_at, failed=False)
+
+        return response
+
+    def __send_hedged(self, method, params):
+        endpoints = self.__choose_endpoints(count=2)
+        primary = self.__executor.submit(self.__send, endpoints[0], method, params)
+        done, _ = wait([primary], timeout=self.hedge_delay)
+        if done and primary.exception() is None:
+            return primary.result()
+
+        futures = [primary]
+        if len(endpoints) > 1:
+            futures.append(self.__executor.submit(self.__send, endpoints[1], method, params))
+
+        last_error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                last_error = future.exception()
+
+        raise last_error
+
+    def __send_with_failover(self, method, params):
+        endpoint = self.__choose_endpoints(count=1)[0]
+        try:
+            return self.__send(endpoint, method, params)
+        except Exception as e:
+            fallback = self.__choose_endpoints(count=1, exclude=endpoint)
+            if not fallback:
+                raise e
+            logger.warning(f"RPC {method} failed on {endpoint.endpoint_uri}, "
+                           f"retrying on {fallback[0].endpoint_uri}: {e}")
+            return self.__send(fallback[0], method, params)
+
+    @classmethod
+    def __txn_key(cls, txn_hash) -> str:
+        return (txn_hash if isinstance(txn_hash, str) else Web3.to_hex(txn_hash)).lower()
+
+    def __pin_txn(self, txn_hash, endpoint: EndpointState):
+        with self.__lock:
+            self.__pinned_txns[self.__txn_key(txn_hash)] = endpoint
+            while len(self.__pinned_txns) > MAX_PINNED_TXNS:
+                self.__pinned_txns.popitem(last=False)
+
+    def __get_pinned_endpoint(self, txn_hash) -> Optional[EndpointState]:
+        with self.__lock:
+            return self.__pinned_txns.get(self.__txn_key(txn_hash))
+
+    def make_request(self, method, params: Any):
+        if method in SEND_METHODS:
+            # A transaction is sent to exactly one endpoint, so it can never race itself across nodes
+            endpoint = self.__choose_endpoints(count=1)[0]
+            response = self.__send(endpoint, method, params)
+            if response.get("result"):
+                self.__pin_txn(response["result"], endpoint)
+            return response
+
+        if method in PINNED_LOOKUP_METHODS and params:
+            endpoint = self.__get_pinned_endpoint(params[0])
+            if endpoint is not None and endpoint.is_available(time.time()):
+                return self.__send(endpoint, method, params)
+
+        if method in HEDGEABLE_METHODS and self.hedge_delay is not None and len(self.endpoints) > 1:
+            return self.__send_hedged(method, params)
+
+        return self.__send_with_failover(method, params)
+
+    def __probe(self, endpoint: EndpointState, show_traceback: bool) -> bool:
+        try:
+            response = self.__send(endpoint, PROBE_METHOD, [])
+        except Exception as e:
+            if show_traceback:
+                logger.exception(f"RPC endpoint {endpoint.endpoint_uri} probe failed: {e}")
+            else:
+                logger.warning(f"RPC endpoint {endpoint.endpoint_uri} probe failed: {e}")
+            return False
+        return response.get("result") is not None
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        # Every endpoint is probed through the pool, so health and latency are known before the first real request
+        probes = [self.__executor.submit(self.__probe, endpoint, show_traceback) for endpoint in self.endpoints]
+        return any([probe.result() for probe in probes])
+
+    def is_endpoint_healthy(self, endpoint_uri: str) -> bool:
+        # Healthy: circuit closed and the last request answered
+        now = time.time()
+        with self.__lock:
+            return any(endpoint.is_available(now) and endpoint.consecutive_failures == 0
+                       for endpoint in self.endpoints if endpoint.endpoint_uri == endpoint_uri)
+
+    def get_best_endpoint_uri(self) -> str:
+        with self.__lock:
+            now = time.time()
+            available = [endpoint for endpoint in self.endpoints if endpoint.is_available(now)] or self.endpoints
+            # An endpoint whose last request failed is only picked when none of the others answered either
+            healthy = [endpoint for endpoint in available if endpoint.consecutive_failures == 0] or available
+            return min(healthy, key=lambda endpoint: endpoint.latency).endpoint_uri
+
+    def stats(self) -> List[Dict]:
+        with self.__lock:
+            return [endpoint.stats() for endpoint in self.endpoints]
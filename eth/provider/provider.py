@@ -1,24 +1,77 @@
+import requests
+
+from typing import List, Optional
 from web3 import Web3
 
+from ..rpc_metrics import rpc_metrics_middleware
+from .nonce_manager import NonceManager
+from .pool import PooledHTTPProvider, DEFAULT_HEDGE_DELAY
+from .session import build_http_session, SessionHTTPProvider, DEFAULT_REQUEST_TIMEOUT
+
 
 class Provider:
-    def __init__(self, provider_url, wallet_address, wallet_private_key):
-        self.provider = Web3.HTTPProvider(endpoint_uri=provider_url)
+    def __init__(self, provider_url, wallet_address, wallet_private_key,
+                 nonce_manager: Optional[NonceManager] = None,
+                 provider_urls: Optional[List[str]] = None,
+                 hedge_delay: Optional[float] = DEFAULT_HEDGE_DELAY,
+                 session: Optional[requests.Session] = None,
+                 request_timeout: float = DEFAULT_REQUEST_TIMEOUT,
+                 chain_id: Optional[int] = None,
+                 record_metrics: bool = True):
+        # One tuned keep-alive session is shared by every endpoint, so readers and the sender reuse warm connections
+        if session is None:
+            session = build_http_session()
+        self.session = session
+        request_kwargs = {"timeout": request_timeout}
+
+        # Several urls make a health-checked failover pool
+        if provider_urls:
+            endpoint_uris = list(dict.fromkeys(([provider_url] if provider_url else []) + list(provider_urls)))
+            self.provider = PooledHTTPProvider(endpoint_uris=endpoint_uris, hedge_delay=hedge_delay,
+                                               request_kwargs=request_kwargs, session=session)
+        else:
+            self.provider = SessionHTTPProvider(endpoint_uri=provider_url, request_kwargs=request_kwargs,
+                                                session=session)
         self.w3 = Web3(self.provider)
-        self.chain_id = self.w3.eth.chain_id
-        self.is_connected = self.w3.is_connected()
+        if record_metrics:
+            self.w3.middleware_onion.add(rpc_metrics_middleware, "rpc_metrics")
+        # Read on first use rather than at construction, a chain id never changes for an endpoint
+        self.chain_id = chain_id
 
         self.__wallet_address = wallet_address
         self.__wallet_private_key = wallet_private_key
 
+        if nonce_manager is None:
+            nonce_manager = NonceManager()
+        self.nonce_manager = nonce_manager
+
     def get_chain_id(self):
+        if self.chain_id is None:
+            self.chain_id = self.w3.eth.chain_id
         return self.chain_id
 
+    def get_pending_nonce(self):
+        return self.w3.eth.get_transaction_count(self.__wallet_address, "pending")
+
     def get_nonce(self):
-        return self.w3.eth.get_transaction_count(self.__wallet_address)
+        if self.nonce_manager.needs_seed():
+            self.nonce_manager.seed(self.get_pending_nonce())
+        return self.nonce_manager.allocate()
+
+    def mark_nonce_sent(self, nonce, txn_hash):
+        self.nonce_manager.mark_sent(nonce, txn_hash)
+
+    def confirm_nonce(self, nonce):
+        self.nonce_manager.confirm(nonce)
+
+    def release_nonce(self, nonce):
+        self.nonce_manager.release(nonce)
+
+    def resync_nonce(self):
+        self.nonce_manager.resync(self.get_pending_nonce())
 
     def get_is_connected(self):
-        return self.is_connected
+        return self.w3.is_connected()
 
     def get_w3(self):
         return self.w3
@@ -26,6 +79,14 @@ class Provider:
     def get_provider(self):
         return self.provider
 
+    def get_provider_url(self, current_url: Optional[str] = None):
+        # The pinned endpoint is kept while it is healthy
+        if isinstance(self.provider, PooledHTTPProvider):
+            if current_url is not None and self.provider.is_endpoint_healthy(current_url):
+                return current_url
+            return self.provider.get_best_endpoint_uri()
+        return self.provider.endpoint_uri
+
     def get_wallet_address(self):
         return self.__wallet_address
 
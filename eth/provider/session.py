@@ -0,0 +1,84 @@
+import time
+
+import requests
+
+from typing import Any, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from web3 import HTTPProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+DEFAULT_POOL_SIZE = 32
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_BACKOFF_FACTOR = 0.2
+DEFAULT_REQUEST_TIMEOUT = 10
+RETRY_STATUS_CODES = (502, 503, 504)
+# Side-effect free methods, safe to retry after a 5xx or to send to a second endpoint
+READ_METHODS = frozenset({
+    "eth_call",
+    "eth_chainId",
+    "eth_blockNumber",
+    "eth_getBalance",
+    "eth_getCode",
+    "eth_getLogs",
+    "eth_getBlockByNumber",
+    "eth_getBlockByHash",
+    "eth_getTransactionCount",
+    "eth_estimateGas",
+    "eth_gasPrice",
+    "eth_maxPriorityFeePerGas",
+    "eth_feeHistory",
+    "net_version",
+})
+
+
+def build_http_session(pool_size: int = DEFAULT_POOL_SIZE,
+                       max_retries: int = DEFAULT_MAX_RETRIES,
+                       backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+                       gzip: bool = True) -> requests.Session:
+    # One keep-alive session shared by every reader and the txn sender
+    # A 5xx may come after the node took a txn, SessionHTTPProvider retries those for READ_METHODS only
+    retry = Retry(total=max_retries,
+                  connect=max_retries,
+                  read=0,
+                  status=0,
+                  backoff_factor=backoff_factor,
+                  allowed_methods=frozenset(["POST"]),
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry, pool_block=True)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({
+        "Connection": "keep-alive",
+        "Accept-Encoding": "gzip, deflate" if gzip else "identity",
+    })
+
+    return session
+
+
+class SessionHTTPProvider(HTTPProvider):
+    def __init__(self, endpoint_uri: str, request_kwargs: Optional[Any] = None,
+                 session: Optional[requests.Session] = None,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff_factor: float = DEFAULT_BACKOFF_FACTOR):
+        # web3 HTTPProvider(session=) caches the session for the constructing thread only
+        super().__init__(endpoint_uri=endpoint_uri, request_kwargs=request_kwargs)
+        self.session = session or build_http_session()
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        request_kwargs = self.get_request_kwargs()
+        request_kwargs.setdefault("timeout", DEFAULT_REQUEST_TIMEOUT)
+        data = self.encode_rpc_request(method, params)
+        retries = self.max_retries if method in READ_METHODS else 0
+        for attempt in range(retries + 1):
+            response = self.session.post(self.endpoint_uri, data=data, **request_kwargs)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == retries:
+                break
+            time.sleep(self.backoff_factor * 2 ** attempt)
+        response.raise_for_status()
+
+        return self.decode_rpc_response(response.content)
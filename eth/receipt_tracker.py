@@ -0,0 +1,225 @@
+import itertools
+import threading
+import time
+
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from web3 import Web3
+
+from utils.logger import get_logger
+from utils.metrics import RPC_REQUEST_SECONDS, RPC_ERRORS, RECEIPT_WAIT_SECONDS
+from .provider.session import build_http_session, DEFAULT_REQUEST_TIMEOUT
+
+DEFAULT_POLL_INTERVAL = 2
+DEFAULT_RECEIPT_TIMEOUT = 600
+# seconds without a receipt before a txn is re-sent with bumped fees
+DEFAULT_STUCK_AFTER = 90
+DEFAULT_MAX_BUMPS = 3
+# nodes refuse a replacement that pays less than ~10% more than the txn it replaces
+GAS_BUMP_FACTOR = 1.15
+RECEIPT_BATCH_SIZE = 100
+
+RECEIPT_QUANTITY_FIELDS = ("blockNumber", "cumulativeGasUsed", "gasUsed", "effectiveGasPrice", "status",
+                           "transactionIndex", "type")
+
+logger = get_logger(__name__)
+
+
+class PendingTxn:
+    def __init__(self, txn_hashes: List[str], resubmit: Optional[Callable[[float], bytes]],
+                 on_replace: Optional[Callable[[str], None]] = None):
+        self.txn_hashes = txn_hashes
+        self.resubmit = resubmit
+        self.on_replace = on_replace
+        self.future: Future = Future()
+        self.submitted_at = time.time()
+        self.last_sent_at = self.submitted_at
+        self.bumps = 0
+
+
+class ReceiptTracker:
+    def __init__(self, endpoint_uri: str,
+                 session: Optional[requests.Session] = None,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 receipt_timeout: float = DEFAULT_RECEIPT_TIMEOUT,
+                 stuck_after: Optional[float] = DEFAULT_STUCK_AFTER,
+                 max_bumps: int = DEFAULT_MAX_BUMPS,
+                 request_timeout: float = DEFAULT_REQUEST_TIMEOUT):
+        # One eth_blockNumber per poll and one batched receipt lookup per new block
+        self.endpoint_uri = endpoint_uri
+        self.session = session or build_http_session()
+        self.poll_interval = poll_interval
+        self.receipt_timeout = receipt_timeout
+        self.stuck_after = stuck_after
+        self.max_bumps = max_bumps
+        self.request_timeout = request_timeout
+
+        self.__request_ids = itertools.count(1)
+        self.__lock = threading.Lock()
+        self.__wakeup = threading.Event()
+        self.__pending: Dict[str, PendingTxn] = {}
+        self.__last_block: Optional[int] = None
+        self.__thread: Optional[threading.Thread] = None
+        self.__stopped = False
+
+    def __post(self, payload):
+        # Raw JSON-RPC skips the web3 middleware, so the tracker's requests are timed here
+        method = payload[0]["method"] if isinstance(payload, list) else payload["method"]
+        function = "batch" if isinstance(payload, list) else ""
+        started_at = time.perf_counter()
+        try:
+            response = self.session.post(self.endpoint_uri, json=payload, timeout=self.request_timeout)
+            response.raise_for_status()
+            return response.json()
+        except Exception:
+            RPC_ERRORS.inc(method=method, function=function)
+            raise
+        finally:
+            RPC_REQUEST_SECONDS.observe(time.perf_counter() - started_at, method=method, function=function)
+
+    def __request(self, method, params):
+        response = self.__post({"jsonrpc": "2.0", "id": next(self.__request_ids), "method": method, "params": params})
+        if response.get("error"):
+            raise Exception(f"RPC {method} failed: {response['error']}")
+        return response.get("result")
+
+    def __get_receipts(self, txn_hashes: List[str]) -> Dict[str, Dict]:
+        receipts = {}
+        for start in range(0, len(txn_hashes), RECEIPT_BATCH_SIZE):
+            batch = [{"jsonrpc": "2.0", "id": next(self.__request_ids), "method": "eth_getTransactionReceipt",
+                      "params": [txn_hash]}
+                     for txn_hash in txn_hashes[start:start + RECEIPT_BATCH_SIZE]]
+            responses = self.__post(batch)
+            if not isinstance(responses, list):
+                raise Exception(f"RPC receipt batch failed: {responses}")
+
+            hashes_by_id = {request["id"]: request["params"][0] for request in batch}
+            for response in responses:
+                if response.get("result"):
+                    receipts[hashes_by_id[response["id"]]] = self.__format_receipt(response["result"])
+
+        return receipts
+
+    @classmethod
+    def __format_receipt(cls, receipt: Dict) -> Dict:
+        return {**receipt, **{field: int(receipt[field], 16)
+                              for field in RECEIPT_QUANTITY_FIELDS if isinstance(receipt.get(field), str)}}
+
+    @classmethod
+    def __txn_key(cls, txn_hash) -> str:
+        return (txn_hash if isinstance(txn_hash, str) else Web3.to_hex(txn_hash)).lower()
+
+    def track(self, txn_hash, resubmit: Optional[Callable[[float], bytes]] = None,
+              on_replace: Optional[Callable[[str], None]] = None,
+              replaced_hashes: Optional[List[str]] = None) -> Future:
+        # Resolves with the receipt of whichever version of the txn is mined
+        txn_hashes = [self.__txn_key(replaced_hash) for replaced_hash in replaced_hashes or []]
+        pending_txn = PendingTxn(txn_hashes + [self.__txn_key(txn_hash)], resubmit, on_replace=on_replace)
+        with self.__lock:
+            for pending_hash in pending_txn.txn_hashes:
+                self.__pending[pending_hash] = pending_txn
+            if self.__thread is None or not self.__thread.is_alive():
+                self.__stopped = False
+                self.__thread = threading.Thread(target=self.__run, name="receipt-tracker", daemon=True)
+                self.__thread.start()
+
+        return pending_txn.future
+
+    def set_endpoint_uri(self, endpoint_uri: str):
+        # Any node serves the receipt of a mined txn, so txns still pending keep resolving after a switch
+        self.endpoint_uri = endpoint_uri
+
+    def __replace(self, pending_txn: PendingTxn, now: float):
+        pending_txn.bumps += 1
+        pending_txn.last_sent_at = now
+        try:
+            signed_replacement = pending_txn.resubmit(GAS_BUMP_FACTOR ** pending_txn.bumps)
+            replacement_hash = self.__txn_key(
+                self.__request("eth_sendRawTransaction", [Web3.to_hex(signed_replacement)])
+            )
+        except Exception as e:
+            # "nonce too low" means a previous version was mined, its receipt resolves the future
+            logger.warning(f"Replacing txn {pending_txn.txn_hashes[-1]} failed: {e}")
+            return
+
+        logger.info(f"Txn {pending_txn.txn_hashes[-1]} stuck, replaced by {replacement_hash} "
+                    f"(bump {pending_txn.bumps}/{self.max_bumps})",
+                    extra={"txn_hash": replacement_hash, "bumps": pending_txn.bumps})
+        with self.__lock:
+            pending_txn.txn_hashes.append(replacement_hash)
+            self.__pending[replacement_hash] = pending_txn
+        if pending_txn.on_replace is not None:
+            try:
+                pending_txn.on_replace(replacement_hash)
+            except Exception as e:
+                logger.warning(f"Recording replacement txn {replacement_hash} failed: {e}")
+
+    def __resolve(self, pending_txn: PendingTxn, receipt: Optional[Dict] = None, error: Optional[Exception] = None):
+        with self.__lock:
+            for txn_hash in pending_txn.txn_hashes:
+                self.__pending.pop(txn_hash, None)
+        if pending_txn.future.done():
+            return
+        RECEIPT_WAIT_SECONDS.observe(time.time() - pending_txn.submitted_at,
+                                     outcome="failed" if error is not None else "mined")
+        if error is not None:
+            pending_txn.future.set_exception(error)
+        else:
+            pending_txn.future.set_result(receipt)
+
+    def __poll(self):
+        block_number = int(self.__request("eth_blockNumber", []), 16)
+        if self.__last_block is not None and block_number <= self.__last_block:
+            return
+        self.__last_block = block_number
+
+        with self.__lock:
+            pending = dict(self.__pending)
+        if not pending:
+            return
+
+        receipts = self.__get_receipts(list(pending))
+        for txn_hash, receipt in receipts.items():
+            self.__resolve(pending[txn_hash], receipt=receipt)
+
+    def __check_stuck(self):
+        now = time.time()
+        with self.__lock:
+            pending_txns = {id(pending_txn): pending_txn for pending_txn in self.__pending.values()}.values()
+
+        for pending_txn in pending_txns:
+            if now - pending_txn.submitted_at > self.receipt_timeout:
+                self.__resolve(pending_txn, error=Exception(
+                    f"Txn {pending_txn.txn_hashes[-1]} not mined after {self.receipt_timeout} s"
+                ))
+            elif self.stuck_after is not None and pending_txn.resubmit is not None \
+                    and pending_txn.bumps < self.max_bumps and now - pending_txn.last_sent_at > self.stuck_after:
+                self.__replace(pending_txn, now)
+
+    def __run(self):
+        while True:
+            with self.__lock:
+                if self.__stopped or not self.__pending:
+                    self.__thread = None
+                    return
+
+            try:
+                self.__poll()
+                self.__check_stuck()
+            except Exception as e:
+                logger.warning(f"Receipt poll failed: {e}")
+
+            self.__wakeup.wait(timeout=self.poll_interval)
+            self.__wakeup.clear()
+
+    def stop(self):
+        with self.__lock:
+            self.__stopped = True
+        self.__wakeup.set()
+
+    def get_pending_count(self) -> int:
+        with self.__lock:
+            return len({id(pending_txn) for pending_txn in self.__pending.values()})
@@ -0,0 +1,75 @@
+import time
+
+from typing import Dict
+
+from web3 import Web3
+
+from utils.metrics import RPC_REQUEST_SECONDS, RPC_ERRORS
+
+# Contract functions the updater calls, labelled by name instead of 4-byte selector
+KNOWN_FUNCTION_SIGNATURES = [
+    "getContractName()",
+    "getAssetSymbol()",
+    "isEventOver()",
+    "isPayoutPeriodOver()",
+    "getWinningBettersAddresses()",
+    "getContractBalance()",
+    "getOverBettersBalance()",
+    "getUnderBettersBalance()",
+    "getOverBettingPayoutModifier()",
+    "getUnderBettingPayoutModifier()",
+    "getBettingFee()",
+    "setPriceAtClose(uint256)",
+    "setWinners()",
+    "destroyContract()",
+    "aggregate3((address,bool,bytes)[])",
+]
+FUNCTION_SELECTORS: Dict[str, str] = {Web3.to_hex(Web3.keccak(text=signature)[:4])[2:]: signature.split("(")[0]
+                                      for signature in KNOWN_FUNCTION_SIGNATURES}
+
+# Methods whose first param carries calldata worth labelling
+CALL_METHODS = {"eth_call", "eth_estimateGas"}
+
+
+def get_function_label(method, params) -> str:
+    if method not in CALL_METHODS or not params or not isinstance(params[0], dict):
+        return ""
+    data = params[0].get("data") or params[0].get("input") or ""
+    if isinstance(data, bytes):
+        data = data.hex()
+    selector = data[2:10] if data.startswith("0x") else data[:8]
+    return FUNCTION_SELECTORS.get(selector, selector)
+
+
+def _record(method, params, started_at, response):
+    function = get_function_label(method, params)
+    RPC_REQUEST_SECONDS.observe(time.perf_counter() - started_at, method=method, function=function)
+    if response is None or (isinstance(response, dict) and response.get("error")):
+        RPC_ERRORS.inc(method=method, function=function)
+
+
+def rpc_metrics_middleware(make_request, w3):
+    # Outermost on the onion, so retries and pool failover inside count as one request
+    def middleware(method, params):
+        started_at = time.perf_counter()
+        response = None
+        try:
+            response = make_request(method, params)
+            return response
+        finally:
+            _record(method, params, started_at, response)
+
+    return middleware
+
+
+async def async_rpc_metrics_middleware(make_request, w3):
+    async def middleware(method, params):
+        started_at = time.perf_counter()
+        response = None
+        try:
+            response = await make_request(method, params)
+            return response
+        finally:
+            _record(method, params, started_at, response)
+
+    return middleware
@@ -0,0 +1,317 @@
+import asyncio
+import math
+
+from typing import Callable, Dict, List, Optional
+from web3 import Web3
+
+from db.settlement_journal import SettlementJournal, PRICE_SET_SENT, PRICE_SET_MINED, WINNERS_SENT, \
+    WINNERS_MINED
+from utils.logger import get_logger
+from .errors import ContractError, LearnedGasLimitError, is_contract_error
+from .fee_oracle import FeeOracle, GasLimitCache
+from .provider.async_provider import AsyncProvider
+from .provider.nonce_manager import NonceManager
+from .receipt_tracker import ReceiptTracker
+
+DEFAULT_MAX_CONCURRENCY = 10
+DEFAULT_RECEIPT_TIMEOUT = 600
+# gas for txns sent before the txn they depend on is mined, when an estimate would run against stale state
+DEFAULT_DEPENDENT_GAS_LIMIT = 3000000
+
+# built txn fields scaled when a stuck txn is replaced
+FEE_FIELDS = ("maxFeePerGas", "maxPriorityFeePerGas", "gasPrice")
+
+logger = get_logger(__name__)
+
+
+class AsyncSettlementPipeline:
+    def __init__(self, provider: AsyncProvider,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 receipt_timeout: int = DEFAULT_RECEIPT_TIMEOUT,
+                 receipt_tracker: Optional[ReceiptTracker] = None,
+                 dependent_gas_limit: int = DEFAULT_DEPENDENT_GAS_LIMIT,
+                 fee_oracle: Optional[FeeOracle] = None,
+                 gas_limit_cache: Optional[GasLimitCache] = None,
+                 journal: Optional[SettlementJournal] = None):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.receipt_timeout = receipt_timeout
+        # Receipts of every in-flight settlement txn are polled together, from the node the txns were sent to
+        if receipt_tracker is None:
+            receipt_tracker = ReceiptTracker(endpoint_uri=provider.get_provider().endpoint_uri,
+                                             receipt_timeout=receipt_timeout)
+        self.receipt_tracker = receipt_tracker
+        self.dependent_gas_limit = dependent_gas_limit
+        # Fees and learned gas limits let txns be built without estimate/fee round trips
+        if fee_oracle is None:
+            fee_oracle = FeeOracle(provider=provider)
+        self.fee_oracle = fee_oracle
+        if gas_limit_cache is None:
+            gas_limit_cache = GasLimitCache()
+        self.gas_limit_cache = gas_limit_cache
+        # Without a journal a restarted worker settles every unsettled event from the first txn
+        self.journal = journal
+        # settle_sync/finalize_sync run every batch on this loop, so the provider's session outlives a batch
+        self.__loop = asyncio.new_event_loop()
+
+    def __repin_endpoint(self):
+        # Between batches only, a batch's txns are all sent to and tracked on one endpoint
+        endpoint_uri = self.provider.repin_endpoint()
+        if endpoint_uri != self.receipt_tracker.endpoint_uri:
+            self.receipt_tracker.set_endpoint_uri(endpoint_uri)
+
+    def __sign_txn(self, function_call: Dict, fee_multiplier: float = 1) -> bytes:
+        if fee_multiplier != 1:
+            function_call = {**function_call, **{field: math.ceil(function_call[field] * fee_multiplier)
+                                                 for field in FEE_FIELDS if field in function_call}}
+        signed_txn = self.provider.w3.eth.account.sign_transaction(
+            function_call,
+            private_key=self.provider.get_wallet_private_key()
+        )
+        return signed_txn.rawTransaction
+
+    async def __send_txn(self, contract_function_handle, gas: Optional[int] = None, attempts=2,
+                         on_replace: Optional[Callable[[str], None]] = None, learned_gas: bool = True):
+        # Returns (nonce, receipt future, gas limit cache key, txn hash, learned gas limit or None)
+        gas_key = self.gas_limit_cache.get_key(contract_function_handle)
+        for attempt in range(attempts):
+            nonce = await self.provider.get_nonce()
+            txn = {
+                "from": self.provider.get_wallet_address(),
+                "nonce": nonce,
+                "chainId": await self.provider.get_chain_id(),
+                "type": 2,
+                **await self.fee_oracle.get_fees()
+            }
+            learned_gas_limit = self.gas_limit_cache.get(gas_key) if learned_gas else None
+            gas_limit = learned_gas_limit or gas
+            if gas_limit is not None:
+                txn["gas"] = gas_limit
+
+            try:
+                function_call = await contract_function_handle.build_transaction(txn)
+                txn_hash = await self.provider.w3.eth.send_raw_transaction(self.__sign_txn(function_call))
+            except Exception as e:
+                self.provider.release_nonce(nonce)
+                if NonceManager.is_nonce_error(e) and attempt < attempts - 1:
+                    logger.warning(f"Nonce {nonce} rejected, resyncing: {e}")
+                    await self.provider.resync_nonce()
+                    continue
+                if "underpriced" in str(e).lower() or "fee cap" in str(e).lower():
+                    self.fee_oracle.invalidate()
+                raise e
+
+            self.provider.mark_nonce_sent(nonce, txn_hash)
+            receipt_future = self.receipt_tracker.track(
+                txn_hash,
+                resubmit=lambda fee_multiplier: self.__sign_txn(function_call, fee_multiplier),
+                on_replace=on_replace
+            )
+
+            return nonce, receipt_future, gas_key, Web3.to_hex(txn_hash), learned_gas_limit
+
+    async def __resync_nonce(self):
+        # A timed out or dropped txn may have left a gap, only the node knows which nonces it still holds
+        try:
+            await self.provider.resync_nonce()
+        except Exception as e:
+            logger.warning(f"Nonce resync failed: {e}")
+
+    async def __await_receipt(self, nonce, receipt_future, gas_key, txn_hash=None, learned_gas_limit=None):
+        try:
+            txn_receipt = await asyncio.wrap_future(receipt_future)
+        except Exception:
+            await self.__resync_nonce()
+            raise
+        self.provider.confirm_nonce(nonce)
+        if txn_receipt["status"] != 1:
+            self.gas_limit_cache.invalidate(gas_key)
+            if learned_gas_limit is not None and txn_receipt["gasUsed"] >= learned_gas_limit:
+                # setWinners gas grows with the number of betters, a larger event outgrows the learned limit
+                raise LearnedGasLimitError(f"Txn {txn_receipt['transactionHash']} ran out of gas under the "
+                                           f"learned limit {learned_gas_limit}")
+            raise ContractError(f"Txn {txn_receipt['transactionHash']} reverted")
+        self.gas_limit_cache.record(gas_key, txn_receipt["gasUsed"])
+
+        return txn_receipt
+
+    async def __await_sent_receipt(self, txn_hashes: List[str]):
+        # Sent by an earlier worker, any of its versions may be the one mined
+        try:
+            txn_receipt = await asyncio.wrap_future(self.receipt_tracker.track(txn_hashes[-1],
+                                                                               replaced_hashes=txn_hashes[:-1]))
+        except Exception:
+            await self.__resync_nonce()
+            raise
+        if txn_receipt["status"] != 1:
+            raise ContractError(f"Txn {txn_receipt['transactionHash']} reverted")
+
+        return txn_receipt
+
+    async def __record_step(self, event: Dict, step: str, txn_hash: Optional[str] = None):
+        # Journal writes are blocking pymongo calls, run off the loop so other events' txns keep moving
+        if self.journal is not None:
+            await asyncio.to_thread(self.journal.record_step, event["contract_address"], step, txn_hash=txn_hash,
+                                    collection_name=event.get("collection_name"))
+
+    def __record_replacement(self, event: Dict, sent_step: str, txn_hash: str):
+        # Called on the receipt tracker thread, so the blocking write does not hold up the loop
+        if self.journal is not None:
+            self.journal.record_replacement(event["contract_address"], sent_step, txn_hash)
+
+    async def __send_step(self, event: Dict, contract_function_handle, sent_step: str, gas: Optional[int] = None,
+                          learned_gas: bool = True):
+        sent = await self.__send_txn(
+            contract_function_handle, gas=gas,
+            on_replace=lambda txn_hash: self.__record_replacement(event, sent_step, txn_hash),
+            learned_gas=learned_gas
+        )
+        # Journaled before waiting, a crash from here on waits for this txn instead of sending another
+        await self.__record_step(event, sent_step, txn_hash=sent[3])
+        return sent
+
+    async def __await_sent_step(self, event: Optional[Dict], sent, contract_function_handle,
+                                sent_step: Optional[str] = None, gas: Optional[int] = None):
+        try:
+            return await self.__await_receipt(*sent)
+        except LearnedGasLimitError as e:
+            logger.warning(f"{e}, sending again without it")
+
+        if event is None:
+            sent = await self.__send_txn(contract_function_handle, gas=gas, learned_gas=False)
+        else:
+            # The reverted txn is dropped from the journal, a restart must not resolve on its receipt
+            if self.journal is not None:
+                await asyncio.to_thread(self.journal.unset_step, event["contract_address"], sent_step)
+            sent = await self.__send_step(event, contract_function_handle, sent_step, gas=gas, learned_gas=False)
+        return await self.__await_receipt(*sent)
+
+    async def __await_step(self, event: Dict, receipt_awaitable, sent_step: str, mined_step: str):
+        try:
+            txn_receipt = await receipt_awaitable
+        except Exception:
+            # Dropped or reverted, the next attempt sends the txn again
+            if self.journal is not None:
+                await asyncio.to_thread(self.journal.unset_step, event["contract_address"], sent_step)
+            raise
+        await self.__record_step(event, mined_step)
+
+        return txn_receipt
+
+    async def __settle_event(self, semaphore, event: Dict, journal_entry: Optional[Dict] = None) -> Dict:
+        contract_address = event["contract_address"]
+        steps = (journal_entry or {}).get("steps", {})
+        if WINNERS_MINED in steps:
+            # Settled on chain before a restart, only the record write is left
+            logger.info(f"Event {contract_address} already settled on chain")
+            return {"contract_address": contract_address, "price_at_close_receipt": None,
+                    "winners_receipt": None, "resumed": True, "error": None}
+
+        async with semaphore:
+            try:
+                w3_contract_handle = self.provider.w3.eth.contract(address=contract_address,
+                                                                   abi=event["contract_abi"])
+                if PRICE_SET_MINED in steps:
+                    price_at_close_receipt = None
+                elif PRICE_SET_SENT in steps:
+                    price_at_close_receipt = self.__await_sent_receipt(
+                        SettlementJournal.get_sent_txn_hashes(journal_entry, PRICE_SET_SENT)
+                    )
+                else:
+                    price_at_close_function = w3_contract_handle.functions.setPriceAtClose(
+                        Web3.to_wei(event["price_at_close"], 'ether')
+                    )
+                    price_at_close_sent = await self.__send_step(event, price_at_close_function, PRICE_SET_SENT)
+                    price_at_close_receipt = self.__await_sent_step(event, price_at_close_sent,
+                                                                    price_at_close_function, PRICE_SET_SENT)
+                if price_at_close_receipt is not None:
+                    price_at_close_receipt = self.__await_step(event, price_at_close_receipt,
+                                                               PRICE_SET_SENT, PRICE_SET_MINED)
+
+                if WINNERS_SENT in steps:
+                    winners_receipt = self.__await_sent_receipt(
+                        SettlementJournal.get_sent_txn_hashes(journal_entry, WINNERS_SENT)
+                    )
+                else:
+                    # Nonces order the two txns, so setWinners goes out without waiting for setPriceAtClose to be mined
+                    winners_function = w3_contract_handle.functions.setWinners()
+                    try:
+                        winners_sent = await self.__send_step(event, winners_function, WINNERS_SENT,
+                                                              gas=self.dependent_gas_limit)
+                    except Exception:
+                        if price_at_close_receipt is not None:
+                            await price_at_close_receipt
+                        raise
+                    winners_receipt = self.__await_sent_step(event, winners_sent, winners_function, WINNERS_SENT,
+                                                             gas=self.dependent_gas_limit)
+                winners_receipt = self.__await_step(event, winners_receipt, WINNERS_SENT, WINNERS_MINED)
+
+                if price_at_close_receipt is not None:
+                    # Both receipts are waited on, so a failed one cannot cancel the other before its step is unset
+                    price_at_close_receipt, winners_receipt = await asyncio.gather(price_at_close_receipt,
+                                                                                   winners_receipt,
+                                                                                   return_exceptions=True)
+                    for receipt in (price_at_close_receipt, winners_receipt):
+                        if isinstance(receipt, Exception):
+                            raise receipt
+                else:
+                    winners_receipt = await winners_receipt
+            except Exception as e:
+                logger.warning(f"Event {contract_address} settlement failed: {e}")
+                return {"contract_address": contract_address, "error": str(e), "contract_error": is_contract_error(e)}
+
+        logger.info(f"Event {contract_address} settled", extra={"resumed": bool(steps)})
+
+        return {
+            "contract_address": contract_address,
+            "price_at_close_receipt": price_at_close_receipt,
+            "winners_receipt": winners_receipt,
+            "resumed": bool(steps),
+            "error": None
+        }
+
+    async def __finalize_event(self, semaphore, event: Dict) -> Dict:
+        contract_address = event["contract_address"]
+        async with semaphore:
+            try:
+                w3_contract_handle = self.provider.w3.eth.contract(address=contract_address,
+                                                                   abi=event["contract_abi"])
+                destroy_function = w3_contract_handle.functions.destroyContract()
+                destroy_receipt = await self.__await_sent_step(None, await self.__send_txn(destroy_function),
+                                                               destroy_function)
+            except Exception as e:
+                logger.warning(f"Event {contract_address} finalization failed: {e}")
+                return {"contract_address": contract_address, "error": str(e), "contract_error": is_contract_error(e)}
+
+        logger.info(f"Event {contract_address} finalized")
+
+        return {"contract_address": contract_address, "destroy_receipt": destroy_receipt, "error": None}
+
+    async def settle(self, events: List[Dict]) -> List[Dict]:
+        self.__repin_endpoint()
+        await self.provider.open_session()
+        # Bound to the running loop
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        # Steps journaled by an earlier worker are resumed rather than sent again
+        journal_entries = {}
+        if self.journal is not None:
+            journal_entries = await asyncio.to_thread(self.journal.get_entries,
+                                                      [event["contract_address"] for event in events])
+
+        return await asyncio.gather(*[
+            self.__settle_event(semaphore, event, journal_entries.get(event["contract_address"])) for event in events
+        ])
+
+    def settle_sync(self, events: List[Dict]) -> List[Dict]:
+        return self.__loop.run_until_complete(self.settle(events))
+
+    async def finalize(self, events: List[Dict]) -> List[Dict]:
+        # Remaining funds are distributed by destroyContract
+        self.__repin_endpoint()
+        await self.provider.open_session()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        return await asyncio.gather(*[self.__finalize_event(semaphore, event) for event in events])
+
+    def finalize_sync(self, events: List[Dict]) -> List[Dict]:
+        return self.__loop.run_until_complete(self.finalize(events))
@@ -1,162 +1,868 @@
+import hashlib
 import time
-import traceback
+
+from collections import Counter
 
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional, Set
 
+from db.archive import EventArchiver
+from db.bulk_writer import BulkUpdateBuffer, DEFAULT_FLUSH_SIZE, DEFAULT_FLUSH_INTERVAL
+from db.change_watcher import ChangeStreamWatcher
+from db.indexes import EVENT_QUERY_INDEX, PAYOUT_QUERY_INDEX, CONTRACT_ADDRESS_INDEX
+from db.market_rollups import MarketRollups, ROLLUP_RECORD_PROJECTION, ROLLED_UP_FIELD
 from db.mongo_interface import MongoInterface
+from db.price_feed import LatestPriceFeed
 from db.schemas.event_schemas import ContractInfoModel, ContractUpdateModel
+from db.settlement_journal import SettlementJournal
+from eth.contract_cache import ContractInterfaceCache
+from eth.errors import is_contract_error
 from eth.event_interfaces import EventContractInterface
+from eth.log_sync import EventLogSync
+from eth.multicall import MulticallReader
 from eth.provider.provider import Provider
+from eth.settlement import AsyncSettlementPipeline
+from utils.logger import get_logger
+from utils.metrics import PHASE_SECONDS, PHASE_FAILURES, BACKLOG_EVENTS, SETTLEMENT_LAG_SECONDS, \
+    SCHEDULED_DEADLINES, ROLLUP_MISMATCHES
+from utils.scheduler import DeadlineScheduler
+
+# Event record fields the updater reads, the full contract_abi and better address lists stay in Mongo
+EVENT_RECORD_PROJECTION = {"_id": 0, "contract_address": 1, "event_close": 1, "payout_close": 1}
+DEFAULT_FIND_BATCH_SIZE = 1000
+
+SETTLE_COMPLETED_PHASE = "settle_completed"
+REFRESH_ONGOING_PHASE = "refresh_ongoing"
+FINALIZE_PAYOUTS_PHASE = "finalize_payouts"
+ARCHIVE_FINISHED_PHASE = "archive_finished"
+
+# seconds between ongoing-event refreshes, unless the job config sets its own "refresh_interval"
+DEFAULT_REFRESH_INTERVAL = 86400 / 12
+DEFAULT_TEST_REFRESH_INTERVAL = 300
+
+# Settlement and payout checks are driven by per-contract deadlines, re-synced from Mongo on this interval
+RESYNC_TASK = "resync"
+EVENT_CLOSE_DEADLINE = "event_close"
+PAYOUT_CLOSE_DEADLINE = "payout_close"
+DEFAULT_RESYNC_INTERVAL = 600
+DEFAULT_TEST_RESYNC_INTERVAL = 60
+PAYOUT_RECHECK_DELAY = 60
+# seconds between moves of finished records out of the hot collections
+DEFAULT_ARCHIVE_INTERVAL = 3600
+DEFAULT_TEST_ARCHIVE_INTERVAL = 300
+# seconds between shard 0's checks of the rollups against a rebuild
+ROLLUP_CHECK_TASK = "rollup_check"
+DEFAULT_ROLLUP_CHECK_INTERVAL = 6 * 3600
+# phase label for deadline-driven settlement batches, which can span several job types
+MIXED_JOBS_LABEL = "mixed"
+
+logger = get_logger(__name__)
 
 
 class EventUpdaterJobs:
 
     def __init__(self, job_configs: List,
                  provider_handler: Provider,
-                 mongo_handler: MongoInterface):
+                 mongo_handler: MongoInterface,
+                 settlement_pipeline: AsyncSettlementPipeline,
+                 multicall_reader: Optional[MulticallReader] = None,
+                 contract_cache: Optional[ContractInterfaceCache] = None,
+                 price_feed: Optional[LatestPriceFeed] = None,
+                 log_sync: Optional[EventLogSync] = None,
+                 event_archiver: Optional[EventArchiver] = None,
+                 settlement_journal: Optional[SettlementJournal] = None,
+                 market_rollups: Optional[MarketRollups] = None,
+                 rollup_check_interval: Optional[float] = DEFAULT_ROLLUP_CHECK_INTERVAL,
+                 watch_new_events: bool = False,
+                 bulk_flush_size: int = DEFAULT_FLUSH_SIZE,
+                 bulk_flush_interval: Optional[float] = DEFAULT_FLUSH_INTERVAL,
+                 find_batch_size: Optional[int] = DEFAULT_FIND_BATCH_SIZE,
+                 shard_index: int = 0,
+                 shard_count: int = 1,
+                 stats_queue=None):
         self.job_configs = job_configs
         self.provider_handler = provider_handler
         self.mongo_handler = mongo_handler
+        if multicall_reader is None:
+            multicall_reader = MulticallReader(provider=provider_handler)
+        self.multicall_reader = multicall_reader
+        self.settlement_pipeline = settlement_pipeline
+        if contract_cache is None:
+            contract_cache = ContractInterfaceCache(provider=provider_handler, multicall_reader=multicall_reader)
+        self.contract_cache = contract_cache
+        if price_feed is None:
+            price_feed = LatestPriceFeed(mongo_handler=mongo_handler)
+        self.price_feed = price_feed
+        # Without a log sync every ongoing contract is re-read on each refresh
+        self.log_sync = log_sync
+        if event_archiver is None:
+            event_archiver = EventArchiver(mongo_handler=mongo_handler)
+        self.event_archiver = event_archiver
+        # Repeatedly failing contracts are quarantined here, the pipeline journals each settlement step
+        if settlement_journal is None:
+            settlement_journal = getattr(settlement_pipeline, "journal", None)
+        self.settlement_journal = settlement_journal
+        # Rollups need the fields they sum read with every record, the deltas come from the record as read
+        self.market_rollups = market_rollups
+        # None disables the periodic rollup check
+        self.rollup_check_interval = rollup_check_interval
+        self.record_projection = EVENT_RECORD_PROJECTION
+        if market_rollups is not None:
+            self.record_projection = {**EVENT_RECORD_PROJECTION, **ROLLUP_RECORD_PROJECTION}
+        # contract addresses whose record write failed in a flush triggered while queueing
+        self.failed_record_writes: Set[str] = set()
+        # New records are queued as they are inserted instead of waiting for the next resync
+        self.watch_new_events = watch_new_events
+        self.change_watchers: List[ChangeStreamWatcher] = []
+        self.bulk_flush_size = bulk_flush_size
+        self.bulk_flush_interval = bulk_flush_interval
+        self.find_batch_size = find_batch_size
+        # collection name -> pending record updates for that collection
+        self.update_buffers: Dict[str, BulkUpdateBuffer] = {}
+
+        self.scheduler = DeadlineScheduler()
+
+        # This worker only handles contracts whose address hashes to its shard
+        if not 0 <= shard_index < shard_count:
+            raise Exception(f"Invalid shard {shard_index} of {shard_count}")
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.stats_queue = stats_queue
+        self.throughput = Counter()
+
+        self.phases = {
+            SETTLE_COMPLETED_PHASE: self.__settle_completed_events,
+            REFRESH_ONGOING_PHASE: self.__refresh_ongoing_events,
+            FINALIZE_PAYOUTS_PHASE: self.__check_payout_status,
+            ARCHIVE_FINISHED_PHASE: self.__archive_finished_events,
+        }
 
     def job_runner(self, is_test: bool, run_indefinitely=True):
+        if is_test:
+            default_refresh_interval = DEFAULT_TEST_REFRESH_INTERVAL
+            resync_interval = DEFAULT_TEST_RESYNC_INTERVAL
+            archive_interval = DEFAULT_TEST_ARCHIVE_INTERVAL
+        else:
+            default_refresh_interval = DEFAULT_REFRESH_INTERVAL
+            resync_interval = DEFAULT_RESYNC_INTERVAL
+            archive_interval = DEFAULT_ARCHIVE_INTERVAL
+
+        # Every job type of the selected mode runs under the one scheduler, sharing provider and Mongo handles
+        job_indexes = [job_index for job_index, job in enumerate(self.job_configs)
+                       if job.get("is_test", False) == is_test]
+        if not job_indexes:
+            return
+
+        if self.watch_new_events:
+            self.__start_change_watchers(job_indexes=job_indexes)
+
+        self.scheduler.push(key=(RESYNC_TASK,), deadline=0)
+        for job_index in job_indexes:
+            self.scheduler.push(key=(REFRESH_ONGOING_PHASE, job_index), deadline=0)
+            self.scheduler.push(key=(ARCHIVE_FINISHED_PHASE, job_index), deadline=0)
+        if self.market_rollups is not None and self.rollup_check_interval and self.shard_index == 0:
+            self.scheduler.push(key=(ROLLUP_CHECK_TASK,), deadline=time.time() + self.rollup_check_interval)
+
         while run_indefinitely:
             try:
-                if not is_test:
-                    for job in self.job_configs:
-                        if job["job_type"] == "betting_event_6h":
-                            self.__update_event_job(job_config=job,
-                                                    provider_handler=self.provider_handler,
-                                                    mongo_handler=self.mongo_handler)
-                        elif job["job_type"] == "betting_event_12h":
-                            pass
-                        elif job["job_type"] == "betting_event_24h":
-                            pass
-
-                    print("Job runner sleeping for 2 hrs...")
-                    time.sleep(86400 / 12)
-                else:
-                    for job in self.job_configs:
-                        if job["job_type"] == "betting_event_test":
-                            self.__update_event_job(job_config=job,
-                                                    provider_handler=self.provider_handler,
-                                                    mongo_handler=self.mongo_handler)
-
-                    print("Job test runner sleeping for 5 min...")
-                    time.sleep(300)
+                due_tasks = self.scheduler.pop_due(now=time.time())
+                # (task kind, job index) -> asset -> contract addresses due for that task
+                due_contracts: Dict = {}
+                for key, payload in due_tasks:
+                    if key[0] == RESYNC_TASK:
+                        for job_index in job_indexes:
+                            job = self.job_configs[job_index]
+                            with PHASE_SECONDS.time(phase=RESYNC_TASK, job=job["job_type"]):
+                                self.__run_guarded(RESYNC_TASK, job["job_type"],
+                                                   lambda: self.__sync_deadlines(job_index=job_index))
+                        self.scheduler.push(key=key, deadline=time.time() + resync_interval)
+                    elif key[0] == REFRESH_ONGOING_PHASE:
+                        job = self.job_configs[key[1]]
+                        self.__run_guarded(REFRESH_ONGOING_PHASE, job["job_type"],
+                                           lambda: self.run_phase(phase=REFRESH_ONGOING_PHASE, job_config=job))
+                        refresh_interval = job.get("refresh_interval") or default_refresh_interval
+                        self.scheduler.push(key=key, deadline=time.time() + refresh_interval)
+                    elif key[0] == ARCHIVE_FINISHED_PHASE:
+                        job = self.job_configs[key[1]]
+                        self.__run_guarded(ARCHIVE_FINISHED_PHASE, job["job_type"],
+                                           lambda: self.run_phase(phase=ARCHIVE_FINISHED_PHASE, job_config=job))
+                        self.scheduler.push(key=key, deadline=time.time() + archive_interval)
+                    elif key[0] == ROLLUP_CHECK_TASK:
+                        self.__run_guarded(ROLLUP_CHECK_TASK, MIXED_JOBS_LABEL, self.check_rollups)
+                        self.scheduler.push(key=key, deadline=time.time() + self.rollup_check_interval)
+                    else:
+                        task_contracts = due_contracts.setdefault((key[0], payload["job_index"]), {})
+                        task_contracts.setdefault(payload["asset"], []).append(payload["contract_address"])
+
+                settle_groups = []
+                for (task_kind, job_index), contract_addresses in due_contracts.items():
+                    job = self.job_configs[job_index]
+                    if task_kind == EVENT_CLOSE_DEADLINE:
+                        settle_groups.extend([{"job_config": job, "job_index": job_index, "asset": asset,
+                                               "contract_addresses": asset_contract_addresses}
+                                              for asset, asset_contract_addresses in contract_addresses.items()])
+                    elif task_kind == PAYOUT_CLOSE_DEADLINE:
+                        with PHASE_SECONDS.time(phase=FINALIZE_PAYOUTS_PHASE, job=job["job_type"]):
+                            self.__run_guarded(FINALIZE_PAYOUTS_PHASE, job["job_type"],
+                                               lambda: self.__check_payout_status(
+                                                   job_config=job, job_index=job_index,
+                                                   contract_addresses=contract_addresses
+                                               ))
+
+                if settle_groups:
+                    settle_job_types = {settle_group["job_config"]["job_type"] for settle_group in settle_groups}
+                    settle_job_label = settle_job_types.pop() if len(settle_job_types) == 1 else MIXED_JOBS_LABEL
+                    with PHASE_SECONDS.time(phase=SETTLE_COMPLETED_PHASE, job=settle_job_label):
+                        self.__run_guarded(SETTLE_COMPLETED_PHASE, settle_job_label,
+                                           lambda: self.__settle_event_groups(settle_groups=settle_groups))
+
+                if due_tasks:
+                    logger.info(f"Contract cache stats: {self.contract_cache.stats()}")
+                    logger.info(f"Price feed stats: {self.price_feed.stats()}")
+                    self.__report_throughput()
+
+                SCHEDULED_DEADLINES.set(len(self.scheduler))
+                sleep_seconds = self.scheduler.next_deadline() - time.time()
+                logger.info(f"Job runner sleeping for {max(int(sleep_seconds), 0)} s, "
+                            f"{len(self.scheduler)} deadlines queued...")
+                self.scheduler.wait(timeout=sleep_seconds)
             except Exception as e:
-                print(e)
+                logger.exception(f"Job runner stopped: {e}")
                 run_indefinitely = False
 
+        for change_watcher in self.change_watchers:
+            change_watcher.stop()
+
         return
 
     @classmethod
-    def __update_event_job(cls, job_config, provider_handler, mongo_handler):
+    def __run_guarded(cls, phase, job_label, task):
+        # A failed run is logged and the loop goes on, deadline tasks it dropped are queued again by the next resync
+        try:
+            task()
+        except Exception as e:
+            logger.exception(f"{phase} failed for {job_label}: {e}")
+            PHASE_FAILURES.inc(phase=phase, job=job_label)
+
+    def __start_change_watchers(self, job_indexes):
+        # (collection, asset) -> job index, to route an inserted record to the job that owns it
+        collection_jobs = {}
+        for job_index in job_indexes:
+            for asset, params in self.job_configs[job_index]["params"].items():
+                collection_jobs[(params["collection_name"], asset)] = job_index
+
+        for collection_name in {collection_name for collection_name, _ in collection_jobs}:
+            self.change_watchers.append(ChangeStreamWatcher(
+                mongo_handler=self.mongo_handler,
+                collection_name=collection_name,
+                on_insert=lambda record, collection_name=collection_name: self.__register_new_event(
+                    collection_jobs=collection_jobs, collection_name=collection_name, record=record
+                ),
+                resume_key=f"{collection_name}:{self.shard_index}/{self.shard_count}"
+            ).start())
+
+    def __register_new_event(self, collection_jobs, collection_name, record):
+        job_index = collection_jobs.get((collection_name, record.get("asset_symbol")))
+        contract_address = record.get("contract_address")
+        if job_index is None or contract_address is None or record.get("event_close") is None \
+                or record.get("is_event_over") or not self.owns_contract(contract_address):
+            return
+
+        self.scheduler.push(key=(EVENT_CLOSE_DEADLINE, collection_name, contract_address),
+                            deadline=record["event_close"],
+                            payload={"job_index": job_index, "asset": record["asset_symbol"],
+                                     "contract_address": contract_address})
+        self.throughput["registered"] += 1
+
+    def __sync_deadlines(self, job_index):
+        # Queue every unsettled event at its event_close and every settled, unfinalized event at its payout_close
+        job_config = self.job_configs[job_index]
+        for asset in job_config["params"]:
+            collection_name = job_config["params"][asset]["collection_name"]
+            unsettled_event_records = self.__find_event_records(
+                collection_name=collection_name,
+                query={"is_event_over": False, "asset_symbol": asset}
+            )
+            now = time.time()
+            BACKLOG_EVENTS.set(sum(1 for record in unsettled_event_records if record["event_close"] < now),
+                               job=job_config["job_type"], asset=asset)
+            for record in unsettled_event_records:
+                self.scheduler.push(key=(EVENT_CLOSE_DEADLINE, collection_name, record["contract_address"]),
+                                    deadline=record["event_close"],
+                                    payload={"job_index": job_index, "asset": asset,
+                                             "contract_address": record["contract_address"]})
+                if self.market_rollups is not None and not record.get(ROLLED_UP_FIELD):
+                    # Inserted since the last resync, counted as open before its first refresh
+                    self.__queue_record_set(collection_name=collection_name,
+                                            current_contract_address=record["contract_address"],
+                                            fields={}, record=record, job_type=job_config["job_type"], asset=asset)
+            if self.market_rollups is not None:
+                self.__flush_event_record_updates(collection_name=collection_name)
+
+            unfinalized_event_records = self.__find_event_records(
+                collection_name=collection_name,
+                query={"is_event_over": True, "is_payout_period_over": {"$ne": True}, "asset_symbol": asset},
+                hint=PAYOUT_QUERY_INDEX
+            )
+            for record in unfinalized_event_records:
+                if record.get("payout_close") is None:
+                    continue
+                self.scheduler.push(key=(PAYOUT_CLOSE_DEADLINE, collection_name, record["contract_address"]),
+                                    deadline=record["payout_close"],
+                                    payload={"job_index": job_index, "asset": asset,
+                                             "contract_address": record["contract_address"]})
+
+            logger.info(f"Synced {len(unsettled_event_records)} event close and {len(unfinalized_event_records)} "
+                        f"payout close deadlines for {asset} {collection_name}")
+
+    def run_phase(self, phase, job_config):
+        if phase not in self.phases:
+            raise Exception(f"Invalid job phase {phase}")
+
+        with PHASE_SECONDS.time(phase=phase, job=job_config["job_type"]):
+            self.phases[phase](job_config=job_config)
+
+    def __settle_completed_events(self, job_config, contract_addresses: Optional[Dict[str, List[str]]] = None,
+                                  job_index: Optional[int] = None):
+        self.__settle_event_groups(settle_groups=[
+            {"job_config": job_config,
+             "job_index": job_index,
+             "asset": asset,
+             "contract_addresses": None if contract_addresses is None else contract_addresses[asset]}
+            for asset in job_config["params"]
+            if contract_addresses is None or asset in contract_addresses
+        ])
+
+    def __settle_event_groups(self, settle_groups: List[Dict]):
+        # Completed events of every job type and asset are settled as one batch
+        prepared_groups = []
+        for settle_group in settle_groups:
+            asset = settle_group["asset"]
+            collection_name = settle_group["job_config"]["params"][asset]["collection_name"]
+            try:
+                completed_event_query = {"is_event_over": False,
+                                         "event_close": {"$lt": datetime.now().timestamp()},
+                                         "asset_symbol": asset
+                                         }
+                completed_event_hint = EVENT_QUERY_INDEX
+                if settle_group["contract_addresses"] is not None:
+                    # Due contracts are looked up by address, not by scanning the asset's whole unsettled backlog
+                    completed_event_query["contract_address"] = {"$in": settle_group["contract_addresses"]}
+                    completed_event_hint = CONTRACT_ADDRESS_INDEX
+                completed_event_records = self.__find_event_records(
+                    collection_name=collection_name,
+                    query=completed_event_query,
+                    hint=completed_event_hint
+                )
+                logger.info(
+                    f"Found {len(completed_event_records)} {asset} {collection_name} "
+                    f"completed events to be updated... "
+                )
+                completed_event_records = self.__skip_quarantined(collection_name=collection_name, asset=asset,
+                                                                  records=completed_event_records)
+                if not completed_event_records:
+                    continue
+
+                # One price read covers the whole group, a stale price leaves the group for the next deadline
+                try:
+                    current_asset_price = self.price_feed.get_price(asset_symbol=asset)
+                except Exception as e:
+                    logger.warning(f"Not settling {asset} {collection_name} events: {e}")
+                    continue
+
+                completed_event_interfaces = self.__get_interfaces_isolated(collection_name=collection_name,
+                                                                            records=completed_event_records)
+
+                completed_events = []
+                for event_contract_interface in completed_event_interfaces:
+                    completed_events.append({"contract_address": event_contract_interface.w3_contract_handle.address,
+                                             "contract_abi": event_contract_interface.w3_contract_handle.abi,
+                                             "price_at_close": current_asset_price,
+                                             "collection_name": collection_name})
+
+                prepared_groups.append({**settle_group,
+                                        "collection_name": collection_name,
+                                        "payout_closes": {record["contract_address"]: record.get("payout_close")
+                                                          for record in completed_event_records},
+                                        "event_closes": {record["contract_address"]: record["event_close"]
+                                                         for record in completed_event_records},
+                                        "records": {record["contract_address"]: record
+                                                    for record in completed_event_records},
+                                        "interfaces": completed_event_interfaces,
+                                        "events": completed_events})
+            except Exception as e:
+                logger.exception(f"Error: {e}")
+                raise e
+
+        completed_events = [event for prepared_group in prepared_groups for event in prepared_group["events"]]
+        if not completed_events:
+            return
+        settlement_results = self.settlement_pipeline.settle_sync(completed_events)
+        self.throughput["settled"] += sum(1 for result in settlement_results if result["error"] is None)
+        self.throughput["settle_failed"] += sum(1 for result in settlement_results if result["error"] is not None)
+
+        results_offset = 0
+        for prepared_group in prepared_groups:
+            asset = prepared_group["asset"]
+            collection_name = prepared_group["collection_name"]
+            group_results = settlement_results[results_offset:results_offset + len(prepared_group["events"])]
+            results_offset += len(prepared_group["events"])
+            for result in group_results:
+                if result["error"] is not None and result.get("contract_error"):
+                    self.__record_contract_failure(collection_name, result["contract_address"], result["error"])
+            try:
+                settled_event_interfaces = [interface
+                                            for interface, result in zip(prepared_group["interfaces"], group_results)
+                                            if result["error"] is None]
+                if not settled_event_interfaces:
+                    continue
+
+                settled_at = time.time()
+                for interface in settled_event_interfaces:
+                    event_close = prepared_group["event_closes"].get(interface.w3_contract_handle.address)
+                    if event_close is not None:
+                        SETTLEMENT_LAG_SECONDS.observe(settled_at - event_close,
+                                                       job=prepared_group["job_config"]["job_type"], asset=asset)
+
+                settled_event_statuses = self.__read_isolated(
+                    collection_name=collection_name,
+                    items=settled_event_interfaces,
+                    read_many=lambda interfaces: EventContractInterface.check_contract_status_many(
+                        interfaces=interfaces,
+                        multicall_reader=self.multicall_reader
+                    ),
+                    get_address=self.__get_interface_address
+                )
+                settled_event_stats = self.__read_isolated(
+                    collection_name=collection_name,
+                    items=settled_event_interfaces,
+                    read_many=lambda interfaces: EventContractInterface.check_event_stats_many(
+                        interfaces=interfaces,
+                        multicall_reader=self.multicall_reader
+                    ),
+                    get_address=self.__get_interface_address
+                )
+
+                written_addresses = []
+                failed_addresses = set()
+                for contract_address, event_status in settled_event_statuses.items():
+                    if event_status["is_event_over"] and contract_address in settled_event_stats:
+                        contract_record_updates = settled_event_stats[contract_address]
+                        contract_record_updates["is_event_over"] = event_status["is_event_over"]
+
+                        failed_addresses |= self.__queue_event_record_update(
+                            collection_name=collection_name,
+                            current_contract_address=contract_address,
+                            current_contract_info=contract_record_updates,
+                            record=prepared_group["records"].get(contract_address),
+                            job_type=prepared_group["job_config"]["job_type"],
+                            asset=asset
+                        )
+                        written_addresses.append(contract_address)
+
+                        payout_close = prepared_group["payout_closes"].get(contract_address)
+                        if prepared_group["job_index"] is not None and payout_close is not None:
+                            self.scheduler.push(
+                                key=(PAYOUT_CLOSE_DEADLINE, collection_name, contract_address),
+                                deadline=payout_close,
+                                payload={"job_index": prepared_group["job_index"], "asset": asset,
+                                         "contract_address": contract_address}
+                            )
+
+                failed_addresses |= self.__flush_event_record_updates(collection_name=collection_name)
+                if self.settlement_journal is not None:
+                    self.settlement_journal.mark_written([address for address in written_addresses
+                                                          if address not in failed_addresses])
+
+            except Exception as e:
+                logger.exception(f"Error: {e}")
+                raise e
+
+        return
+
+    def __skip_quarantined(self, collection_name, asset, records: List[Dict]) -> List[Dict]:
+        if self.settlement_journal is None or not records:
+            return records
+        quarantined = self.settlement_journal.get_quarantined([record["contract_address"] for record in records])
+        if not quarantined:
+            return records
+        logger.warning(f"Skipping {len(quarantined)} quarantined {asset} {collection_name} events")
+        return [record for record in records if record["contract_address"] not in quarantined]
+
+    @classmethod
+    def __get_interface_address(cls, interface: EventContractInterface) -> str:
+        return interface.w3_contract_handle.address
+
+    def __get_interfaces_isolated(self, collection_name, records: List[Dict]) -> List[EventContractInterface]:
+        # A record whose ABI is missing or unusable is left out, instead of failing the whole group
+        return list(self.__read_isolated(
+            collection_name=collection_name,
+            items=records,
+            read_many=lambda item_records: {
+                interface.w3_contract_handle.address: interface
+                for interface in self.contract_cache.get_interfaces(
+                    records=item_records,
+                    abi_loader=lambda addresses: self.__load_contract_abis(collection_name, addresses)
+                )
+            },
+            get_address=lambda record: record["contract_address"]
+        ).values())
+
+    def __record_contract_failure(self, collection_name, contract_address, error):
+        # Only failures of the contract itself are counted, an RPC outage would otherwise quarantine every contract
+        if self.settlement_journal is None:
+            return
+        if self.settlement_journal.record_failure(contract_address, str(error), collection_name=collection_name):
+            logger.warning(f"Event {contract_address} quarantined after repeated failures: {error}",
+                           extra={"contract_address": contract_address, "collection_name": collection_name})
+            self.throughput["quarantined"] += 1
+
+    @classmethod
+    def __log_read_failure(cls, collection_name, contract_address, error):
+        logger.warning(f"Leaving out {collection_name} event {contract_address}, its contract could not be read: "
+                       f"{error}", extra={"contract_address": contract_address, "collection_name": collection_name})
+
+    def __read_isolated(self, collection_name, items: List, read_many, get_address) -> Dict:
+        # Contracts a ContractError names are dropped and the rest read again, otherwise each is read alone
+        if not items:
+            return {}
+        try:
+            return read_many(items)
+        except Exception as e:
+            if not is_contract_error(e):
+                raise e
+            error = e
+
+        failed_addresses = {address.lower() for address in getattr(error, "contract_addresses", [])}
+        if failed_addresses:
+            remaining_items = []
+            for item in items:
+                if get_address(item).lower() in failed_addresses:
+                    self.__log_read_failure(collection_name, get_address(item), error)
+                else:
+                    remaining_items.append(item)
+            if not remaining_items:
+                return {}
+            try:
+                return read_many(remaining_items)
+            except Exception as e:
+                if not is_contract_error(e):
+                    raise e
+                items = remaining_items
+        elif len(items) == 1:
+            self.__log_read_failure(collection_name, get_address(items[0]), error)
+            return {}
+
+        logger.warning(f"Batched read of {len(items)} {collection_name} contracts failed, reading one by one: {error}")
+        results = {}
+        for item in items:
+            try:
+                results.update(read_many([item]))
+            except Exception as e:
+                if not is_contract_error(e):
+                    raise e
+                self.__log_read_failure(collection_name, get_address(item), e)
+
+        return results
+
+    def __check_payout_status(self, job_config, job_index: Optional[int] = None,
+                              contract_addresses: Optional[Dict[str, List[str]]] = None):
+        # Verified in one multicall, destroyed concurrently and marked in one flush
+        finalize_groups = []
+        for asset in job_config["params"]:
+            if contract_addresses is not None and asset not in contract_addresses:
+                continue
+            collection_name = job_config["params"][asset]["collection_name"]
+            try:
+                unfinalized_event_query = {"is_event_over": True,
+                                           "is_payout_period_over": {"$ne": True},
+                                           "payout_close": {"$lt": datetime.now().timestamp()},
+                                           "asset_symbol": asset}
+                unfinalized_event_hint = PAYOUT_QUERY_INDEX
+                if contract_addresses is not None:
+                    unfinalized_event_query["contract_address"] = {"$in": contract_addresses[asset]}
+                    unfinalized_event_hint = CONTRACT_ADDRESS_INDEX
+                unfinalized_event_records = self.__find_event_records(
+                    collection_name=collection_name,
+                    query=unfinalized_event_query,
+                    hint=unfinalized_event_hint
+                )
+                unfinalized_event_records = self.__skip_quarantined(collection_name=collection_name, asset=asset,
+                                                                    records=unfinalized_event_records)
+                if not unfinalized_event_records:
+                    continue
+
+                event_interfaces = self.__get_interfaces_isolated(collection_name=collection_name,
+                                                                  records=unfinalized_event_records)
+                event_statuses = self.__read_isolated(
+                    collection_name=collection_name,
+                    items=event_interfaces,
+                    read_many=lambda interfaces: EventContractInterface.check_contract_status_many(
+                        interfaces=interfaces,
+                        multicall_reader=self.multicall_reader
+                    ),
+                    get_address=self.__get_interface_address
+                )
+
+                payout_over_interfaces = []
+                for event_interface in event_interfaces:
+                    contract_address = event_interface.w3_contract_handle.address
+                    if contract_address not in event_statuses:
+                        continue
+                    if event_statuses[contract_address]["is_payout_period_over"]:
+                        payout_over_interfaces.append(event_interface)
+                    elif job_index is not None:
+                        # payout_close passed by the wall clock but not yet by block time
+                        self.scheduler.push(key=(PAYOUT_CLOSE_DEADLINE, collection_name, contract_address),
+                                            deadline=time.time() + PAYOUT_RECHECK_DELAY,
+                                            payload={"job_index": job_index, "asset": asset,
+                                                     "contract_address": contract_address})
+
+                if payout_over_interfaces:
+                    finalize_groups.append({"collection_name": collection_name,
+                                            "asset": asset,
+                                            "records": {record["contract_address"]: record
+                                                        for record in unfinalized_event_records},
+                                            "interfaces": payout_over_interfaces})
+
+            except Exception as e:
+                logger.exception(f"Error: {e}")
+                raise e
+
+        finalize_events = [{"contract_address": event_interface.w3_contract_handle.address,
+                            "contract_abi": event_interface.w3_contract_handle.abi}
+                           for finalize_group in finalize_groups for event_interface in finalize_group["interfaces"]]
+        if not finalize_events:
+            return
+        logger.info(f"Finalizing {len(finalize_events)} events past payout close...")
+        finalize_results = {result["contract_address"]: result
+                            for result in self.settlement_pipeline.finalize_sync(finalize_events)}
+
+        for finalize_group in finalize_groups:
+            collection_name = finalize_group["collection_name"]
+            for event_interface in finalize_group["interfaces"]:
+                contract_address = event_interface.w3_contract_handle.address
+                finalize_result = finalize_results[contract_address]
+                if finalize_result["error"] is not None:
+                    # Left unfinalized, the next resync queues it again
+                    self.throughput["finalize_failed"] += 1
+                    if finalize_result.get("contract_error"):
+                        self.__record_contract_failure(collection_name, contract_address, finalize_result["error"])
+                    continue
+                self.__queue_record_set(collection_name=collection_name,
+                                        current_contract_address=contract_address,
+                                        fields={"is_payout_period_over": True},
+                                        record=finalize_group["records"].get(contract_address),
+                                        job_type=job_config["job_type"],
+                                        asset=finalize_group["asset"])
+                self.throughput["payout_closed"] += 1
+
+            self.__flush_event_record_updates(collection_name=collection_name)
+
+        return
+
+    def __refresh_ongoing_events(self, job_config):
         for asset in job_config["params"]:
             try:
                 params = job_config['params'][asset]
-                completed_to_be_updated_event_records = mongo_handler.find(
-                    collection=params["collection_name"],
+                ongoing_event_records = self.__find_event_records(
+                    collection_name=params["collection_name"],
                     query={"is_event_over": False,
-                           "event_close": {"$lt": datetime.now().timestamp()},
+                           "event_close": {"$gt": datetime.now().timestamp()},
                            "asset_symbol": asset
                            }
                 )
-                print(
-                    f"Found {len(list(completed_to_be_updated_event_records.clone()))} {asset} {params['collection_name']} "
-                    f"completed events to be updated... "
 
-                )
-                for event_info in completed_to_be_updated_event_records:
-                    event_contract_interface = EventContractInterface(provider=provider_handler,
-                                                                      contract_address=event_info["contract_address"],
-                                                                      contract_abi=event_info["contract_abi"])
+                if not ongoing_event_records:
+                    logger.info(f"No ongoing {params['collection_name']} {asset} events found")
+                    continue
+                logger.info(f"Found {len(ongoing_event_records)} ongoing {asset} {params['collection_name']} events")
 
-                    current_asset_price = cls._get_current_asset_price(mongo_handler=mongo_handler, asset_symbol=asset)
-                    event_contract_interface.event_completion_operations(price_at_close=current_asset_price)
+                log_scan = None
+                if self.log_sync is not None:
+                    # Only contracts with logs since the last confirmed sweep are read again
+                    log_scan = self.log_sync.scan(
+                        sync_key=f"{params['collection_name']}:{asset}:{self.shard_index}/{self.shard_count}",
+                        contract_addresses=[record["contract_address"] for record in ongoing_event_records]
+                    )
+                    if log_scan["active_addresses"] is not None:
+                        ongoing_event_records = [record for record in ongoing_event_records
+                                                 if record["contract_address"] in log_scan["active_addresses"]]
+                        logger.info(f"{len(ongoing_event_records)} {asset} {params['collection_name']} events active "
+                                    f"up to block {log_scan['to_block']}")
 
-                    event_status = event_contract_interface.check_contract_status()
+                # Active contracts left unread or unwritten stay active for the next scan
+                unsynced_addresses = {record["contract_address"].lower() for record in ongoing_event_records}
+                ongoing_event_records = self.__skip_quarantined(collection_name=params["collection_name"], asset=asset,
+                                                                records=ongoing_event_records)
+                if ongoing_event_records:
+                    ongoing_event_interfaces = self.__get_interfaces_isolated(
+                        collection_name=params["collection_name"],
+                        records=ongoing_event_records
+                    )
+                    ongoing_event_stats = self.__read_isolated(
+                        collection_name=params["collection_name"],
+                        items=ongoing_event_interfaces,
+                        read_many=lambda interfaces: EventContractInterface.check_event_stats_many(
+                            interfaces=interfaces,
+                            multicall_reader=self.multicall_reader
+                        ),
+                        get_address=self.__get_interface_address
+                    )
+                    self.throughput["refreshed"] += len(ongoing_event_stats)
+                    ongoing_records = {record["contract_address"]: record for record in ongoing_event_records}
+                    failed_addresses = set()
+                    for contract_address, contract_record_updates in ongoing_event_stats.items():
+                        failed_addresses |= self.__queue_event_record_update(
+                            collection_name=params["collection_name"],
+                            current_contract_address=contract_address,
+                            current_contract_info=contract_record_updates,
+                            record=ongoing_records.get(contract_address),
+                            job_type=job_config["job_type"],
+                            asset=asset
+                        )
 
-                    if event_status["is_event_over"]:
-                        contract_record_updates = event_contract_interface.check_event_stats()
-                        contract_record_updates["is_event_over"] = event_status["is_event_over"]
+                    failed_addresses |= self.__flush_event_record_updates(collection_name=params["collection_name"])
+                    unsynced_addresses -= {contract_address.lower() for contract_address in ongoing_event_stats
+                                           if contract_address not in failed_addresses}
 
-                        contract_address = event_info["contract_address"]
-
-                        record_updated = cls.__update_event_record(mongo_handler=mongo_handler,
-                                                                   collection_name=params["collection_name"],
-                                                                   current_contract_address=contract_address,
-                                                                   current_contract_info=contract_record_updates,
-                                                                   asset_symbol=asset)
-                        if record_updated:
-                            print(f"Event {params['collection_name']} {asset} {contract_address} record updated")
-
-                    ongoing_event_records = mongo_handler.find(
-                        collection=params["collection_name"],
-                        query={"is_event_over": False,
-                               "event_close": {"$gt": datetime.now().timestamp()},
-                               "asset_symbol": asset
-                               }
-                    )
+                if log_scan is not None:
+                    self.log_sync.commit(log_scan=log_scan, unsynced_addresses=unsynced_addresses)
 
-                    if len(list(ongoing_event_records.clone())) == 0:
-                        print(f"No ongoing {params['collection_name']} {asset} events found")
-                    else:
-                        for ongoing_event_info in ongoing_event_records:
-                            contract_address = ongoing_event_info["contract_address"]
-                            contract_abi = ongoing_event_info["contract_abi"]
-                            event_contract_interface = EventContractInterface(provider=provider_handler,
-                                                                              contract_address=contract_address,
-                                                                              contract_abi=contract_abi)
-                            contract_record_updates = event_contract_interface.check_event_stats()
-
-                            record_updated = cls.__update_event_record(mongo_handler=mongo_handler,
-                                                                       collection_name=params["collection_name"],
-                                                                       current_contract_address=contract_address,
-                                                                       current_contract_info=contract_record_updates,
-                                                                       asset_symbol=asset)
-
-                            if record_updated:
-                                print(f"Event {params['collection_name']} {asset} {contract_address} record updated")
+            except Exception as e:
+                logger.exception(f"Error: {e}")
+                raise e
+
+        return
+
+    def __archive_finished_events(self, job_config):
+        # Archival moves whole records rather than owned contracts, one shard does it for all
+        if self.shard_index != 0:
+            return
 
+        for asset in job_config["params"]:
+            collection_name = job_config["params"][asset]["collection_name"]
+            try:
+                archive_result = self.event_archiver.archive(collection_name=collection_name,
+                                                             query={"asset_symbol": asset})
+                self.throughput["archived"] += archive_result["archived"]
             except Exception as e:
-                print(f"Error: {traceback.format_exc()}")
+                logger.exception(f"Error: {e}")
                 raise e
 
         return
 
-    @classmethod
-    def __update_event_record(cls,
-                              mongo_handler,
-                              collection_name,
-                              current_contract_address,
-                              current_contract_info,
-                              asset_symbol):
-        update_record = ContractUpdateModel(**current_contract_info)
-        update_result = mongo_handler.update(collection=collection_name,
-                                             query={"contract_address": current_contract_address},
-                                             document={"$set": update_record.dict()})
+    def check_rollups(self) -> Optional[int]:
+        # Counters that differ, None when the check could not run
+        try:
+            mismatches = self.market_rollups.rebuild(job_configs=self.job_configs, check_only=True)
+        except Exception as e:
+            logger.warning(f"Rollup check failed: {e}")
+            return None
 
-        if update_result.acknowledged:
-            print(f"Event {collection_name} {asset_symbol} record updated")
-        else:
-            print(f"Event {collection_name} {asset_symbol} record update failed")
-            raise Exception("Event record update failed")
+        # Other shards may be between a record write and its $inc, drift is a mismatch that outlasts a check
+        for mismatch in mismatches:
+            logger.warning(f"Rollup {mismatch['_id']} {mismatch['field']}: rebuilt {mismatch['expected']}, "
+                           f"incremental {mismatch['actual']}", extra=mismatch)
+        if mismatches:
+            logger.warning(f"{len(mismatches)} rollup counters drifted, run rebuild_rollups.py with the updaters "
+                           f"stopped to repair them")
+        ROLLUP_MISMATCHES.set(len(mismatches))
+
+        return len(mismatches)
+
+    def owns_contract(self, contract_address) -> bool:
+        # sha1 rather than hash(), so every worker process agrees on the owner of an address
+        address_hash = int(hashlib.sha1(contract_address.lower().encode()).hexdigest(), 16)
+        return address_hash % self.shard_count == self.shard_index
+
+    def __find_event_records(self, collection_name, query, hint=EVENT_QUERY_INDEX) -> List[Dict]:
+        # ABIs and better address lists are left out, ABIs are loaded only for uncached contracts
+        event_records = self.mongo_handler.find(collection=collection_name,
+                                                query=query,
+                                                projection=self.record_projection,
+                                                batch_size=self.find_batch_size,
+                                                hint=hint)
+        if self.shard_count == 1:
+            return list(event_records)
+
+        return [record for record in event_records if self.owns_contract(record["contract_address"])]
+
+    def __report_throughput(self):
+        if self.stats_queue is None or not self.throughput:
+            return
+
+        self.stats_queue.put({"shard_index": self.shard_index, "timestamp": time.time(), **self.throughput})
+        self.throughput.clear()
+
+    def __load_contract_abis(self, collection_name, contract_addresses) -> Dict[str, List]:
+        # Grouping by ABI sends each distinct ABI over the wire once, however many contracts share it
+        abi_groups = self.mongo_handler.aggregate(collection=collection_name, pipeline=[
+            {"$match": {"contract_address": {"$in": contract_addresses}}},
+            {"$group": {"_id": {"contract_abi": "$contract_abi"},
+                        "contract_addresses": {"$push": "$contract_address"}}}
+        ])
 
-        return update_result.acknowledged
+        contract_abis = {}
+        for abi_group in abi_groups:
+            for contract_address in abi_group["contract_addresses"]:
+                contract_abis[contract_address] = abi_group["_id"]["contract_abi"]
+
+        return contract_abis
+
+    def __get_update_buffer(self, collection_name) -> BulkUpdateBuffer:
+        if collection_name not in self.update_buffers:
+            self.update_buffers[collection_name] = BulkUpdateBuffer(mongo_handler=self.mongo_handler,
+                                                                    collection=collection_name,
+                                                                    flush_size=self.bulk_flush_size,
+                                                                    flush_interval=self.bulk_flush_interval)
+        return self.update_buffers[collection_name]
 
     @classmethod
-    def _get_current_asset_price(cls, mongo_handler, asset_symbol):
-        if asset_symbol == "BTC":
-            mongo_response = mongo_handler.find_one_sorted(collection='btc_live_price',
-                                                           query=[("timestamp", -1)])
-            return mongo_response['price']
-        elif asset_symbol == "ETH":
-            mongo_response = mongo_handler.find_one_sorted(collection='eth_live_price',
-                                                           query=[("timestamp", -1)])
-            return mongo_response['price']
-        else:
-            raise Exception("Invalid asset symbol")
+    def __report_flush_result(cls, collection_name, flush_result) -> Set[str]:
+        logger.info(f"Event {collection_name} bulk update matched {flush_result['matched']} "
+                    f"modified {flush_result['modified']} records")
+        for write_error in flush_result["errors"]:
+            logger.warning(f"Event {collection_name} record update failed for {write_error['query']}: "
+                           f"{write_error['error']}")
+
+        return {write_error["query"]["contract_address"] for write_error in flush_result["errors"]}
+
+    def __queue_record_set(self, collection_name, current_contract_address, fields,
+                           record: Optional[Dict] = None, job_type=None, asset=None) -> Set[str]:
+        # Returns the contract addresses whose update failed, when the add triggered a flush
+        if self.market_rollups is not None and record is not None:
+            fields = self.market_rollups.track(job_type=job_type, asset=asset, record=record, fields=fields)
+        if not fields:
+            return set()
+        flush_result = self.__get_update_buffer(collection_name).add(
+            query={"contract_address": current_contract_address},
+            document={"$set": fields}
+        )
+        if flush_result is None:
+            return set()
+        failed_addresses = self.__report_flush_result(collection_name, flush_result)
+        if self.market_rollups is not None:
+            self.failed_record_writes |= failed_addresses
+        return failed_addresses
+
+    def __queue_event_record_update(self, collection_name, current_contract_address, current_contract_info,
+                                    record: Optional[Dict] = None, job_type=None, asset=None) -> Set[str]:
+        update_record = ContractUpdateModel(**current_contract_info)
+        # Only fields read from the chain are written, so a stats refresh never clears is_event_over
+        return self.__queue_record_set(collection_name=collection_name,
+                                       current_contract_address=current_contract_address,
+                                       fields=update_record.model_dump(exclude_unset=True),
+                                       record=record, job_type=job_type, asset=asset)
+
+    def __flush_event_record_updates(self, collection_name) -> Set[str]:
+        flush_result = self.__get_update_buffer(collection_name).flush()
+        failed_addresses = self.__report_flush_result(collection_name, flush_result)
+        if self.market_rollups is not None:
+            # Deltas land only for records whose write did, a failed record is counted on its next update
+            self.market_rollups.apply(failed_addresses=failed_addresses | self.failed_record_writes)
+            self.failed_record_writes.clear()
+        return failed_addresses
 
 
 class EventDataJobs:
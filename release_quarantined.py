@@ -0,0 +1,61 @@
+"""
+List the contracts the settlement journal has quarantined, or release them so the next sweep settles them again.
+Release a contract once whatever made it fail (a bad ABI, a revert in the contract) is fixed. Run from the repo root:
+
+    python release_quarantined.py --list
+    python release_quarantined.py 0xabc... 0xdef...
+    python release_quarantined.py --all
+"""
+import argparse
+
+from dotenv import dotenv_values, find_dotenv
+
+from db.mongo_interface import MongoInterface
+from db.settlement_journal import SettlementJournal
+from utils.logger import get_logger
+
+config = dotenv_values(dotenv_path=find_dotenv())
+
+logger = get_logger(__name__)
+
+
+def release_quarantined(contract_addresses, release_all: bool, list_only: bool) -> int:
+    mongo_handler = MongoInterface(db_name=config['MONGO_DB_NAME'],
+                                   connection_url=config['MONGO_DB_CONNECTION_STRING'])
+    settlement_journal = SettlementJournal(mongo_handler=mongo_handler)
+
+    entries = settlement_journal.get_quarantined_entries()
+    if list_only:
+        for entry in entries:
+            logger.info(f"Quarantined {entry.get('collection_name')} event {entry['_id']} after {entry['attempts']} "
+                        f"attempts: {entry.get('last_error')}")
+        logger.info(f"{len(entries)} contracts quarantined")
+        return 0
+
+    if release_all:
+        contract_addresses = [entry["_id"] for entry in entries]
+
+    unknown_addresses = []
+    for contract_address in contract_addresses:
+        if settlement_journal.release(contract_address):
+            logger.info(f"Released {contract_address}")
+        else:
+            unknown_addresses.append(contract_address)
+    if unknown_addresses:
+        logger.warning(f"No journal entry for {unknown_addresses}")
+
+    return len(unknown_addresses)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Release contracts quarantined by the settlement journal")
+    parser.add_argument("contract_addresses", nargs="*", help="contracts to release")
+    parser.add_argument("--all", action="store_true", help="release every quarantined contract")
+    parser.add_argument("--list", action="store_true", help="list the quarantined contracts without releasing")
+    args = parser.parse_args()
+
+    if not (args.list or args.all or args.contract_addresses):
+        parser.error("give contract addresses, --all or --list")
+
+    raise SystemExit(1 if release_quarantined(args.contract_addresses, release_all=args.all,
+                                              list_only=args.list) else 0)
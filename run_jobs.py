@@ -1,78 +1,243 @@
+import json
 import multiprocessing
+import queue
+import time
+
+from collections import Counter
 from dotenv import dotenv_values, find_dotenv
 
+from eth.log_sync import EventLogSync, DEFAULT_CONFIRMATIONS, DEFAULT_BLOCK_CHUNK_SIZE
+from eth.multicall import MulticallReader, DEFAULT_BATCH_SIZE
+from eth.provider.async_provider import AsyncProvider
+from eth.provider.pool import DEFAULT_HEDGE_DELAY, get_max_workers
 from eth.provider.provider import Provider
-
+from eth.provider.session import build_http_session, DEFAULT_POOL_SIZE, DEFAULT_MAX_RETRIES, \
+    DEFAULT_REQUEST_TIMEOUT
+from eth.receipt_tracker import ReceiptTracker, DEFAULT_POLL_INTERVAL
+from eth.settlement import AsyncSettlementPipeline, DEFAULT_MAX_CONCURRENCY
+
+from db.archive import EventArchiver
+from db.bulk_writer import DEFAULT_FLUSH_SIZE, DEFAULT_FLUSH_INTERVAL
+from db.indexes import bootstrap_indexes
+from db.market_rollups import MarketRollups, DEFAULT_BUCKET_SECONDS
 from db.mongo_interface import MongoInterface
-from jobs import EventUpdaterJobs
+from db.price_feed import LatestPriceFeed, DEFAULT_PRICE_COLLECTIONS, DEFAULT_PRICE_TTL, \
+    DEFAULT_MAX_PRICE_STALENESS
+from db.settlement_journal import SettlementJournal, DEFAULT_MAX_ATTEMPTS
+from jobs import EventUpdaterJobs, DEFAULT_ROLLUP_CHECK_INTERVAL
+from utils.job_registry import load_job_registry
+from utils.logger import get_logger
+from utils.metrics import start_metrics_server
 
 # Load environment variables
 config = dotenv_values(dotenv_path=find_dotenv())
 
+SUPERVISOR_REPORT_INTERVAL = 60
+WORKER_RESTART_DELAY = 10
+
+logger = get_logger(__name__)
+
+
+def load_shard_wallets():
+    # SHARD_WALLETS is a JSON list of {"address", "private_key"}, one worker process per wallet
+    if config.get('SHARD_WALLETS'):
+        return [(wallet['address'], wallet['private_key']) for wallet in json.loads(config['SHARD_WALLETS'])]
+
+    return [(config['WALLET_ADDRESS'], config['WALLET_PRIVATE_KEY'])]
+
+
+def event_updater_worker(shard_index=0, shard_count=1, wallet_address=None, wallet_private_key=None,
+                         stats_queue=None):
+    wallet_address = wallet_address or config['WALLET_ADDRESS']
+    wallet_private_key = wallet_private_key or config['WALLET_PRIVATE_KEY']
+    logger.info(f"Starting updater shard {shard_index + 1}/{shard_count} with wallet {wallet_address}")
 
-def event_updater_worker():
+    # Each shard serves its own /metrics, on METRICS_PORT + shard index
+    if config.get('METRICS_PORT'):
+        metrics_port = int(config['METRICS_PORT']) + shard_index
+        start_metrics_server(port=metrics_port)
+        logger.info(f"Serving metrics on port {metrics_port}")
+
+    # Alchemy, Infura and any extra RPC_URLS (comma separated) form one failover pool
+    provider_urls = [url for url in [config.get('ALCHEMY_SEPOLIA_URL'), config.get('INFURA_SEPOLIA_URL')]
+                     + (config.get('RPC_URLS') or "").split(",") if url]
+    request_timeout = float(config.get('RPC_TIMEOUT') or DEFAULT_REQUEST_TIMEOUT)
+    # Every pool worker, the sweep thread and the receipt tracker can hold a connection at once
+    pool_size = max(int(config.get('RPC_POOL_SIZE') or DEFAULT_POOL_SIZE), get_max_workers(len(provider_urls)) + 2)
+    session = build_http_session(pool_size=pool_size,
+                                 max_retries=int(config.get('RPC_MAX_RETRIES') or DEFAULT_MAX_RETRIES),
+                                 gzip=(config.get('RPC_GZIP') or "true").lower() == "true")
     try:
-        print("Connecting to Alchemy RPC...")
-        provider = Provider(provider_url=config['ALCHEMY_SEPOLIA_URL'],
-                            wallet_address=config['WALLET_ADDRESS'],
-                            wallet_private_key=config['WALLET_PRIVATE_KEY'])
+        logger.info(f"Connecting to {len(provider_urls)} RPC endpoints...")
+        provider = Provider(provider_url=None,
+                            wallet_address=wallet_address,
+                            wallet_private_key=wallet_private_key,
+                            provider_urls=provider_urls,
+                            hedge_delay=float(config.get('RPC_HEDGE_DELAY') or DEFAULT_HEDGE_DELAY),
+                            session=session,
+                            request_timeout=request_timeout)
         if not provider.get_is_connected():
-            raise Exception("Unable to connect to Alchemy RPC...")
+            raise Exception("Unable to connect to any RPC endpoint...")
     except Exception as e:
-        print(e)
-        print("Using Infura RPC instead...")
-        try:
-            provider = Provider(provider_url=config['INFURA_SEPOLIA_URL'],
-                                wallet_address=config['WALLET_ADDRESS'],
-                                wallet_private_key=config['WALLET_PRIVATE_KEY'])
-            if not provider.get_is_connected():
-                raise Exception("Unable to connect to Alchemy RPC...")
-        except Exception as e:
-            print(e)
-            print("Exiting...")
-            return
+        logger.error(e)
+        logger.error("Exiting...")
+        return
 
     mongo_handler = MongoInterface(db_name=config['MONGO_DB_NAME'],
                                    connection_url=config['MONGO_DB_CONNECTION_STRING'])
-    job_configs = [
-        {
-            "job_type": "betting_event_6h",
-            "params": {"BTC": {"collection_name": "event_contracts_6h"},
-                       "ETH": {"collection_name": "event_contracts_6h"}
-                       }
-        },
-        {
-            "job_type": "betting_event_test",
-            "params": {
-                "BTC": {"collection_name": "event_contracts_test"},
-                "ETH": {"collection_name": "event_contracts_test"}
-            }
-        }
-    ]
+    job_registry = load_job_registry(config)
+    job_configs = job_registry.get_job_configs()
+    logger.info(f"Loaded job types: {job_registry.get_job_types()}")
+    price_collections = job_registry.get_price_collections() or DEFAULT_PRICE_COLLECTIONS
+
+    bootstrap_indexes(mongo_handler=mongo_handler,
+                      event_collections=job_registry.get_collections(),
+                      price_collections=list(price_collections.values()))
+    # PRICE_MAX_STALENESS=0 turns the staleness check off
+    max_price_staleness = float(config.get('PRICE_MAX_STALENESS') or DEFAULT_MAX_PRICE_STALENESS)
+    price_feed = LatestPriceFeed(
+        mongo_handler=mongo_handler,
+        price_collections=price_collections,
+        ttl=float(config.get('PRICE_TTL') or DEFAULT_PRICE_TTL),
+        max_staleness=max_price_staleness if max_price_staleness > 0 else None
+    )
 
     if config['is_test'].lower() == "true":
         is_test = True
     else:
         is_test = False
 
+    multicall_reader = MulticallReader(provider=provider,
+                                       batch_size=int(config.get('MULTICALL_BATCH_SIZE') or DEFAULT_BATCH_SIZE))
+
+    # ARCHIVE_SEGMENT_DIR moves finished records to JSONL files instead of <collection>_archive
+    event_archiver = EventArchiver(mongo_handler=mongo_handler, segment_dir=config.get('ARCHIVE_SEGMENT_DIR') or None)
+
+    # Incremental refresh reads stats only for contracts with logs since the last sweep
+    log_sync = None
+    if (config.get('INCREMENTAL_REFRESH') or "true").lower() == "true":
+        log_sync = EventLogSync(
+            provider=provider,
+            mongo_handler=mongo_handler,
+            confirmations=int(config.get('LOG_SYNC_CONFIRMATIONS') or DEFAULT_CONFIRMATIONS),
+            block_chunk_size=int(config.get('LOG_SYNC_BLOCK_CHUNK_SIZE') or DEFAULT_BLOCK_CHUNK_SIZE)
+        )
+
+    # Settlement sends are pinned to the fastest endpoint that answered the startup probe, and moved to another
+    # between batches once the pool opens its circuit
+    async_provider = AsyncProvider(provider_url=provider.get_provider_url(),
+                                   wallet_address=wallet_address,
+                                   wallet_private_key=wallet_private_key,
+                                   nonce_manager=provider.nonce_manager,
+                                   request_timeout=request_timeout,
+                                   endpoint_selector=provider.get_provider_url,
+                                   pool_size=pool_size)
+    receipt_tracker = ReceiptTracker(endpoint_uri=async_provider.get_provider().endpoint_uri,
+                                     session=session,
+                                     poll_interval=float(config.get('RECEIPT_POLL_INTERVAL') or DEFAULT_POLL_INTERVAL),
+                                     request_timeout=request_timeout)
+    # Settlement steps are journaled in Mongo, a restarted shard resumes them instead of resending txns
+    settlement_journal = None
+    if (config.get('SETTLEMENT_JOURNAL') or "true").lower() == "true":
+        settlement_journal = SettlementJournal(
+            mongo_handler=mongo_handler,
+            max_attempts=int(config.get('SETTLEMENT_MAX_ATTEMPTS') or DEFAULT_MAX_ATTEMPTS)
+        )
+        settlement_journal.ensure_indexes()
+    settlement_pipeline = AsyncSettlementPipeline(
+        provider=async_provider,
+        max_concurrency=int(config.get('SETTLEMENT_MAX_CONCURRENCY') or DEFAULT_MAX_CONCURRENCY),
+        receipt_tracker=receipt_tracker,
+        journal=settlement_journal
+    )
+
+    # Per job type and asset totals kept current from each sweep's record changes
+    market_rollups = None
+    if (config.get('MARKET_ROLLUPS') or "true").lower() == "true":
+        market_rollups = MarketRollups(
+            mongo_handler=mongo_handler,
+            bucket_seconds=int(config.get('ROLLUP_BUCKET_SECONDS') or DEFAULT_BUCKET_SECONDS),
+            segment_dir=config.get('ARCHIVE_SEGMENT_DIR') or None
+        )
+        market_rollups.ensure_indexes()
+    # Shard 0 checks the rollups against a rebuild on this interval, 0 disables the check
+    rollup_check_interval = float(config.get('ROLLUP_CHECK_INTERVAL') or DEFAULT_ROLLUP_CHECK_INTERVAL) or None
+
     EventUpdaterJobs(job_configs=job_configs,
                      provider_handler=provider,
-                     mongo_handler=mongo_handler).job_runner(is_test=is_test)
+                     mongo_handler=mongo_handler,
+                     settlement_pipeline=settlement_pipeline,
+                     multicall_reader=multicall_reader,
+                     price_feed=price_feed,
+                     log_sync=log_sync,
+                     event_archiver=event_archiver,
+                     market_rollups=market_rollups,
+                     rollup_check_interval=rollup_check_interval,
+                     watch_new_events=(config.get('WATCH_NEW_EVENTS') or "false").lower() == "true",
+                     bulk_flush_size=int(config.get('BULK_FLUSH_SIZE') or DEFAULT_FLUSH_SIZE),
+                     bulk_flush_interval=float(config.get('BULK_FLUSH_INTERVAL') or DEFAULT_FLUSH_INTERVAL),
+                     shard_index=shard_index,
+                     shard_count=shard_count,
+                     stats_queue=stats_queue
+                     ).job_runner(is_test=is_test)
 
     return
 
 
-if __name__ == '__main__':
+def start_worker(shard_index, shard_count, wallet, stats_queue):
+    process = multiprocessing.Process(target=event_updater_worker,
+                                      name=f"event-updater-shard-{shard_index}",
+                                      kwargs={"shard_index": shard_index,
+                                              "shard_count": shard_count,
+                                              "wallet_address": wallet[0],
+                                              "wallet_private_key": wallet[1],
+                                              "stats_queue": stats_queue})
+    process.start()
 
-    # process queue
-    processes = []
+    return process
 
-    betting_events_job_process = multiprocessing.Process(target=event_updater_worker())
 
-    betting_events_job_process.start()
+def supervise_workers():
+    wallets = load_shard_wallets()
+    shard_count = len(wallets)
+    stats_queue = multiprocessing.Queue()
 
-    # wait for all processes to finish
-    for process in processes:
-        process.join()
+    processes = {shard_index: start_worker(shard_index, shard_count, wallet, stats_queue)
+                 for shard_index, wallet in enumerate(wallets)}
+    restart_at = {}
+    totals = Counter()
+    window = Counter()
+    window_start = time.time()
 
-    pass
+    while True:
+        try:
+            shard_stats = stats_queue.get(timeout=1)
+            shard_stats.pop("shard_index")
+            shard_stats.pop("timestamp")
+            window.update(shard_stats)
+        except queue.Empty:
+            pass
+
+        # The runner is meant to run forever, so any exit is treated as a crash and the shard restarted
+        for shard_index, process in processes.items():
+            if process.is_alive():
+                continue
+            if shard_index not in restart_at:
+                logger.warning(f"Shard {shard_index} exited with code {process.exitcode}, "
+                               f"restarting in {WORKER_RESTART_DELAY} s...")
+                restart_at[shard_index] = time.time() + WORKER_RESTART_DELAY
+            elif restart_at[shard_index] <= time.time():
+                del restart_at[shard_index]
+                processes[shard_index] = start_worker(shard_index, shard_count, wallets[shard_index], stats_queue)
+
+        elapsed = time.time() - window_start
+        if elapsed >= SUPERVISOR_REPORT_INTERVAL:
+            totals.update(window)
+            rates = ", ".join(f"{key} {count / elapsed * 60:.1f}/min" for key, count in sorted(window.items()))
+            logger.info(f"{shard_count} shards: {rates or 'idle'} | totals {dict(totals)}")
+            window.clear()
+            window_start = time.time()
+
+
+if __name__ == '__main__':
+    supervise_workers()
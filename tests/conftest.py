@@ -0,0 +1,27 @@
+import mongomock
+import pytest
+
+from mongomock.collection import BulkOperationBuilder
+
+from db.mongo_interface import MongoInterface
+
+TEST_DB_NAME = "over_under_test"
+
+
+def _add_update_without_sort(add_update):
+    # pymongo 4.11+ passes UpdateOne's sort to the bulk builder, which mongomock does not accept yet
+    def patched(self, *args, sort=None, **kwargs):
+        if sort is not None:
+            raise NotImplementedError("mongomock bulk updates do not support sort")
+        return add_update(self, *args, **kwargs)
+
+    return patched
+
+
+if "sort" not in BulkOperationBuilder.add_update.__code__.co_varnames:
+    BulkOperationBuilder.add_update = _add_update_without_sort(BulkOperationBuilder.add_update)
+
+
+@pytest.fixture
+def mongo_handler() -> MongoInterface:
+    return MongoInterface(db_name=TEST_DB_NAME, client=mongomock.MongoClient())
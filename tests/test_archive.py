@@ -0,0 +1,54 @@
+from db.archive import EventArchiver, read_segment_records
+
+COLLECTION_NAME = "btc_events_test"
+CONTRACT_ABI = [{"inputs": [], "name": "setWinners", "outputs": [], "stateMutability": "nonpayable",
+                 "type": "function"}]
+
+
+def insert_events(mongo_handler):
+    mongo_handler.insert_many(collection=COLLECTION_NAME, documents=[
+        {"contract_address": "0xa", "asset_symbol": "BTC", "is_event_over": True, "is_payout_period_over": True,
+         "contract_abi": CONTRACT_ABI},
+        {"contract_address": "0xb", "asset_symbol": "BTC", "is_event_over": True, "is_payout_period_over": True,
+         "contract_abi": CONTRACT_ABI},
+        {"contract_address": "0xc", "asset_symbol": "BTC", "is_event_over": True, "is_payout_period_over": False,
+         "contract_abi": CONTRACT_ABI},
+    ])
+
+
+def test_finished_records_move_to_the_archive_with_one_copy_of_each_abi(mongo_handler):
+    insert_events(mongo_handler)
+    event_archiver = EventArchiver(mongo_handler=mongo_handler, batch_size=1)
+
+    assert event_archiver.archive(collection_name=COLLECTION_NAME) == {"archived": 2, "abis": 1}
+
+    assert [record["contract_address"] for record in mongo_handler.find(collection=COLLECTION_NAME, query={})] \
+        == ["0xc"]
+    archived_records = list(mongo_handler.find(collection=EventArchiver.get_archive_collection(COLLECTION_NAME),
+                                               query={}))
+    assert sorted(record["contract_address"] for record in archived_records) == ["0xa", "0xb"]
+    assert all("contract_abi" not in record for record in archived_records)
+    assert event_archiver.get_abi(archived_records[0]["abi_hash"]) == CONTRACT_ABI
+
+
+def test_rerun_after_a_crash_before_the_delete_archives_once(mongo_handler):
+    insert_events(mongo_handler)
+    event_archiver = EventArchiver(mongo_handler=mongo_handler)
+    # The earlier run wrote 0xa to the archive and stopped before deleting it
+    record = mongo_handler.find_one(collection=COLLECTION_NAME, query={"contract_address": "0xa"})
+    mongo_handler.insert(collection=EventArchiver.get_archive_collection(COLLECTION_NAME), document=record)
+
+    assert event_archiver.archive(collection_name=COLLECTION_NAME)["archived"] == 2
+    assert len(list(mongo_handler.find(collection=EventArchiver.get_archive_collection(COLLECTION_NAME),
+                                       query={}))) == 2
+
+
+def test_records_go_to_jsonl_segments_when_a_segment_dir_is_set(mongo_handler, tmp_path):
+    insert_events(mongo_handler)
+    event_archiver = EventArchiver(mongo_handler=mongo_handler, segment_dir=str(tmp_path))
+
+    assert event_archiver.archive(collection_name=COLLECTION_NAME, query={"asset_symbol": "BTC"})["archived"] == 2
+
+    assert sorted(record["contract_address"] for record in read_segment_records(str(tmp_path), COLLECTION_NAME)) \
+        == ["0xa", "0xb"]
+    assert mongo_handler.find_one(collection=EventArchiver.get_archive_collection(COLLECTION_NAME), query={}) is None
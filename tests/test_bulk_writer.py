@@ -0,0 +1,58 @@
+from db.bulk_writer import BulkUpdateBuffer
+
+COLLECTION_NAME = "event_contracts_test"
+
+
+def seed_records(mongo_handler, contract_addresses):
+    # A unique contract_name lets one update be made to fail with a duplicate key error
+    mongo_handler.create_index(collection=COLLECTION_NAME, keys=[("contract_name", 1)], unique=True)
+    mongo_handler.insert_many(collection=COLLECTION_NAME,
+                              documents=[{"contract_address": contract_address, "contract_name": contract_address,
+                                          "contract_balance": 0}
+                                         for contract_address in contract_addresses])
+
+
+def get_balances(mongo_handler):
+    return {record["contract_address"]: record["contract_balance"]
+            for record in mongo_handler.find(collection=COLLECTION_NAME, query={})}
+
+
+def test_flush_reports_failed_document_and_applies_the_rest(mongo_handler):
+    seed_records(mongo_handler, ["0xa", "0xb", "0xc"])
+    buffer = BulkUpdateBuffer(mongo_handler=mongo_handler, collection=COLLECTION_NAME, flush_interval=None)
+
+    buffer.add(query={"contract_address": "0xa"}, document={"$set": {"contract_balance": 10}})
+    buffer.add(query={"contract_address": "0xb"}, document={"$set": {"contract_balance": 20, "contract_name": "0xa"}})
+    buffer.add(query={"contract_address": "0xc"}, document={"$set": {"contract_balance": 30}})
+    flush_result = buffer.flush()
+
+    assert [write_error["query"] for write_error in flush_result["errors"]] == [{"contract_address": "0xb"}]
+    assert flush_result["errors"][0]["error"]
+    assert flush_result["matched"] == 2
+    assert flush_result["modified"] == 2
+    assert get_balances(mongo_handler) == {"0xa": 10, "0xb": 0, "0xc": 30}
+    assert len(buffer) == 0
+
+
+def test_flush_without_errors(mongo_handler):
+    seed_records(mongo_handler, ["0xa", "0xb"])
+    buffer = BulkUpdateBuffer(mongo_handler=mongo_handler, collection=COLLECTION_NAME, flush_interval=None)
+
+    for contract_address in ["0xa", "0xb"]:
+        buffer.add(query={"contract_address": contract_address}, document={"$set": {"contract_balance": 5}})
+
+    assert buffer.flush() == {"matched": 2, "modified": 2, "errors": []}
+    assert get_balances(mongo_handler) == {"0xa": 5, "0xb": 5}
+
+
+def test_add_flushes_at_flush_size(mongo_handler):
+    seed_records(mongo_handler, ["0xa", "0xb", "0xc"])
+    buffer = BulkUpdateBuffer(mongo_handler=mongo_handler, collection=COLLECTION_NAME, flush_size=2,
+                              flush_interval=None)
+
+    assert buffer.add(query={"contract_address": "0xa"}, document={"$set": {"contract_balance": 1}}) is None
+    flush_result = buffer.add(query={"contract_address": "0xb"}, document={"$set": {"contract_balance": 1}})
+
+    assert flush_result == {"matched": 2, "modified": 2, "errors": []}
+    assert len(buffer) == 0
+    assert buffer.flush() == {"matched": 0, "modified": 0, "errors": []}
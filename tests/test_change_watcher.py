@@ -0,0 +1,231 @@
+import os
+import threading
+import time
+
+import pytest
+
+from pymongo.errors import OperationFailure
+
+from db.change_watcher import ChangeStreamWatcher, DEFAULT_RESUME_COLLECTION, CHANGE_STREAM_MODE, POLL_MODE
+from db.mongo_interface import MongoInterface
+
+COLLECTION_NAME = "event_contracts_test"
+RESUME_KEY = f"{COLLECTION_NAME}:0/1"
+WAIT_TIMEOUT = 5
+# e.g. mongodb://localhost:27017/?replicaSet=rs0 for a `mongod --replSet rs0` after rs.initiate()
+MONGO_REPLSET_URL = os.environ.get("MONGO_REPLSET_URL")
+
+
+class InsertRecorder:
+    def __init__(self, expected: int):
+        self.documents = []
+        self.expected = expected
+        self.done = threading.Event()
+
+    def __call__(self, document):
+        self.documents.append(document)
+        if len(self.documents) >= self.expected:
+            self.done.set()
+
+
+class FakeChangeStream:
+    def __init__(self, changes, on_exhausted):
+        # Yields the given changes, then behaves like an idle stream and calls on_exhausted once
+        self.changes = list(changes)
+        self.on_exhausted = on_exhausted
+        self.resume_token = None
+        self.alive = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.alive = False
+
+    def try_next(self):
+        if not self.changes:
+            if self.on_exhausted is not None:
+                self.on_exhausted()
+                self.on_exhausted = None
+            return None
+        change = self.changes.pop(0)
+        self.resume_token = change["_id"]
+        return change
+
+
+def stub_watch(mongo_handler, results):
+    # Each watch() call takes the next result: an exception to raise, or a FakeChangeStream
+    calls = []
+
+    def watch(collection, pipeline=None, resume_after=None, **kwargs):
+        calls.append({"collection": collection, "resume_after": resume_after})
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    mongo_handler.watch = watch
+    return calls
+
+
+def insert_change(token, contract_address):
+    return {"_id": {"_data": token}, "operationType": "insert",
+            "fullDocument": {"contract_address": contract_address, "event_close": 1}}
+
+
+def get_resume_state(mongo_handler):
+    return mongo_handler.find_one(collection=DEFAULT_RESUME_COLLECTION, query={"_id": RESUME_KEY}) or {}
+
+
+def wait_until(condition, timeout=WAIT_TIMEOUT) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def start_watcher(mongo_handler, on_insert, **kwargs):
+    return ChangeStreamWatcher(mongo_handler=mongo_handler, collection_name=COLLECTION_NAME, on_insert=on_insert,
+                               resume_key=RESUME_KEY, poll_interval=0.01, **kwargs).start()
+
+
+def test_poll_dispatches_new_inserts_and_resumes_after_restart(mongo_handler):
+    mongo_handler.insert(collection=COLLECTION_NAME, document={"contract_address": "0xold"})
+    recorder = InsertRecorder(expected=2)
+    watcher = start_watcher(mongo_handler, recorder, change_stream=False)
+    # The starting position is stored before anything newer is inserted
+    assert wait_until(lambda: get_resume_state(mongo_handler).get("last_id") is not None)
+
+    for contract_address in ["0xa", "0xb"]:
+        mongo_handler.insert(collection=COLLECTION_NAME,
+                             document={"contract_address": contract_address, "contract_abi": [{"type": "function"}],
+                                       "over_betters_addresses": [], "under_betters_addresses": []})
+    assert recorder.done.wait(WAIT_TIMEOUT)
+    watcher.stop(timeout=WAIT_TIMEOUT)
+
+    assert watcher.mode == POLL_MODE
+    assert [document["contract_address"] for document in recorder.documents] == ["0xa", "0xb"]
+    assert all("contract_abi" not in document and "over_betters_addresses" not in document
+               for document in recorder.documents)
+    assert get_resume_state(mongo_handler)["last_id"] == recorder.documents[-1]["_id"]
+
+    # A restarted watcher picks up after the stored position, without replaying 0xa and 0xb
+    mongo_handler.insert(collection=COLLECTION_NAME, document={"contract_address": "0xc"})
+    restarted_recorder = InsertRecorder(expected=1)
+    restarted_watcher = start_watcher(mongo_handler, restarted_recorder, change_stream=False)
+    assert restarted_recorder.done.wait(WAIT_TIMEOUT)
+    restarted_watcher.stop(timeout=WAIT_TIMEOUT)
+
+    assert [document["contract_address"] for document in restarted_recorder.documents] == ["0xc"]
+
+
+def test_change_stream_saves_resume_token_and_resumes_from_it(mongo_handler):
+    recorder = InsertRecorder(expected=2)
+    stopped = threading.Event()
+    calls = stub_watch(mongo_handler, [
+        FakeChangeStream([insert_change("t1", "0xa"), insert_change("t2", "0xb")], on_exhausted=stopped.set),
+    ])
+    watcher = start_watcher(mongo_handler, recorder)
+    assert stopped.wait(WAIT_TIMEOUT)
+    watcher.stop(timeout=WAIT_TIMEOUT)
+
+    assert watcher.mode == CHANGE_STREAM_MODE
+    assert calls == [{"collection": COLLECTION_NAME, "resume_after": None}]
+    assert [document["contract_address"] for document in recorder.documents] == ["0xa", "0xb"]
+    assert get_resume_state(mongo_handler)["resume_token"] == {"_data": "t2"}
+
+    stopped.clear()
+    calls = stub_watch(mongo_handler, [FakeChangeStream([], on_exhausted=stopped.set)])
+    restarted_watcher = start_watcher(mongo_handler, InsertRecorder(expected=1))
+    assert stopped.wait(WAIT_TIMEOUT)
+    restarted_watcher.stop(timeout=WAIT_TIMEOUT)
+
+    assert calls == [{"collection": COLLECTION_NAME, "resume_after": {"_data": "t2"}}]
+
+
+def test_expired_resume_token_restarts_the_stream_from_now(mongo_handler):
+    mongo_handler.upsert(collection=DEFAULT_RESUME_COLLECTION, query={"_id": RESUME_KEY},
+                         document={"$set": {"resume_token": {"_data": "expired"}}})
+    stopped = threading.Event()
+    calls = stub_watch(mongo_handler, [
+        OperationFailure("resume point may no longer be in the oplog", code=286),
+        FakeChangeStream([], on_exhausted=stopped.set),
+    ])
+    watcher = start_watcher(mongo_handler, InsertRecorder(expected=1))
+    assert stopped.wait(WAIT_TIMEOUT)
+    watcher.stop(timeout=WAIT_TIMEOUT)
+
+    assert [call["resume_after"] for call in calls] == [{"_data": "expired"}, None]
+
+
+def test_unsupported_change_streams_fall_back_to_polling(mongo_handler):
+    stub_watch(mongo_handler, [OperationFailure("The $changeStream stage is only supported on replica sets",
+                                                code=40573)])
+    recorder = InsertRecorder(expected=1)
+    watcher = start_watcher(mongo_handler, recorder)
+    assert wait_until(lambda: watcher.mode == POLL_MODE and "last_id" in get_resume_state(mongo_handler))
+
+    mongo_handler.insert(collection=COLLECTION_NAME, document={"contract_address": "0xa"})
+    assert recorder.done.wait(WAIT_TIMEOUT)
+    watcher.stop(timeout=WAIT_TIMEOUT)
+
+    assert not watcher.change_stream
+    assert [document["contract_address"] for document in recorder.documents] == ["0xa"]
+
+
+def test_other_stream_errors_are_retried_without_ending_the_watcher(mongo_handler):
+    stopped = threading.Event()
+    calls = stub_watch(mongo_handler, [
+        RuntimeError("connection reset"),
+        OperationFailure("interrupted", code=11601),
+        FakeChangeStream([insert_change("t1", "0xa")], on_exhausted=stopped.set),
+    ])
+    recorder = InsertRecorder(expected=1)
+    watcher = start_watcher(mongo_handler, recorder)
+    assert stopped.wait(WAIT_TIMEOUT)
+    watcher.stop(timeout=WAIT_TIMEOUT)
+
+    assert len(calls) == 3
+    assert watcher.change_stream
+    assert [document["contract_address"] for document in recorder.documents] == ["0xa"]
+
+
+@pytest.fixture
+def replset_mongo_handler():
+    mongo_handler = MongoInterface(db_name="over_under_watcher_test", connection_url=MONGO_REPLSET_URL)
+    mongo_handler.client.drop_database("over_under_watcher_test")
+    yield mongo_handler
+    mongo_handler.client.drop_database("over_under_watcher_test")
+    mongo_handler.client.close()
+
+
+@pytest.mark.skipif(not MONGO_REPLSET_URL, reason="needs a replica set, set MONGO_REPLSET_URL")
+def test_change_stream_on_a_replica_set_dispatches_inserts_and_resumes(replset_mongo_handler):
+    recorder = InsertRecorder(expected=2)
+    watcher = start_watcher(replset_mongo_handler, recorder)
+    # mode is set once the server has opened the stream
+    assert wait_until(lambda: watcher.mode == CHANGE_STREAM_MODE)
+
+    for contract_address in ["0xa", "0xb"]:
+        replset_mongo_handler.insert(collection=COLLECTION_NAME,
+                                     document={"contract_address": contract_address,
+                                               "contract_abi": [{"type": "function"}]})
+    assert recorder.done.wait(WAIT_TIMEOUT)
+    assert wait_until(lambda: get_resume_state(replset_mongo_handler).get("resume_token") is not None)
+    watcher.stop(timeout=WAIT_TIMEOUT)
+
+    assert watcher.change_stream
+    assert [document["contract_address"] for document in recorder.documents] == ["0xa", "0xb"]
+    assert all("contract_abi" not in document for document in recorder.documents)
+
+    # An insert made while no watcher runs is delivered from the stored token, without replaying 0xa and 0xb
+    replset_mongo_handler.insert(collection=COLLECTION_NAME, document={"contract_address": "0xc"})
+    restarted_recorder = InsertRecorder(expected=1)
+    restarted_watcher = start_watcher(replset_mongo_handler, restarted_recorder)
+    assert restarted_recorder.done.wait(WAIT_TIMEOUT)
+    restarted_watcher.stop(timeout=WAIT_TIMEOUT)
+
+    assert restarted_watcher.mode == CHANGE_STREAM_MODE
+    assert [document["contract_address"] for document in restarted_recorder.documents] == ["0xc"]
@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+import pytest
+
+from web3 import Web3
+
+from eth.contract_cache import ContractInterfaceCache
+from eth.errors import ContractError
+
+EVENT_ABI = [{"inputs": [], "name": name, "outputs": [{"name": "", "type": "string"}], "stateMutability": "view",
+              "type": "function"} for name in ("getContractName", "getAssetSymbol")]
+ADDRESSES = [Web3.to_checksum_address(f"0x{index:040x}") for index in range(1, 4)]
+
+
+class FakeMulticallReader:
+    def __init__(self):
+        self.calls = 0
+
+    def aggregate(self, calls):
+        self.calls += len(calls)
+        return ["Over/Under", "BTC"] * (len(calls) // 2)
+
+
+class CountingEth:
+    def __init__(self):
+        self.w3_eth = Web3().eth
+        self.parsed_abis = 0
+
+    def contract(self, **kwargs):
+        if "address" not in kwargs:
+            self.parsed_abis += 1
+        return self.w3_eth.contract(**kwargs)
+
+
+def make_cache(**kwargs):
+    provider = SimpleNamespace(w3=SimpleNamespace(eth=CountingEth()))
+    multicall_reader = FakeMulticallReader()
+    return ContractInterfaceCache(provider=provider, multicall_reader=multicall_reader, **kwargs), provider, \
+        multicall_reader
+
+
+def test_interfaces_are_built_once_and_reused_across_sweeps():
+    contract_cache, provider, multicall_reader = make_cache()
+    records = [{"contract_address": address, "contract_abi": EVENT_ABI} for address in ADDRESSES]
+
+    first_interfaces = contract_cache.get_interfaces(records)
+    # Name and symbol of every new contract are read in one multicall, the ABI is parsed once for all three
+    assert multicall_reader.calls == 6
+    assert provider.w3.eth.parsed_abis == 1
+    assert [interface.asset_symbol for interface in first_interfaces] == ["BTC"] * 3
+
+    assert contract_cache.get_interfaces(list(reversed(records))) == list(reversed(first_interfaces))
+    assert multicall_reader.calls == 6
+
+
+def test_abis_are_loaded_for_uncached_contracts_only():
+    contract_cache, _, _ = make_cache()
+    contract_cache.get_interface(ADDRESSES[0], EVENT_ABI)
+    loaded = []
+
+    def abi_loader(addresses):
+        loaded.append(addresses)
+        return {address: EVENT_ABI for address in addresses if address != ADDRESSES[2]}
+
+    records = [{"contract_address": address} for address in ADDRESSES]
+    with pytest.raises(ContractError) as error:
+        contract_cache.get_interfaces(records, abi_loader=abi_loader)
+
+    assert loaded == [ADDRESSES[1:]]
+    assert error.value.contract_addresses == [ADDRESSES[2]]
+
+
+def test_least_recently_used_contract_is_evicted():
+    contract_cache, _, multicall_reader = make_cache(max_contracts=2)
+    for address in ADDRESSES:
+        contract_cache.get_interface(address, EVENT_ABI)
+
+    contract_cache.get_interface(ADDRESSES[0], EVENT_ABI)
+
+    assert multicall_reader.calls == 8
+    assert contract_cache.stats()["contracts"]["evictions"] == 2
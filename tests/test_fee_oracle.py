@@ -0,0 +1,69 @@
+import asyncio
+
+from types import SimpleNamespace
+
+from eth.fee_oracle import FeeOracle, GasLimitCache
+
+
+class FakeEth:
+    def __init__(self):
+        self.base_fee = 10
+        self.block_reads = 0
+
+    async def get_block(self, block_identifier):
+        self.block_reads += 1
+        # Slow enough for concurrent callers to pile up behind the first refresh
+        await asyncio.sleep(0.01)
+        return {"baseFeePerGas": self.base_fee}
+
+    @property
+    async def max_priority_fee(self):
+        return 2
+
+
+def make_oracle(**kwargs):
+    eth = FakeEth()
+    return FeeOracle(provider=SimpleNamespace(w3=SimpleNamespace(eth=eth)), **kwargs), eth
+
+
+def test_concurrent_txns_share_one_fee_read():
+    fee_oracle, eth = make_oracle()
+
+    async def build_txns():
+        return await asyncio.gather(*[fee_oracle.get_fees() for _ in range(20)])
+
+    fees = asyncio.run(build_txns())
+
+    assert fees == [{"maxFeePerGas": 22, "maxPriorityFeePerGas": 2}] * 20
+    assert eth.block_reads == 1
+
+
+def test_fees_are_read_again_after_the_ttl_or_an_invalidate():
+    fee_oracle, eth = make_oracle(ttl=0.05)
+    loop = asyncio.new_event_loop()
+
+    loop.run_until_complete(fee_oracle.get_fees())
+    eth.base_fee = 20
+    assert loop.run_until_complete(fee_oracle.get_fees())["maxFeePerGas"] == 22
+    loop.run_until_complete(asyncio.sleep(0.06))
+    assert loop.run_until_complete(fee_oracle.get_fees())["maxFeePerGas"] == 42
+
+    # An underpriced send drops the fees before they expire
+    eth.base_fee = 30
+    fee_oracle.invalidate()
+    assert loop.run_until_complete(fee_oracle.get_fees())["maxFeePerGas"] == 62
+    assert fee_oracle.refreshes == 3
+    loop.close()
+
+
+def test_gas_limit_keeps_the_largest_use_seen_plus_margin():
+    gas_limit_cache = GasLimitCache(margin=1.25)
+    key = ("setWinners", "abi")
+    assert gas_limit_cache.get(key) is None
+
+    gas_limit_cache.record(key, 80000)
+    gas_limit_cache.record(key, 60000)
+    assert gas_limit_cache.get(key) == 100000
+
+    gas_limit_cache.invalidate(key)
+    assert gas_limit_cache.get(key) is None
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from utils.job_registry import JobRegistry, load_job_registry
+
+REGISTRY_CONFIG = {
+    "jobs": [
+        {"job_type": "betting_event_12h", "collection_name": "event_contracts_12h", "assets": ["BTC", "ETH"],
+         "refresh_interval": 600},
+        {"job_type": "betting_event_24h", "collection_name": "event_contracts_24h", "assets": ["BTC"], "is_test": True},
+    ],
+    "price_feeds": {"BTC": "btc_prices", "ETH": "eth_prices"},
+}
+
+
+def test_registry_builds_the_job_configs_the_updater_runs():
+    job_registry = JobRegistry.from_dict(REGISTRY_CONFIG)
+
+    assert job_registry.get_job_configs() == [
+        {"job_type": "betting_event_12h", "is_test": False, "refresh_interval": 600,
+         "params": {"BTC": {"collection_name": "event_contracts_12h"},
+                    "ETH": {"collection_name": "event_contracts_12h"}}},
+        {"job_type": "betting_event_24h", "is_test": True, "refresh_interval": None,
+         "params": {"BTC": {"collection_name": "event_contracts_24h"}}},
+    ]
+    assert sorted(job_registry.get_collections()) == ["event_contracts_12h", "event_contracts_24h"]
+    assert job_registry.get_price_collections() == {"BTC": "btc_prices", "ETH": "eth_prices"}
+
+
+def test_duplicate_or_empty_job_types_are_rejected():
+    job_registry = JobRegistry()
+    job_registry.register(job_type="betting_event_12h", collection_name="event_contracts_12h", assets=["BTC"])
+
+    with pytest.raises(Exception, match="already registered"):
+        job_registry.register(job_type="betting_event_12h", collection_name="event_contracts_12h", assets=["ETH"])
+    with pytest.raises(Exception, match="no assets"):
+        job_registry.register(job_type="betting_event_24h", collection_name="event_contracts_24h", assets=[])
+
+
+def test_inline_config_wins_over_the_config_file(tmp_path):
+    config_path = tmp_path / "job_configs.json"
+    config_path.write_text(json.dumps({"jobs": [REGISTRY_CONFIG["jobs"][1]]}))
+
+    assert load_job_registry({"JOB_CONFIGS_PATH": str(config_path)}).get_job_types() == ["betting_event_24h"]
+    assert load_job_registry({"JOB_CONFIGS": json.dumps(REGISTRY_CONFIG), "JOB_CONFIGS_PATH": str(config_path)}
+                             ).get_job_types() == ["betting_event_12h", "betting_event_24h"]
+    # The shipped job_configs.json loads when neither is set
+    assert {"betting_event_12h", "betting_event_24h"} <= set(load_job_registry({}).get_job_types())
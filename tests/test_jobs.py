@@ -0,0 +1,238 @@
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from db.archive import EventArchiver
+from db.market_rollups import MarketRollups
+from db.settlement_journal import SettlementJournal
+from eth.errors import ContractError
+from eth.event_interfaces import EventContractInterface
+from eth.log_sync import EventLogSync
+from jobs import EventUpdaterJobs, REFRESH_ONGOING_PHASE, FINALIZE_PAYOUTS_PHASE
+from utils.metrics import PHASE_FAILURES, ROLLUP_MISMATCHES
+
+COLLECTION_NAME = "btc_events_test"
+JOB_CONFIG = {"job_type": "over_under", "params": {"BTC": {"collection_name": COLLECTION_NAME}}}
+BAD_ADDRESS = "0xbad"
+
+
+class FakeContractCache:
+    def get_interfaces(self, records, abi_loader):
+        return [SimpleNamespace(w3_contract_handle=SimpleNamespace(address=record["contract_address"], abi=[]))
+                for record in records]
+
+    def stats(self):
+        return {}
+
+
+def event_stats(balance):
+    return {"winning_betters_addresses": [], "contract_balance": balance, "over_betters_balance": 0,
+            "under_betters_balance": 0, "over_betting_payout_modifier": 1, "under_betting_payout_modifier": 1}
+
+
+def check_event_stats_many(interfaces, multicall_reader):
+    addresses = [interface.w3_contract_handle.address for interface in interfaces]
+    if BAD_ADDRESS in addresses:
+        raise ContractError(f"Event totals check failed for {[BAD_ADDRESS]}", contract_addresses=[BAD_ADDRESS])
+    return {address: event_stats(balance=5) for address in addresses}
+
+
+def make_jobs(mongo_handler, settlement_journal=None, **kwargs):
+    return EventUpdaterJobs(job_configs=[JOB_CONFIG], provider_handler=None, mongo_handler=mongo_handler,
+                            settlement_pipeline=None, multicall_reader=object(), contract_cache=FakeContractCache(),
+                            price_feed=SimpleNamespace(stats=dict), event_archiver=object(),
+                            settlement_journal=settlement_journal, **kwargs)
+
+
+def test_refresh_leaves_out_a_bad_contract_and_updates_the_rest(mongo_handler, monkeypatch):
+    monkeypatch.setattr(EventContractInterface, "check_event_stats_many", check_event_stats_many)
+    mongo_handler.insert_many(collection=COLLECTION_NAME, documents=[
+        {"contract_address": contract_address, "asset_symbol": "BTC", "is_event_over": False,
+         "event_close": 4102444800, "contract_balance": 0}
+        for contract_address in ["0xa", BAD_ADDRESS, "0xb"]
+    ])
+    settlement_journal = SettlementJournal(mongo_handler=mongo_handler, max_attempts=2)
+    jobs = make_jobs(mongo_handler, settlement_journal)
+
+    jobs.run_phase(phase=REFRESH_ONGOING_PHASE, job_config=JOB_CONFIG)
+
+    balances = {record["contract_address"]: record["contract_balance"]
+                for record in mongo_handler.find(collection=COLLECTION_NAME, query={})}
+    assert balances == {"0xa": 5, BAD_ADDRESS: 0, "0xb": 5}
+    # Read failures do not count toward quarantine, only failed settlement steps do
+    jobs.run_phase(phase=REFRESH_ONGOING_PHASE, job_config=JOB_CONFIG)
+    assert settlement_journal.get_entries([BAD_ADDRESS]) == {}
+
+    # Once quarantined the bad contract is no longer read at all
+    settlement_journal.record_failure(BAD_ADDRESS, "reverted")
+    settlement_journal.record_failure(BAD_ADDRESS, "reverted")
+    monkeypatch.setattr(EventContractInterface, "check_event_stats_many",
+                        lambda interfaces, multicall_reader: pytest.fail("quarantined contract read")
+                        if BAD_ADDRESS in [interface.w3_contract_handle.address for interface in interfaces]
+                        else {interface.w3_contract_handle.address: event_stats(balance=5)
+                              for interface in interfaces})
+    jobs.run_phase(phase=REFRESH_ONGOING_PHASE, job_config=JOB_CONFIG)
+
+
+def test_log_sync_keeps_an_unread_contract_active(mongo_handler, monkeypatch):
+    good_address, bad_address = "0x" + "0a" * 20, "0x" + "0b" * 20
+    read_addresses = []
+
+    def check_event_stats_many(interfaces, multicall_reader):
+        addresses = [interface.w3_contract_handle.address for interface in interfaces]
+        read_addresses.append(addresses)
+        if bad_address in addresses:
+            raise ContractError(f"Event totals check failed for {[bad_address]}", contract_addresses=[bad_address])
+        return {address: event_stats(balance=5) for address in addresses}
+
+    monkeypatch.setattr(EventContractInterface, "check_event_stats_many", check_event_stats_many)
+    mongo_handler.insert_many(collection=COLLECTION_NAME, documents=[
+        {"contract_address": contract_address, "asset_symbol": "BTC", "is_event_over": False,
+         "event_close": 4102444800, "contract_balance": 0}
+        for contract_address in [good_address, bad_address]
+    ])
+    # No contract emits logs, only contracts not yet synced are read after the first sweep
+    provider = SimpleNamespace(w3=SimpleNamespace(eth=SimpleNamespace(block_number=100, get_logs=lambda filters: [])))
+    jobs = make_jobs(mongo_handler, log_sync=EventLogSync(provider=provider, mongo_handler=mongo_handler))
+
+    jobs.run_phase(phase=REFRESH_ONGOING_PHASE, job_config=JOB_CONFIG)
+    read_addresses.clear()
+    jobs.run_phase(phase=REFRESH_ONGOING_PHASE, job_config=JOB_CONFIG)
+
+    assert read_addresses == [[bad_address]]
+
+
+class StopRunner(BaseException):
+    pass
+
+
+def test_failed_phase_is_logged_and_the_runner_goes_on(mongo_handler, monkeypatch):
+    def endpoint_down(interfaces, multicall_reader):
+        raise requests.exceptions.ConnectionError("endpoint down")
+
+    def wait(timeout):
+        raise StopRunner()
+
+    monkeypatch.setattr(EventContractInterface, "check_event_stats_many", endpoint_down)
+    mongo_handler.insert(collection=COLLECTION_NAME,
+                         document={"contract_address": "0xa", "asset_symbol": "BTC", "is_event_over": False,
+                                   "event_close": 4102444800, "contract_balance": 0})
+    jobs = make_jobs(mongo_handler)
+    monkeypatch.setattr(jobs.scheduler, "wait", wait)
+    failures_before = PHASE_FAILURES.render()
+
+    # The runner reaches the end of its loop instead of stopping on the refresh error
+    with pytest.raises(StopRunner):
+        jobs.job_runner(is_test=False)
+
+    assert f'updater_phase_failures_total{{phase="{REFRESH_ONGOING_PHASE}",job="over_under"}} 1' \
+        in PHASE_FAILURES.render()
+    assert failures_before != PHASE_FAILURES.render()
+
+
+def test_rollup_check_reports_deltas_lost_between_record_write_and_apply(mongo_handler, monkeypatch):
+    monkeypatch.setattr(EventContractInterface, "check_event_stats_many", check_event_stats_many)
+    mongo_handler.insert(collection=COLLECTION_NAME,
+                         document={"contract_address": "0xa", "asset_symbol": "BTC", "is_event_over": False,
+                                   "event_close": 4102444800, "contract_balance": 0})
+    market_rollups = MarketRollups(mongo_handler=mongo_handler)
+    jobs = make_jobs(mongo_handler, market_rollups=market_rollups)
+
+    jobs.run_phase(phase=REFRESH_ONGOING_PHASE, job_config=JOB_CONFIG)
+    assert jobs.check_rollups() == 0
+
+    # A crash after the record write drops the queued deltas
+    monkeypatch.setattr(market_rollups, "apply", lambda failed_addresses=None: 0)
+    monkeypatch.setattr(EventContractInterface, "check_event_stats_many",
+                        lambda interfaces, multicall_reader: {"0xa": event_stats(balance=9)})
+    jobs.run_phase(phase=REFRESH_ONGOING_PHASE, job_config=JOB_CONFIG)
+
+    assert jobs.check_rollups() == 1
+    assert "updater_rollup_mismatches 1" in ROLLUP_MISMATCHES.render()
+
+
+def test_rollup_check_counts_records_archived_to_segments(mongo_handler, tmp_path):
+    mongo_handler.insert(collection=COLLECTION_NAME,
+                         document={"contract_address": "0xa", "asset_symbol": "BTC", "is_event_over": True,
+                                   "is_payout_period_over": False, "event_close": 1700000000,
+                                   "contract_balance": 4.0})
+    market_rollups = MarketRollups(mongo_handler=mongo_handler, segment_dir=str(tmp_path))
+    record = mongo_handler.find_one(collection=COLLECTION_NAME, query={"contract_address": "0xa"})
+    fields = market_rollups.track(job_type="over_under", asset="BTC", record=record,
+                                  fields={"is_payout_period_over": True})
+    mongo_handler.update(collection=COLLECTION_NAME, query={"contract_address": "0xa"}, document={"$set": fields})
+    market_rollups.apply()
+
+    assert EventArchiver(mongo_handler=mongo_handler, segment_dir=str(tmp_path)).archive(
+        collection_name=COLLECTION_NAME)["archived"] == 1
+    assert mongo_handler.find_one(collection=COLLECTION_NAME, query={}) is None
+
+    assert make_jobs(mongo_handler, market_rollups=market_rollups).check_rollups() == 0
+    # Without the segments the archived volume looks like drift
+    assert make_jobs(mongo_handler, market_rollups=MarketRollups(mongo_handler=mongo_handler)).check_rollups() > 0
+
+
+def test_every_contract_is_owned_by_exactly_one_shard(mongo_handler, monkeypatch):
+    addresses = [f"0x{index:040x}" for index in range(300)]
+    shards = [make_jobs(mongo_handler, shard_index=shard_index, shard_count=3) for shard_index in range(3)]
+
+    owners = [[shard.owns_contract(address) for shard in shards] for address in addresses]
+    assert all(sum(owned) == 1 for owned in owners)
+    # Case does not change the owner, addresses come checksummed from web3 and lowercase from Mongo
+    assert all(shard.owns_contract(address.upper().replace("0X", "0x")) == shard.owns_contract(address)
+               for shard in shards for address in addresses)
+    assert all(60 < sum(owned[shard_index] for owned in owners) < 140 for shard_index in range(3))
+
+    read_addresses = []
+    monkeypatch.setattr(EventContractInterface, "check_event_stats_many",
+                        lambda interfaces, multicall_reader: read_addresses.extend(
+                            interface.w3_contract_handle.address for interface in interfaces) or {})
+    mongo_handler.insert_many(collection=COLLECTION_NAME, documents=[
+        {"contract_address": address, "asset_symbol": "BTC", "is_event_over": False, "event_close": 4102444800}
+        for address in addresses[:30]
+    ])
+    for shard in shards:
+        shard.run_phase(phase=REFRESH_ONGOING_PHASE, job_config=JOB_CONFIG)
+
+    assert sorted(read_addresses) == addresses[:30]
+
+
+def test_finalized_events_are_marked_in_one_bulk_write(mongo_handler, monkeypatch):
+    # 0xa and 0xb are past payout close on chain, 0xc only by the wall clock, destroyContract reverts for 0xb
+    monkeypatch.setattr(EventContractInterface, "check_contract_status_many",
+                        lambda interfaces, multicall_reader: {
+                            interface.w3_contract_handle.address: {
+                                "is_event_over": True,
+                                "is_payout_period_over": interface.w3_contract_handle.address != "0xc"
+                            } for interface in interfaces})
+    finalized = []
+
+    def finalize_sync(events):
+        finalized.extend(event["contract_address"] for event in events)
+        return [{"contract_address": event["contract_address"],
+                 "error": "reverted" if event["contract_address"] == "0xb" else None, "contract_error": True}
+                for event in events]
+
+    mongo_handler.insert_many(collection=COLLECTION_NAME, documents=[
+        {"contract_address": contract_address, "asset_symbol": "BTC", "is_event_over": True,
+         "is_payout_period_over": False, "event_close": 1700000000, "payout_close": 1700003600}
+        for contract_address in ["0xa", "0xb", "0xc"]
+    ])
+    bulk_updates = []
+    bulk_update = mongo_handler.bulk_update
+    monkeypatch.setattr(mongo_handler, "bulk_update",
+                        lambda *args, **kwargs: bulk_updates.append(kwargs) or bulk_update(*args, **kwargs))
+    settlement_journal = SettlementJournal(mongo_handler=mongo_handler)
+    jobs = make_jobs(mongo_handler, settlement_journal)
+    jobs.settlement_pipeline = SimpleNamespace(finalize_sync=finalize_sync)
+
+    jobs.run_phase(phase=FINALIZE_PAYOUTS_PHASE, job_config=JOB_CONFIG)
+
+    assert finalized == ["0xa", "0xb"]
+    payout_over = {record["contract_address"]: record["is_payout_period_over"]
+                   for record in mongo_handler.find(collection=COLLECTION_NAME, query={})}
+    assert payout_over == {"0xa": True, "0xb": False, "0xc": False}
+    assert len(bulk_updates) == 1
+    # A reverted destroyContract counts toward quarantine
+    assert settlement_journal.get_entries(["0xb"])["0xb"]["attempts"] == 1
@@ -0,0 +1,9 @@
+from utils.metrics import MetricsRegistry
+
+
+def test_label_values_are_escaped():
+    counter = MetricsRegistry().counter("rpc_errors_total", "JSON-RPC errors", ["endpoint"])
+
+    counter.inc(endpoint='http://node/"key"\\path\nnext')
+
+    assert counter.render()[-1] == 'rpc_errors_total{endpoint="http://node/\\"key\\"\\\\path\\nnext"} 1'
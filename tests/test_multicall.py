@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from eth_abi import decode, encode
+from web3 import Web3
+
+from eth.errors import ContractError
+from eth.multicall import MulticallReader, MULTICALL3_ABI
+from eth.provider.provider import Provider
+
+BALANCE_ABI = [{"inputs": [], "name": "getBalance", "outputs": [{"name": "", "type": "uint256"}],
+                "stateMutability": "view", "type": "function"}]
+AGGREGATE3_SELECTOR = Web3.keccak(text="aggregate3((address,bool,bytes)[])")[:4]
+OK_ADDRESS = Web3.to_checksum_address("0x" + "0a" * 20)
+REVERTING_ADDRESS = Web3.to_checksum_address("0x" + "0b" * 20)
+EMPTY_ADDRESS = Web3.to_checksum_address("0x" + "0c" * 20)
+HEAVY_ADDRESS = Web3.to_checksum_address("0x" + "0d" * 20)
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.status_code = 200
+        self.content = json.dumps(body).encode()
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeMulticallNode:
+    def __init__(self, results):
+        # target -> (success, return data) of its call, a batch with a call to HEAVY_ADDRESS runs out of gas
+        self.results = results
+        self.batch_sizes = []
+
+    def __answer(self, request):
+        if request["method"] == "eth_chainId":
+            return {"jsonrpc": "2.0", "id": request["id"], "result": "0xaa36a7"}
+
+        call_data = bytes.fromhex(request["params"][0]["data"][2:])
+        assert call_data[:4] == AGGREGATE3_SELECTOR
+        [calls] = decode(["(address,bool,bytes)[]"], call_data[4:])
+        self.batch_sizes.append(len(calls))
+        targets = [Web3.to_checksum_address(target) for target, _, _ in calls]
+        if HEAVY_ADDRESS in targets:
+            return {"jsonrpc": "2.0", "id": request["id"], "error": {"code": -32000, "message": "out of gas"}}
+
+        return_data = encode(["(bool,bytes)[]"], [[self.results[target] for target in targets]])
+        return {"jsonrpc": "2.0", "id": request["id"], "result": Web3.to_hex(return_data)}
+
+    def post(self, endpoint_uri, data, **kwargs):
+        return FakeResponse(self.__answer(json.loads(data)))
+
+
+def make_reader(node, batch_size=500):
+    provider = Provider(provider_url="http://node", wallet_address=None, wallet_private_key=None, session=node,
+                        chain_id=11155111, record_metrics=False)
+    return MulticallReader(provider=provider, batch_size=batch_size), provider
+
+
+def balance_calls(provider, addresses):
+    return [(provider.w3.eth.contract(address=address, abi=BALANCE_ABI), "getBalance", ()) for address in addresses]
+
+
+def test_reverted_and_empty_results_read_as_none():
+    node = FakeMulticallNode({OK_ADDRESS: (True, encode(["uint256"], [5])),
+                              REVERTING_ADDRESS: (False, b""),
+                              EMPTY_ADDRESS: (True, b"")})
+    reader, provider = make_reader(node)
+
+    assert reader.aggregate(balance_calls(provider, [OK_ADDRESS, REVERTING_ADDRESS, EMPTY_ADDRESS])) == [5, None, None]
+    assert node.batch_sizes == [3]
+
+
+def test_failed_batch_is_split_down_to_the_contract_at_fault():
+    node = FakeMulticallNode({OK_ADDRESS: (True, encode(["uint256"], [5])),
+                              EMPTY_ADDRESS: (True, b"")})
+    reader, provider = make_reader(node)
+
+    assert reader.aggregate(balance_calls(provider, [OK_ADDRESS, EMPTY_ADDRESS])) == [5, None]
+    with pytest.raises(ContractError) as error:
+        reader.aggregate(balance_calls(provider, [OK_ADDRESS, EMPTY_ADDRESS, HEAVY_ADDRESS, OK_ADDRESS]))
+
+    # The half without HEAVY_ADDRESS went through, the split stops at its own call
+    assert error.value.contract_addresses == [HEAVY_ADDRESS]
+    assert node.batch_sizes == [2, 4, 2, 2, 1]
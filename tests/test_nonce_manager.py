@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from eth.provider.nonce_manager import NonceManager
+
+
+def test_nonces_are_handed_out_once_from_the_seed():
+    nonce_manager = NonceManager()
+    with pytest.raises(Exception):
+        nonce_manager.allocate()
+
+    nonce_manager.seed(7)
+    # Only the first seed counts, a later pending count read mid-batch would hand out used nonces
+    nonce_manager.seed(3)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        nonces = list(executor.map(lambda _: nonce_manager.allocate(), range(100)))
+
+    assert sorted(nonces) == list(range(7, 107))
+    assert set(nonce_manager.get_in_flight()) == set(nonces)
+
+
+def test_released_nonce_is_refilled_before_new_ones():
+    nonce_manager = NonceManager()
+    nonce_manager.seed(0)
+    first, second, third = nonce_manager.allocate(), nonce_manager.allocate(), nonce_manager.allocate()
+
+    nonce_manager.mark_sent(first, "0x01")
+    nonce_manager.confirm(first)
+    nonce_manager.release(third)
+    nonce_manager.release(second)
+
+    assert [nonce_manager.allocate() for _ in range(3)] == [1, 2, 3]
+
+
+def test_resync_refills_dropped_nonces_and_keeps_unsent_ones():
+    nonce_manager = NonceManager()
+    nonce_manager.seed(0)
+    for nonce in range(4):
+        nonce_manager.allocate()
+    for nonce in range(3):
+        nonce_manager.mark_sent(nonce, f"0x0{nonce}")
+
+    # The node holds nonces 0 and 1, the txn sent at 2 was dropped and 3 is still being built
+    nonce_manager.resync(2)
+
+    assert nonce_manager.get_in_flight() == {3: None}
+    assert nonce_manager.allocate() == 2
+    assert nonce_manager.allocate() == 4
@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+
+from web3.providers.base import BaseProvider
+
+from eth.provider.pool import PooledHTTPProvider
+
+HEALTHY_URI = "http://healthy"
+DOWN_URI = "http://down"
+SLOW_URI = "http://slow"
+
+
+class FakeEndpoint(BaseProvider):
+    def __init__(self, endpoint_uri, latency=0.0, is_down=False):
+        # Answers every request with its own uri, after latency seconds
+        self.endpoint_uri = endpoint_uri
+        self.latency = latency
+        self.is_down = is_down
+        self.methods = []
+        self.lock = threading.Lock()
+
+    def make_request(self, method, params):
+        with self.lock:
+            self.methods.append(method)
+        time.sleep(self.latency)
+        if self.is_down:
+            raise ConnectionError(f"{self.endpoint_uri} down")
+        return {"jsonrpc": "2.0", "id": 1, "result": self.endpoint_uri}
+
+
+def make_pool(endpoints, **kwargs):
+    return PooledHTTPProvider(endpoint_uris=[endpoint.endpoint_uri for endpoint in endpoints],
+                              endpoint_providers=endpoints, **kwargs)
+
+
+def test_failing_endpoint_is_taken_out_of_rotation_until_its_cooldown_passes():
+    healthy, down = FakeEndpoint(HEALTHY_URI), FakeEndpoint(DOWN_URI, is_down=True)
+    pool = make_pool([healthy, down], hedge_delay=None, failure_threshold=2, circuit_cooldown=0.2)
+    # Route requests to the down endpoint first
+    pool.endpoints[0].latency = 1000
+
+    # Reads fail over, so every one is answered while the down endpoint collects failures
+    for _ in range(50):
+        assert pool.make_request("eth_blockNumber", [])["result"] == HEALTHY_URI
+    assert len(down.methods) == 2
+    assert not pool.is_endpoint_healthy(DOWN_URI)
+    assert pool.get_best_endpoint_uri() == HEALTHY_URI
+
+    # After the cooldown it is back in rotation, and closes its circuit once it answers
+    time.sleep(0.25)
+    down.is_down, healthy.is_down = False, True
+    assert pool.make_request("eth_blockNumber", [])["result"] == DOWN_URI
+    assert pool.is_endpoint_healthy(DOWN_URI)
+
+
+def test_slow_read_is_hedged_and_a_send_is_not():
+    slow, healthy = FakeEndpoint(SLOW_URI, latency=0.5), FakeEndpoint(HEALTHY_URI)
+    pool = make_pool([slow, healthy], hedge_delay=0.05)
+    # Route the first request of each kind to the slow endpoint
+    pool.endpoints[1].latency = 1000
+
+    started_at = time.monotonic()
+    assert pool.make_request("eth_call", [])["result"] == HEALTHY_URI
+    assert time.monotonic() - started_at < 0.4
+    assert slow.methods == ["eth_call"] and healthy.methods == ["eth_call"]
+
+    pool.make_request("eth_sendRawTransaction", ["0x99"])
+    assert slow.methods.count("eth_sendRawTransaction") + healthy.methods.count("eth_sendRawTransaction") == 1
+
+
+def test_pool_needs_an_endpoint():
+    with pytest.raises(Exception):
+        PooledHTTPProvider(endpoint_uris=[])
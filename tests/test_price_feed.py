@@ -0,0 +1,45 @@
+import time
+
+from datetime import datetime, timezone
+
+import pytest
+
+from db.price_feed import LatestPriceFeed
+
+PRICE_COLLECTION = "btc_live_price"
+
+
+@pytest.fixture
+def non_utc_host(monkeypatch):
+    # Naive datetimes read as local time are off by the host's UTC offset
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.mark.parametrize("timestamp", [
+    datetime.now(timezone.utc).replace(tzinfo=None),
+    datetime.now(timezone.utc),
+    datetime.now(timezone.utc).replace(tzinfo=None).isoformat(),
+    datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+    time.time(),
+])
+def test_fresh_tick_is_served_on_a_non_utc_host(mongo_handler, non_utc_host, timestamp):
+    mongo_handler.insert(collection=PRICE_COLLECTION, document={"price": 65000.0, "timestamp": timestamp})
+    price_feed = LatestPriceFeed(mongo_handler=mongo_handler, price_collections={"BTC": PRICE_COLLECTION},
+                                 max_staleness=60)
+
+    assert price_feed.get_price("BTC") == 65000.0
+    assert abs(price_feed.get_tick("BTC")["timestamp"] - time.time()) < 60
+
+
+def test_stale_tick_is_refused_unless_staleness_is_disabled(mongo_handler):
+    mongo_handler.insert(collection=PRICE_COLLECTION, document={"price": 65000.0, "timestamp": time.time() - 3600})
+
+    with pytest.raises(Exception, match="staleness bound"):
+        LatestPriceFeed(mongo_handler=mongo_handler, price_collections={"BTC": PRICE_COLLECTION},
+                        max_staleness=300).get_price("BTC")
+    assert LatestPriceFeed(mongo_handler=mongo_handler, price_collections={"BTC": PRICE_COLLECTION},
+                           max_staleness=None).get_price("BTC") == 65000.0
@@ -0,0 +1,81 @@
+import itertools
+import time
+
+from web3 import Web3
+
+from eth.receipt_tracker import ReceiptTracker
+
+WAIT_TIMEOUT = 5
+ORIGINAL_HASH = "0x" + "01" * 32
+REPLACEMENT_HASH = "0x" + "02" * 32
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+
+class FakeNodeSession:
+    def __init__(self):
+        # txn hashes the node has a receipt for, and the raw txns sent to it
+        self.mined = set()
+        self.sent = []
+        self.block_numbers = itertools.count(1)
+
+    def __answer(self, request):
+        if request["method"] == "eth_blockNumber":
+            result = hex(next(self.block_numbers))
+        elif request["method"] == "eth_sendRawTransaction":
+            self.sent.append(request["params"][0])
+            result = REPLACEMENT_HASH
+        elif request["params"][0] in self.mined:
+            result = {"transactionHash": request["params"][0], "status": "0x1", "gasUsed": "0x5208"}
+        else:
+            result = None
+        return {"jsonrpc": "2.0", "id": request["id"], "result": result}
+
+    def post(self, endpoint_uri, json, timeout):
+        if isinstance(json, list):
+            return FakeResponse([self.__answer(request) for request in json])
+        return FakeResponse(self.__answer(json))
+
+
+def make_tracker(session, **kwargs):
+    return ReceiptTracker(endpoint_uri="http://node", session=session, poll_interval=0.01, **kwargs)
+
+
+def test_replacement_is_reported_and_the_original_still_resolves():
+    session = FakeNodeSession()
+    replacements = []
+    tracker = make_tracker(session, stuck_after=0)
+
+    receipt_future = tracker.track(ORIGINAL_HASH, resubmit=lambda fee_multiplier: b"\x99",
+                                   on_replace=replacements.append)
+    # A txn stuck for longer than stuck_after is replaced, then the original turns out to be the one mined
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while not replacements and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert not receipt_future.done()
+    session.mined.add(ORIGINAL_HASH)
+
+    assert receipt_future.result(timeout=WAIT_TIMEOUT)["transactionHash"] == ORIGINAL_HASH
+    assert replacements[0] == REPLACEMENT_HASH
+    assert session.sent[0] == Web3.to_hex(b"\x99")
+    tracker.stop()
+
+
+def test_resumed_txn_resolves_from_an_earlier_version():
+    session = FakeNodeSession()
+    session.mined.add(ORIGINAL_HASH)
+    tracker = make_tracker(session)
+
+    receipt_future = tracker.track(REPLACEMENT_HASH, replaced_hashes=[ORIGINAL_HASH])
+
+    assert receipt_future.result(timeout=WAIT_TIMEOUT)["transactionHash"] == ORIGINAL_HASH
+    assert tracker.get_pending_count() == 0
@@ -0,0 +1,34 @@
+import threading
+import time
+
+from utils.scheduler import DeadlineScheduler
+
+
+def test_due_deadlines_pop_earliest_first_and_a_push_moves_a_key():
+    scheduler = DeadlineScheduler()
+    scheduler.push(key=("event_close", "0xa"), deadline=30, payload="a")
+    scheduler.push(key=("event_close", "0xb"), deadline=10, payload="b")
+    scheduler.push(key=("event_close", "0xc"), deadline=20, payload="c")
+    # A moved deadline replaces the old one instead of queueing the key twice
+    scheduler.push(key=("event_close", "0xb"), deadline=40, payload="b moved")
+    scheduler.remove(key=("event_close", "0xc"))
+
+    assert len(scheduler) == 2
+    assert scheduler.next_deadline() == 30
+    assert scheduler.pop_due(now=35) == [(("event_close", "0xa"), "a")]
+    assert scheduler.pop_due(now=35) == []
+    assert scheduler.pop_due(now=40) == [(("event_close", "0xb"), "b moved")]
+    assert scheduler.next_deadline() is None
+
+
+def test_wait_wakes_up_for_an_earlier_deadline():
+    scheduler = DeadlineScheduler()
+    scheduler.push(key="resync", deadline=time.time() + 60)
+    scheduler.wait(timeout=0)
+
+    threading.Timer(0.05, lambda: scheduler.push(key="new_event", deadline=time.time())).start()
+    started_at = time.monotonic()
+    scheduler.wait(timeout=5)
+
+    assert time.monotonic() - started_at < 1
+    assert [key for key, _ in scheduler.pop_due(now=time.time())] == ["new_event"]
@@ -0,0 +1,26 @@
+import requests
+import pytest
+
+from benchmarks.fake_rpc import FakeRPCEndpoint
+from eth.provider.session import SessionHTTPProvider, build_http_session
+
+
+@pytest.fixture
+def failing_endpoint():
+    endpoint = FakeRPCEndpoint(failure_rate=1.0).start()
+    yield endpoint
+    endpoint.stop()
+
+
+def test_reads_are_retried_on_5xx_and_sends_are_not(failing_endpoint):
+    provider = SessionHTTPProvider(endpoint_uri=failing_endpoint.url, session=build_http_session(),
+                                   max_retries=2, backoff_factor=0)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        provider.make_request("eth_blockNumber", [])
+    assert failing_endpoint.requests == 3
+
+    # The node may have taken the txn before answering 503, a resend could double spend the nonce
+    with pytest.raises(requests.exceptions.HTTPError):
+        provider.make_request("eth_sendRawTransaction", ["0x99"])
+    assert failing_endpoint.requests == 4
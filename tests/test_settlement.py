@@ -0,0 +1,294 @@
+import asyncio
+import threading
+
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+from web3 import Web3
+
+from db.settlement_journal import SettlementJournal, PRICE_SET_SENT, PRICE_SET_MINED, WINNERS_SENT, \
+    WINNERS_MINED
+from eth.provider.nonce_manager import NonceManager
+from eth.settlement import AsyncSettlementPipeline
+
+CONTRACT_ADDRESS = "0x000000000000000000000000000000000000dEaD"
+EVENT = {"contract_address": CONTRACT_ADDRESS, "contract_abi": [], "price_at_close": 65000.0,
+         "collection_name": "btc_events_test"}
+REPLACEMENT_HASH = "0x" + "ff" * 32
+
+
+class FakeFunction:
+    def __init__(self, fn_name):
+        self.fn_name = fn_name
+        self.abi = {"name": fn_name}
+
+    async def build_transaction(self, txn):
+        return {**txn, "fn_name": self.fn_name}
+
+
+class FakeProvider:
+    def __init__(self):
+        self.sent = []
+        self.w3 = SimpleNamespace(eth=SimpleNamespace(
+            contract=lambda address, abi: SimpleNamespace(functions=SimpleNamespace(
+                setPriceAtClose=lambda price: FakeFunction("setPriceAtClose"),
+                setWinners=lambda: FakeFunction("setWinners"),
+                destroyContract=lambda: FakeFunction("destroyContract")
+            )),
+            send_raw_transaction=self.send_raw_transaction,
+            account=SimpleNamespace(sign_transaction=lambda function_call, private_key: SimpleNamespace(
+                rawTransaction=function_call
+            ))
+        ))
+        self.nonce_manager = NonceManager()
+        # the node: nonces of mined txns end at chain_nonce, txn hash -> nonce of every txn it was sent
+        self.chain_nonce = 0
+        self.txn_nonces = {}
+        self.txns = {}
+        self.session_loops = []
+
+    async def send_raw_transaction(self, function_call):
+        self.sent.append(function_call["fn_name"])
+        txn_hash = bytes([len(self.sent)]) * 32
+        self.txn_nonces[txn_hash] = function_call["nonce"]
+        self.txns[txn_hash] = function_call
+        return txn_hash
+
+    def get_provider(self):
+        return SimpleNamespace(endpoint_uri="http://node")
+
+    def repin_endpoint(self):
+        return "http://node"
+
+    async def open_session(self):
+        self.session_loops.append(asyncio.get_running_loop())
+
+    async def get_nonce(self):
+        if self.nonce_manager.needs_seed():
+            self.nonce_manager.seed(self.chain_nonce)
+        return self.nonce_manager.allocate()
+
+    async def resync_nonce(self):
+        self.nonce_manager.resync(self.chain_nonce)
+
+    async def get_chain_id(self):
+        return 1
+
+    def get_wallet_address(self):
+        return "0x0000000000000000000000000000000000000001"
+
+    def get_wallet_private_key(self):
+        return None
+
+    def mark_nonce_sent(self, nonce, txn_hash):
+        self.nonce_manager.mark_sent(nonce, txn_hash)
+
+    def confirm_nonce(self, nonce):
+        self.nonce_manager.confirm(nonce)
+
+    def release_nonce(self, nonce):
+        self.nonce_manager.release(nonce)
+
+
+class FakeFeeOracle:
+    async def get_fees(self):
+        return {"maxFeePerGas": 2, "maxPriorityFeePerGas": 1}
+
+    def invalidate(self):
+        pass
+
+
+class FakeReceiptTracker:
+    def __init__(self, statuses, delays=None):
+        # Receipts are resolved from another thread, as the real tracker does, after the txn's delay
+        self.endpoint_uri = "http://node"
+        self.statuses = list(statuses)
+        self.delays = list(delays or [0] * len(self.statuses))
+        self.tracked = []
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.peak_pending = 0
+
+    def track(self, txn_hash, resubmit=None, on_replace=None, replaced_hashes=None):
+        self.tracked.append({"txn_hash": txn_hash, "replaced_hashes": replaced_hashes})
+        status, delay = self.statuses.pop(0), self.delays.pop(0)
+        with self.lock:
+            self.pending += 1
+            self.peak_pending = max(self.peak_pending, self.pending)
+        future = Future()
+        receipt = {"transactionHash": txn_hash if isinstance(txn_hash, str) else Web3.to_hex(txn_hash),
+                   "status": status, "gasUsed": 21000}
+
+        def resolve():
+            if on_replace is not None:
+                # Every sent txn is bumped once before it is mined
+                on_replace(REPLACEMENT_HASH)
+            with self.lock:
+                self.pending -= 1
+            future.set_result(receipt)
+
+        threading.Timer(delay, resolve).start()
+        return future
+
+
+class NodeReceiptTracker:
+    def __init__(self, provider: FakeProvider, dropped=1):
+        # The first `dropped` txns are discarded by the node, a txn behind a nonce gap is never mined
+        self.endpoint_uri = "http://node"
+        self.provider = provider
+        self.dropped = dropped
+
+    def track(self, txn_hash, resubmit=None, on_replace=None, replaced_hashes=None):
+        future = Future()
+        nonce = self.provider.txn_nonces[txn_hash]
+        if self.dropped == 0 and nonce == self.provider.chain_nonce:
+            self.provider.chain_nonce += 1
+            future.set_result({"transactionHash": Web3.to_hex(txn_hash), "status": 1, "gasUsed": 21000})
+        else:
+            self.dropped = max(self.dropped - 1, 0)
+            future.set_exception(Exception(f"Txn {Web3.to_hex(txn_hash)} not mined after 600 s"))
+        return future
+
+
+class GasReceiptTracker:
+    def __init__(self, provider: FakeProvider, gas_needed):
+        # A txn sent with less gas than its method needs reverts having used all of it
+        self.endpoint_uri = "http://node"
+        self.provider = provider
+        self.gas_needed = gas_needed
+
+    def track(self, txn_hash, resubmit=None, on_replace=None, replaced_hashes=None):
+        function_call = self.provider.txns[txn_hash]
+        gas_needed = self.gas_needed.get(function_call["fn_name"], 21000)
+        gas_used = min(gas_needed, function_call.get("gas") or gas_needed)
+        future = Future()
+        future.set_result({"transactionHash": Web3.to_hex(txn_hash), "status": 1 if gas_used == gas_needed else 0,
+                           "gasUsed": gas_used})
+        return future
+
+
+class ThreadRecordingJournal(SettlementJournal):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.write_threads = []
+
+    def record_step(self, *args, **kwargs):
+        self.write_threads.append(threading.current_thread())
+        super().record_step(*args, **kwargs)
+
+    def unset_step(self, *args, **kwargs):
+        self.write_threads.append(threading.current_thread())
+        super().unset_step(*args, **kwargs)
+
+
+def make_pipeline(journal, receipt_tracker, provider=None, **kwargs):
+    return AsyncSettlementPipeline(provider=provider or FakeProvider(), receipt_tracker=receipt_tracker,
+                                   fee_oracle=FakeFeeOracle(), journal=journal, **kwargs)
+
+
+def test_events_are_finalized_concurrently_up_to_max_concurrency():
+    provider = FakeProvider()
+    receipt_tracker = FakeReceiptTracker(statuses=[1] * 6, delays=[0.05] * 6)
+    pipeline = make_pipeline(None, receipt_tracker, provider=provider, max_concurrency=3)
+    events = [{**EVENT, "contract_address": Web3.to_checksum_address(f"0x{index:040x}")} for index in range(1, 7)]
+
+    results = pipeline.finalize_sync(events)
+
+    assert [result["error"] for result in results] == [None] * 6
+    assert [result["contract_address"] for result in results] == [event["contract_address"] for event in events]
+    assert receipt_tracker.peak_pending == 3
+    assert sorted(provider.txn_nonces.values()) == list(range(6))
+
+
+def test_journal_writes_run_off_the_event_loop(mongo_handler):
+    journal = ThreadRecordingJournal(mongo_handler=mongo_handler)
+    pipeline = make_pipeline(journal, FakeReceiptTracker(statuses=[1, 1]))
+
+    [result] = pipeline.settle_sync([EVENT])
+
+    assert result["error"] is None
+    assert set(journal.get_entries([CONTRACT_ADDRESS])[CONTRACT_ADDRESS]["steps"]) == {
+        PRICE_SET_SENT, PRICE_SET_MINED, WINNERS_SENT, WINNERS_MINED
+    }
+    # settle_sync runs the loop on this thread, every journal write happened elsewhere
+    assert len(journal.write_threads) == 4
+    assert threading.current_thread() not in journal.write_threads
+
+
+def test_failed_price_step_waits_for_winners_and_unsets_both_steps(mongo_handler):
+    journal = SettlementJournal(mongo_handler=mongo_handler)
+    # setPriceAtClose reverts at once, setWinners reverts a little later
+    pipeline = make_pipeline(journal, FakeReceiptTracker(statuses=[0, 0], delays=[0, 0.05]))
+
+    [result] = pipeline.settle_sync([EVENT])
+
+    assert result["error"] is not None and result["contract_error"]
+    entry = journal.get_entries([CONTRACT_ADDRESS])[CONTRACT_ADDRESS]
+    # Nothing sent is left journaled, the next attempt sends both txns again
+    assert entry["steps"] == {}
+    assert entry["txn_hashes"] == {}
+
+
+def test_replacement_hashes_are_journaled_and_resumed_on(mongo_handler):
+    journal = SettlementJournal(mongo_handler=mongo_handler)
+    # setPriceAtClose is bumped and mined, the worker stops before setWinners is mined
+    journal.record_step(CONTRACT_ADDRESS, PRICE_SET_SENT, txn_hash="0x" + "01" * 32)
+    journal.record_replacement(CONTRACT_ADDRESS, PRICE_SET_SENT, "0x" + "02" * 32)
+    journal.record_step(CONTRACT_ADDRESS, PRICE_SET_MINED)
+    receipt_tracker = FakeReceiptTracker(statuses=[1], delays=[0.05])
+    provider = FakeProvider()
+    pipeline = make_pipeline(journal, receipt_tracker, provider=provider)
+
+    [result] = pipeline.settle_sync([EVENT])
+
+    assert result["error"] is None
+    assert provider.sent == ["setWinners"]
+    entry = journal.get_entries([CONTRACT_ADDRESS])[CONTRACT_ADDRESS]
+    assert entry["txn_hashes"][WINNERS_SENT] == REPLACEMENT_HASH
+    assert entry["sent_txn_hashes"][WINNERS_SENT] == [Web3.to_hex(bytes([1]) * 32), REPLACEMENT_HASH]
+
+    # A restart while setWinners is pending waits on every version of it
+    journal.unset_step(CONTRACT_ADDRESS, WINNERS_MINED)
+    receipt_tracker = FakeReceiptTracker(statuses=[1])
+    provider = FakeProvider()
+    [result] = make_pipeline(journal, receipt_tracker, provider=provider).settle_sync([EVENT])
+
+    assert result["error"] is None
+    assert provider.sent == []
+    assert receipt_tracker.tracked == [{"txn_hash": REPLACEMENT_HASH,
+                                        "replaced_hashes": [Web3.to_hex(bytes([1]) * 32)]}]
+
+
+def test_dropped_txn_does_not_block_later_sends():
+    provider = FakeProvider()
+    pipeline = make_pipeline(None, NodeReceiptTracker(provider), provider=provider)
+
+    [dropped_result] = pipeline.finalize_sync([EVENT])
+    [result] = pipeline.finalize_sync([EVENT])
+
+    assert dropped_result["error"] is not None and not dropped_result["contract_error"]
+    # The dropped txn's nonce is handed out again instead of leaving a gap in front of every later send
+    assert result["error"] is None
+    assert list(provider.txn_nonces.values()) == [0, 0]
+    assert provider.nonce_manager.get_in_flight() == {}
+    # Both batches ran on one loop, so the provider's session was kept between them
+    assert len(provider.session_loops) == 2 and provider.session_loops[0] is provider.session_loops[1]
+
+
+def test_out_of_gas_under_the_learned_limit_is_sent_again_and_not_counted(mongo_handler):
+    journal = SettlementJournal(mongo_handler=mongo_handler)
+    provider = FakeProvider()
+    pipeline = make_pipeline(journal, GasReceiptTracker(provider, gas_needed={"setWinners": 200000}),
+                             provider=provider)
+    # Learned from a smaller event
+    pipeline.gas_limit_cache.record(pipeline.gas_limit_cache.get_key(FakeFunction("setWinners")), 96000)
+
+    [result] = pipeline.settle_sync([EVENT])
+
+    assert result["error"] is None
+    assert provider.sent == ["setPriceAtClose", "setWinners", "setWinners"]
+    winners_txns = [txn for txn in provider.txns.values() if txn["fn_name"] == "setWinners"]
+    assert [txn["gas"] for txn in winners_txns] == [120000, pipeline.dependent_gas_limit]
+    entry = journal.get_entries([CONTRACT_ADDRESS])[CONTRACT_ADDRESS]
+    assert entry["sent_txn_hashes"][WINNERS_SENT] == [Web3.to_hex(bytes([3]) * 32)]
+    assert "attempts" not in entry
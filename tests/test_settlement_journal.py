@@ -0,0 +1,38 @@
+import requests
+
+from web3.exceptions import ContractLogicError, TimeExhausted
+
+from db.settlement_journal import SettlementJournal, PRICE_SET_MINED
+from eth.errors import ContractError, is_contract_error
+
+
+def test_contract_is_quarantined_after_max_attempts_and_can_be_released(mongo_handler):
+    settlement_journal = SettlementJournal(mongo_handler=mongo_handler, max_attempts=2)
+
+    assert not settlement_journal.record_failure("0xa", "reverted", collection_name="btc_events")
+    assert settlement_journal.record_failure("0xa", "reverted", collection_name="btc_events")
+    assert settlement_journal.get_quarantined() == {"0xa"}
+    assert [entry["_id"] for entry in settlement_journal.get_quarantined_entries()] == ["0xa"]
+
+    assert settlement_journal.release("0xa")
+    assert not settlement_journal.release("0xb")
+    assert settlement_journal.get_quarantined() == set()
+    assert not settlement_journal.record_failure("0xa", "reverted")
+
+
+def test_only_contract_errors_count_toward_quarantine():
+    assert is_contract_error(ContractError("Txn 0x1 reverted"))
+    assert is_contract_error(ContractLogicError("execution reverted"))
+    assert not is_contract_error(requests.exceptions.ConnectionError("endpoint down"))
+    assert not is_contract_error(TimeExhausted("receipt not found"))
+    assert not is_contract_error(Exception("replacement transaction underpriced"))
+
+
+def test_mined_step_resets_the_failure_count(mongo_handler):
+    settlement_journal = SettlementJournal(mongo_handler=mongo_handler, max_attempts=2)
+
+    assert not settlement_journal.record_failure("0xa", "receipt timeout")
+    settlement_journal.record_step("0xa", PRICE_SET_MINED)
+    # Failures on either side of a mined step are not added up
+    assert not settlement_journal.record_failure("0xa", "reverted")
+    assert settlement_journal.get_quarantined() == set()
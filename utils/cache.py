@@ -0,0 +1,69 @@
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class LRUCache:
+    def __init__(self, max_size: int, ttl: Optional[float] = None):
+        """
+        Bounded least-recently-used cache with an optional time-to-live per entry
+        :param max_size: maximum number of entries kept
+        :param ttl: seconds an entry stays valid, None to keep entries until evicted
+        """
+        if max_size < 1:
+            raise Exception("Cache max size must be at least 1")
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self.__entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.__entries[key]
+
+            self.misses += 1
+
+        return default
+
+    def set(self, key: Hashable, value: Any):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.__lock:
+            self.__entries[key] = (value, expires_at)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable):
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__entries)
+
+    def __contains__(self, key: Hashable):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            return entry is not None and (entry[1] is None or entry[1] > time.monotonic())
+
+    def stats(self) -> Dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self)}
@@ -0,0 +1,87 @@
+import json
+import os
+
+from typing import Dict, List, Optional
+
+DEFAULT_JOB_CONFIGS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                        "job_configs.json")
+
+
+class JobRegistry:
+    def __init__(self):
+        self.__job_types: Dict[str, Dict] = {}
+        self.__price_collections: Dict[str, str] = {}
+
+    def register(self, job_type: str, collection_name: str, assets: List[str],
+                 refresh_interval: Optional[float] = None, is_test: bool = False):
+        if job_type in self.__job_types:
+            raise Exception(f"Job type {job_type} already registered")
+        if not assets:
+            raise Exception(f"Job type {job_type} has no assets")
+
+        self.__job_types[job_type] = {
+            "job_type": job_type,
+            "collection_name": collection_name,
+            "assets": list(assets),
+            "refresh_interval": refresh_interval,
+            "is_test": is_test,
+        }
+
+    def register_price_feed(self, asset: str, collection_name: str):
+        self.__price_collections[asset] = collection_name
+
+    def get_job_types(self) -> List[str]:
+        return list(self.__job_types)
+
+    def get_job_configs(self) -> List[Dict]:
+        """
+        Job configs in the shape EventUpdaterJobs consumes
+        :return: [{'job_type', 'is_test', 'refresh_interval', 'params': {asset: {'collection_name'}}}]
+        """
+        job_configs = []
+        for job_type in self.__job_types.values():
+            job_configs.append({
+                "job_type": job_type["job_type"],
+                "is_test": job_type["is_test"],
+                "refresh_interval": job_type["refresh_interval"],
+                "params": {asset: {"collection_name": job_type["collection_name"]} for asset in job_type["assets"]},
+            })
+
+        return job_configs
+
+    def get_collections(self) -> List[str]:
+        return list({job_type["collection_name"] for job_type in self.__job_types.values()})
+
+    def get_price_collections(self) -> Dict[str, str]:
+        """
+        Live price collection per asset
+        :return: {asset: collection_name}
+        """
+        return dict(self.__price_collections)
+
+    @classmethod
+    def from_dict(cls, registry_config: Dict) -> "JobRegistry":
+        registry = cls()
+        for job_type in registry_config["jobs"]:
+            registry.register(job_type=job_type["job_type"],
+                              collection_name=job_type["collection_name"],
+                              assets=job_type["assets"],
+                              refresh_interval=job_type.get("refresh_interval"),
+                              is_test=job_type.get("is_test", False))
+        for asset, collection_name in registry_config.get("price_feeds", {}).items():
+            registry.register_price_feed(asset=asset, collection_name=collection_name)
+        return registry
+
+
+def load_job_registry(config: Dict) -> JobRegistry:
+    """
+    Load job types from the JOB_CONFIGS env value (inline JSON), else from the JOB_CONFIGS_PATH file,
+    else from job_configs.json at the repo root
+    :param config: env values
+    :return: JobRegistry
+    """
+    if config.get("JOB_CONFIGS"):
+        return JobRegistry.from_dict(json.loads(config["JOB_CONFIGS"]))
+
+    with open(config.get("JOB_CONFIGS_PATH") or DEFAULT_JOB_CONFIGS_PATH) as job_configs_file:
+        return JobRegistry.from_dict(json.load(job_configs_file))
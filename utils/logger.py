@@ -0,0 +1,48 @@
+import json
+import logging
+import os
+import sys
+
+LOG_LEVEL_ENV = "LOG_LEVEL"
+# LogRecord attributes that are not user fields
+RESERVED_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "process": record.processName,
+            "msg": record.getMessage(),
+        }
+        # Fields passed as extra={...} become top level keys
+        for key, value in vars(record).items():
+            if key not in RESERVED_RECORD_FIELDS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+
+def _configure_root_logger():
+    root_logger = logging.getLogger()
+    if any(isinstance(handler.formatter, JsonFormatter) for handler in root_logger.handlers):
+        return
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter())
+    root_logger.addHandler(handler)
+    root_logger.setLevel(os.environ.get(LOG_LEVEL_ENV, "INFO").upper())
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Logger writing one JSON object per line to stdout, level from the LOG_LEVEL env variable
+    :param name: usually __name__
+    :return: logging.Logger
+    """
+    _configure_root_logger()
+    return logging.getLogger(name)
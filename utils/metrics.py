@@ -0,0 +1,212 @@
+import bisect
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Sequence, Tuple
+
+# seconds, from a cached read to a settlement txn waiting several blocks
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+# seconds an event waited past event_close before settling
+LAG_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(label_names: Sequence[str], label_values: Tuple, extra: str = "") -> str:
+    labels = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class Metric(ABC):
+    metric_type = "untyped"
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, object] = {}
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    @abstractmethod
+    def _render_samples(self) -> List[str]:
+        pass
+
+    def render(self) -> List[str]:
+        with self._lock:
+            samples = self._render_samples()
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.metric_type}"] + samples
+
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    metric_type = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _render_samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}" for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        bucket_index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            # [per-bucket counts (+Inf last), sum, count]
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bucket_index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def counts(self) -> Dict[Tuple, int]:
+        """
+        Observations per label set, in label_names order
+        :return: {label values: count}
+        """
+        with self._lock:
+            return {key: series[2] for key, series in self._values.items()}
+
+    @contextmanager
+    def time(self, **labels):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def _render_samples(self) -> List[str]:
+        samples = []
+        for key, (bucket_counts, total, count) in self._values.items():
+            cumulative = 0
+            for upper_bound, bucket_count in zip(list(self.buckets) + ["+Inf"], bucket_counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(self.label_names, key, f'le="{upper_bound}"')
+                samples.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            samples.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {total}")
+            samples.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.__metrics: Dict[str, Metric] = {}
+        self.__lock = threading.Lock()
+
+    def __register(self, metric_class, name, description, label_names, **kwargs):
+        with self.__lock:
+            metric = self.__metrics.get(name)
+            if metric is None:
+                metric = self.__metrics[name] = metric_class(name, description, label_names, **kwargs)
+            elif not isinstance(metric, metric_class) or metric.label_names != tuple(label_names):
+                raise Exception(f"Metric {name} already registered with a different type or labels")
+        return metric
+
+    def counter(self, name: str, description: str, label_names: Sequence[str] = ()) -> Counter:
+        return self.__register(Counter, name, description, label_names)
+
+    def gauge(self, name: str, description: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self.__register(Gauge, name, description, label_names)
+
+    def histogram(self, name: str, description: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.__register(Histogram, name, description, label_names, buckets=buckets)
+
+    def render(self) -> str:
+        with self.__lock:
+            metrics = list(self.__metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+# Process-wide registry, each worker process serves its own
+REGISTRY = MetricsRegistry()
+
+RPC_REQUEST_SECONDS = REGISTRY.histogram("rpc_request_seconds", "JSON-RPC request latency",
+                                         ["method", "function"])
+RPC_ERRORS = REGISTRY.counter("rpc_errors_total", "JSON-RPC requests that raised or returned an error",
+                              ["method", "function"])
+MULTICALL_CALLS = REGISTRY.counter("multicall_calls_total", "Contract view calls batched into Multicall3 aggregate3",
+                                   ["function", "outcome"])
+RECEIPT_WAIT_SECONDS = REGISTRY.histogram("receipt_wait_seconds", "Time from txn send to receipt or timeout",
+                                          ["outcome"])
+MONGO_COMMAND_SECONDS = REGISTRY.histogram("mongo_command_seconds", "Mongo command latency",
+                                           ["command", "collection"])
+MONGO_COMMAND_ERRORS = REGISTRY.counter("mongo_command_errors_total", "Mongo commands that failed",
+                                        ["command", "collection"])
+PHASE_SECONDS = REGISTRY.histogram("updater_phase_seconds", "Duration of one updater phase run",
+                                   ["phase", "job"])
+PHASE_FAILURES = REGISTRY.counter("updater_phase_failures_total", "Updater phase runs that raised",
+                                  ["phase", "job"])
+BACKLOG_EVENTS = REGISTRY.gauge("updater_backlog_events", "Events past event_close waiting to be settled",
+                                ["job", "asset"])
+SETTLEMENT_LAG_SECONDS = REGISTRY.histogram("updater_settlement_lag_seconds",
+                                            "Seconds between event_close and the event being settled",
+                                            ["job", "asset"], buckets=LAG_BUCKETS)
+SCHEDULED_DEADLINES = REGISTRY.gauge("updater_scheduled_deadlines", "Deadlines queued in the updater scheduler")
+ROLLUP_MISMATCHES = REGISTRY.gauge("updater_rollup_mismatches",
+                                   "Rollup counters that differ from a rebuild at the last periodic check")
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0",
+                         registry: MetricsRegistry = REGISTRY) -> ThreadingHTTPServer:
+    """
+    Serve the registry in the Prometheus text format on /metrics, from a daemon thread
+    :param port:
+    :param host:
+    :param registry:
+    :return: the running server
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            payload = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+
+    return server
@@ -0,0 +1,78 @@
+import heapq
+import itertools
+import threading
+
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+class DeadlineScheduler:
+    def __init__(self):
+        """
+        Priority queue of keyed deadlines. Pushing an existing key moves it to the new deadline
+        """
+        self.__heap = []
+        # key -> (deadline, sequence) of the live heap entry, older entries for the key are skipped
+        self.__entries: Dict[Hashable, Tuple[float, int]] = {}
+        self.__sequence = itertools.count()
+        self.__lock = threading.Lock()
+        self.__wakeup = threading.Event()
+
+    def push(self, key: Hashable, deadline: float, payload: Any = None):
+        with self.__lock:
+            sequence = next(self.__sequence)
+            self.__entries[key] = (deadline, sequence)
+            heapq.heappush(self.__heap, (deadline, sequence, key, payload))
+
+            is_earliest = self.__heap[0][1] == sequence
+        if is_earliest:
+            self.__wakeup.set()
+
+    def remove(self, key: Hashable):
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def __contains__(self, key: Hashable):
+        with self.__lock:
+            return key in self.__entries
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__entries)
+
+    def __discard_stale(self):
+        while self.__heap:
+            deadline, sequence, key, _ = self.__heap[0]
+            if self.__entries.get(key) == (deadline, sequence):
+                return
+            heapq.heappop(self.__heap)
+
+    def next_deadline(self) -> Optional[float]:
+        with self.__lock:
+            self.__discard_stale()
+            return self.__heap[0][0] if self.__heap else None
+
+    def pop_due(self, now: float) -> List[Tuple[Hashable, Any]]:
+        """
+        Remove and return every entry whose deadline has passed, earliest first
+        :param now: timestamp to compare deadlines against
+        :return: list of (key, payload)
+        """
+        due = []
+        with self.__lock:
+            self.__discard_stale()
+            while self.__heap and self.__heap[0][0] <= now:
+                _, _, key, payload = heapq.heappop(self.__heap)
+                del self.__entries[key]
+                due.append((key, payload))
+                self.__discard_stale()
+
+        return due
+
+    def wait(self, timeout: float):
+        """
+        Sleep up to timeout seconds, returning early if a push lands at the front of the queue
+        :param timeout:
+        :return:
+        """
+        self.__wakeup.wait(timeout=max(timeout, 0))
+        self.__wakeup.clear()